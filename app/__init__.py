@@ -4,4 +4,8 @@ from flask import Flask, render_template
 # Define the WSGI application object
 app = Flask(__name__)
 
+# Negotiate compressed requests and responses with peers
+from app import wire
+wire.init_app(app)
+
 from app import views
\ No newline at end of file
@@ -0,0 +1,72 @@
+import json
+import queue
+
+from threading import Lock
+
+from app import logs
+
+logger = logs.get_logger("events")
+
+# Events waiting to be sent to each client, slower clients are disconnected
+MAX_PENDING = 100
+# Seconds between keep-alive comments, so proxies do not close idle streams
+KEEPALIVE_SECONDS = 15
+
+class EventBroker():
+    """
+    Publishes events to the clients connected to the Server-Sent Events stream.
+    Every client has its own queue, filled by "publish" and emptied by its "stream".
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.clients = []
+
+    def subscribe(self):
+        """
+        Return queue that receives the events published from now on
+        """
+        client = queue.Queue(maxsize=MAX_PENDING)
+        with self.lock:
+            self.clients.append(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def publish(self, event, data):
+        """
+        Send event to all the clients, dropping the ones that are not reading
+        """
+        message = "event: {}\ndata: {}\n\n".format(event, json.dumps(data))
+        for client in list(self.clients):
+            try:
+                client.put_nowait(message)
+            except queue.Full:
+                logger.info("Event stream client is not reading, disconnecting it")
+                self.unsubscribe(client)
+                # Make room to wake up the stream with None, so it ends
+                try:
+                    client.get_nowait()
+                except queue.Empty:
+                    pass
+                client.put_nowait(None)
+
+    def stream(self, client):
+        """
+        Generator of the messages sent to the client, in Server-Sent Events format
+        """
+        try:
+            # Sent right away so the server sends the headers and the client knows it is connected
+            yield ": connected\n\n"
+            while True:
+                try:
+                    message = client.get(timeout=KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    message = ": keep-alive\n\n"
+                if message is None:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(client)
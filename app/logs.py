@@ -0,0 +1,75 @@
+import sys
+import queue
+import logging
+import logging.handlers
+
+# Every component logs to a child of this logger, "blockchain_logger.<component>",
+# so the level can be set for all of them at once or for each component
+ROOT = "blockchain_logger"
+FORMAT = "%(asctime)-15s %(message)s"
+
+# Log configuration used until "configure" is called (scripts and tests)
+logging.basicConfig(format = FORMAT, stream=sys.stdout)
+logging.getLogger(ROOT).setLevel(logging.INFO)
+
+# Writes the queued records to stdout in its own thread, see "configure"
+listener = None
+
+def get_logger(component):
+    """
+    Return logger of the component
+    """
+    return logging.getLogger(ROOT + "." + component)
+
+def parse_levels(value):
+    """
+    Parse per component levels in the format "peertopeer=DEBUG,blockchain=WARNING"
+    """
+    levels = {}
+    for item in value.split(","):
+        if "=" in item:
+            component, level = item.split("=", 1)
+            levels[component.strip()] = level.strip().upper()
+    return levels
+
+def configure(level="INFO", component_levels=None, queued=True):
+    """
+    Set the log level of all the components and, optionally, of each one.
+    When "queued", records are put in a queue and written by a background thread,
+    so the threads validating blocks never wait for the output.
+    """
+    global listener
+    root = logging.getLogger(ROOT)
+    root.setLevel(level.upper())
+    for component, component_level in (component_levels or {}).items():
+        get_logger(component).setLevel(component_level)
+    if queued and listener is None:
+        records = queue.Queue()
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(logging.Formatter(FORMAT))
+        listener = logging.handlers.QueueListener(records, output)
+        listener.start()
+        root.addHandler(logging.handlers.QueueHandler(records))
+        # Do not write the records again through the handler of "basicConfig"
+        root.propagate = False
+
+class BlockSummary():
+    """
+    Short description of a block to log instead of the whole block.
+    Passed as logging argument, it is only formatted if the record is written.
+    """
+    def __init__(self, block):
+        self.block = block
+
+    def __str__(self):
+        return "#{} {} ({} transactions)".format(self.block["height"], self.block["hash"][0:12], len(self.block["data"]))
+
+class TransactionSummary():
+    """
+    Short description of a transaction to log instead of the whole transaction
+    """
+    def __init__(self, transaction):
+        self.transaction = transaction
+
+    def __str__(self):
+        return "{} -> {}".format(self.transaction["addr_from"], self.transaction["addr_to"])
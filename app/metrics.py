@@ -0,0 +1,231 @@
+import abc
+import time
+import bisect
+import functools
+
+from threading import Lock
+
+from app import tracing
+
+# Default histogram buckets, in seconds
+BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# All the metrics created, in the order they are rendered
+REGISTRY = []
+
+class Metric(abc.ABC):
+    """
+    Base of the metrics exposed in Prometheus text format.
+    Metrics with labels keep one value per combination of label values, see "labels".
+    Subclasses create the value of each combination and render it.
+    """
+    kind = "untyped"
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.lock = Lock()
+        self.children = {}
+        REGISTRY.append(self)
+
+    def labels(self, *values):
+        """
+        Return the metric for the label values, creating it if needed
+        """
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    @abc.abstractmethod
+    def new_child(self):
+        """
+        Return a new value for a combination of label values
+        """
+
+    @abc.abstractmethod
+    def render_child(self, values, child):
+        """
+        Return the lines of the value for the label values
+        """
+
+    def format_labels(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra is not None:
+            pairs.append(extra)
+        if len(pairs) == 0:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in pairs) + "}"
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.description), "# TYPE {} {}".format(self.name, self.kind)]
+        for values, child in list(self.children.items()):
+            lines.extend(self.render_child(values, child))
+        return lines
+
+class Value():
+    """
+    Single number, changed under a lock
+    """
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self.lock = Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """
+        Compute the value with "function" when the metrics are rendered
+        """
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_child(self):
+        return Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def render_child(self, values, child):
+        return ["{}{} {}".format(self.name, self.format_labels(values), child.get())]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self.labels().set_function(function)
+
+class HistogramValue():
+    """
+    Observation counts per bucket, sum and count of a histogram
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, description, labelnames=(), buckets=BUCKETS):
+        self.buckets = list(buckets)
+        Metric.__init__(self, name, description, labelnames)
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def render_child(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ["+Inf"], counts):
+            cumulative += count
+            lines.append("{}_bucket{} {}".format(self.name, self.format_labels(values, ("le", bound)), cumulative))
+        lines.append("{}_sum{} {}".format(self.name, self.format_labels(values), total))
+        lines.append("{}_count{} {}".format(self.name, self.format_labels(values), cumulative))
+        return lines
+
+class TimedLock():
+    """
+    Lock that records in a histogram how long each acquisition waited,
+    and in the current trace as a span called "wait <name>"
+    """
+    def __init__(self, histogram, name):
+        self.lock = Lock()
+        self.histogram = histogram
+        self.span_name = "wait " + name
+
+    def acquire(self, blocking=True, timeout=-1):
+        start = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        end = time.perf_counter()
+        self.histogram.observe(end - start)
+        tracing.add_span(self.span_name, start, end)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+def timed(histogram):
+    """
+    Decorator that records in the histogram how long each call to the function takes
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def render():
+    """
+    Return all the metrics in Prometheus text format
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# Mining
+MINING_HASHES = Counter("blockchain_mining_hashes_total", "Hashes computed while mining blocks")
+MINING_SECONDS = Histogram("blockchain_mining_seconds", "Time to mine a block", buckets=[0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60])
+MINING_HASH_RATE = Gauge("blockchain_mining_hash_rate", "Hashes per second when mining the last block")
+
+# Validation
+VALIDATE_BLOCK_SECONDS = Histogram("blockchain_validate_block_seconds", "Time to validate a block")
+VALIDATE_TRANSACTION_SECONDS = Histogram("blockchain_validate_transaction_seconds", "Time to validate a transaction signature")
+LOCK_WAIT_SECONDS = Histogram("blockchain_lock_wait_seconds", "Time waiting to acquire the blockchain locks", ["lock"])
+
+# Chain and pool
+CHAIN_HEIGHT = Gauge("blockchain_chain_height", "Height of the last block in the chain")
+POOL_SIZE = Gauge("blockchain_pool_size", "Transactions waiting in the pool")
+POOL_AGE_SECONDS = Gauge("blockchain_pool_oldest_seconds", "Age of the oldest transaction in the pool")
+BLOCKS_TRIGGERED = Counter("blockchain_blocks_triggered_total", "Blocks created by this node by trigger: threshold, max_wait or continuous", ["reason"])
+BLOCK_TRANSACTIONS = Histogram("blockchain_block_transactions", "Transactions in the blocks created by this node",
+                               buckets=[1, 2, 5, 10, 25, 50, 100, 250, 500, 1000])
+POOL_TIME_SECONDS = Histogram("blockchain_pool_time_seconds", "Time transactions waited in the pool before being added to the chain")
+
+# Peers
+PEER_REQUEST_SECONDS = Histogram("blockchain_peer_request_seconds", "Latency of the requests to each peer", ["peer"])
+PEER_ERRORS = Counter("blockchain_peer_errors_total", "Failed requests to each peer", ["peer"])
@@ -0,0 +1,45 @@
+from threading import Lock, Timer
+
+class Batcher():
+    """
+    Buffer items and hand them over in batches, either "window" seconds after the first
+    buffered item or as soon as "max_size" items are buffered.
+    Items are grouped by key, "flush" is called once per key with the list of its items.
+    """
+    def __init__(self, flush, window=0.05, max_size=100):
+        self.flush = flush
+        self.window = window
+        self.max_size = max_size
+        self.lock = Lock()
+        self.batches = {}
+        self.size = 0
+        self.timer = None
+
+    def add(self, key, item):
+        """
+        Buffer item, flushing the batches if the size threshold was reached
+        """
+        with self.lock:
+            self.batches.setdefault(key, []).append(item)
+            self.size += 1
+            full = self.size >= self.max_size
+            if not full and self.timer is None:
+                self.timer = Timer(self.window, self.flush_all)
+                self.timer.daemon = True
+                self.timer.start()
+        if full:
+            self.flush_all()
+
+    def flush_all(self):
+        """
+        Hand over all the buffered batches
+        """
+        with self.lock:
+            batches = self.batches
+            self.batches = {}
+            self.size = 0
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        for key, items in batches.items():
+            self.flush(key, items)
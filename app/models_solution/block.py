@@ -1,15 +1,16 @@
-import sys
-import logging
-import json
+import time
 from datetime import datetime
 
 from collections import OrderedDict
+from json.encoder import encode_basestring_ascii
 from Crypto.Hash import SHA256
 
+from app import logs
+from app import metrics
+from app.models_solution.transaction import short_transaction_id, TRANSACTION_FIELDS
+
 # Log configuration
-logging.basicConfig(format = "%(asctime)-15s %(message)s", stream=sys.stdout)
-logger = logging.getLogger("blockchain_logger")
-logger.setLevel(logging.DEBUG)
+logger = logs.get_logger("block")
 
 class Block():
     def __init__(self, prevHash, height, data, miner):
@@ -23,22 +24,132 @@ class Block():
 
     def mine(self):
         """
-        Calculate valid hash from current transaction list
+        Calculate valid hash from current transaction list.
+        The hashed bytes are the ones validators hash, see "block_preimage".
         """
         logger.info("Mining node")
+        start = time.perf_counter()
+        # Only the nonce changes between tries
+        head, tail = preimage_parts(self.block)
         while True:
             # Get hash from complete block, discarding own hash
             sha256 = SHA256.new()
-            sha256.update(json.dumps(self.block).encode())
+            sha256.update(head + str(self.block["nonce"]).encode() + tail)
             hexdigest = sha256.hexdigest()
             if hexdigest[0:3] == "000":
                 self.block["hash"] = hexdigest
                 self.block["timestamp"] = str(datetime.now().timestamp())
                 break
             self.block["nonce"] = self.block["nonce"] + 1
+        # Metrics are updated once per block to keep the loop untouched
+        elapsed = time.perf_counter() - start
+        metrics.MINING_HASHES.inc(self.block["nonce"] + 1)
+        metrics.MINING_SECONDS.observe(elapsed)
+        if elapsed > 0:
+            metrics.MINING_HASH_RATE.set((self.block["nonce"] + 1) / elapsed)
 
     def get_json(self):
         """
         Return block as OrderedDict
         """
-        return self.block
\ No newline at end of file
+        return self.block
+
+# Block fields sent in compact blocks, everything but the transactions
+HEADER_FIELDS = ["miner", "hash", "prevHash", "height", "nonce", "timestamp"]
+
+def get_compact_block(block):
+    """
+    Return compact version of a block (in JSON format): the header and the short ids of its transactions
+    """
+    compact = OrderedDict((field, block[field]) for field in HEADER_FIELDS)
+    compact["short_ids"] = [short_transaction_id(t) for t in block["data"]]
+    return compact
+
+def check_compact_block(compact):
+    """
+    Return True if the compact block (in JSON format) has the header fields and a list of short ids
+    """
+    if not isinstance(compact, dict) or not all(field in compact for field in HEADER_FIELDS):
+        return False
+    short_ids = compact.get("short_ids")
+    return (isinstance(compact["hash"], str) and isinstance(short_ids, list)
+            and all(isinstance(short_id, str) for short_id in short_ids))
+
+def get_pruned_block(block):
+    """
+    Return the header of a block (in JSON format), without transactions, marked as "pruned"
+    """
+    pruned = OrderedDict((field, block[field]) for field in HEADER_FIELDS)
+    pruned["data"] = []
+    pruned["pruned"] = True
+    return pruned
+
+def rebuild_block(compact, transactions):
+    """
+    Rebuild block from its compact version and the list of transactions, in order
+    """
+    block = OrderedDict((field, compact[field]) for field in HEADER_FIELDS)
+    block["data"] = list(transactions)
+    return block
+
+def check_block_format(block):
+    """
+    Return True if the block (in JSON format) has the fields and types of a block and a hash with PoW.
+    Cheap checks, done before hashing the block, so junk is rejected early.
+    """
+    if not isinstance(block, dict):
+        return False
+    for field in ["miner", "hash", "prevHash", "timestamp"]:
+        if not isinstance(block.get(field), str):
+            return False
+    for field in ["height", "nonce"]:
+        # bool is a subclass of int but would not be serialized as a number
+        if type(block.get(field)) is not int:
+            return False
+    if len(block["hash"]) != 64 or block["hash"][0:3] != "000":
+        return False
+    if not isinstance(block.get("data"), list):
+        return False
+    for transaction in block["data"]:
+        if not isinstance(transaction, dict):
+            return False
+        for field in TRANSACTION_FIELDS:
+            if not isinstance(transaction.get(field), str):
+                return False
+    return True
+
+def preimage_parts(block):
+    """
+    Return the bytes of the pre-image of the block before and after the nonce, see "block_preimage"
+    """
+    head = ['{"miner": ', encode_basestring_ascii(block["miner"]),
+            ', "hash": "", "prevHash": ', encode_basestring_ascii(block["prevHash"]),
+            ', "height": ', str(block["height"]), ', "nonce": ']
+    tail = [', "data": [']
+    for i, transaction in enumerate(block["data"]):
+        if i > 0:
+            tail.append(", ")
+        tail.append("{")
+        tail.append(", ".join('"{}": {}'.format(field, encode_basestring_ascii(transaction[field]))
+                              for field in TRANSACTION_FIELDS))
+        tail.append("}")
+    tail.append("]}")
+    return "".join(head).encode(), "".join(tail).encode()
+
+def block_preimage(block):
+    """
+    Return the bytes hashed when the block was mined: "json.dumps" of the Block before setting its hash
+    and timestamp, with only the fields of a transaction, written directly from the fields of the
+    received block, without building a new Block. Other fields of the transactions are not hashed.
+    The block must pass "check_block_format".
+    """
+    head, tail = preimage_parts(block)
+    return head + str(block["nonce"]).encode() + tail
+
+def get_block_hash(block):
+    """
+    Return the hash the block must have, from its pre-image
+    """
+    sha256 = SHA256.new()
+    sha256.update(block_preimage(block))
+    return sha256.hexdigest()
@@ -1,28 +1,73 @@
-import sys
-import logging
-import json
+import time
 
-from threading import Lock
-from collections import OrderedDict
 from Crypto.Hash import SHA256
 from Crypto.Signature import PKCS1_v1_5
 from Crypto.PublicKey import RSA
 from base64 import b64encode, b64decode
 
-from app.models_solution.block import Block
-from app.models_solution.transaction import Transaction
+from app import logs
+from app import metrics
+from app import tracing
+from app.models_solution.block import Block, get_pruned_block, check_block_format, get_block_hash
+from app.models_solution.transaction import Transaction, transaction_hash
+from app.models_solution.voteindex import VoteIndex
+from app.models_solution.chaincache import ChainCache
 
 # Log configuration
-logging.basicConfig(format = "%(asctime)-15s %(message)s", stream=sys.stdout)
-logger = logging.getLogger("blockchain_logger")
-logger.setLevel(logging.DEBUG)
+logger = logs.get_logger("blockchain")
+
+def is_preferred_head(block, head):
+    """
+    Return True if "block" replaces "head", a block of the same height, as the head of the chain:
+    the earliest timestamp wins, and the lowest miner id if the timestamps are the same
+    """
+    if head["timestamp"] == block["timestamp"]:
+        return head["miner"] > block["miner"]
+    return head["timestamp"] > block["timestamp"]
 
 class Blockchain():
-    def __init__(self):
-        self.lock = Lock()
-        self.t_lock = Lock()
+    def __init__(self, prune_depth=None):
+        """
+        With "prune_depth" set, only the last "prune_depth" blocks keep their transactions,
+        older blocks are replaced by their headers. Votes stay in the vote index.
+        """
+        # "lock" serializes commits to the chain and "t_lock" commits to the pool.
+        # Both "storage" and "transaction_pool" are copy-on-write: they are replaced by
+        # new lists on every change and never modified in place, so readers can keep
+        # using the reference they got as a consistent snapshot without locking.
+        self.lock = metrics.TimedLock(metrics.LOCK_WAIT_SECONDS.labels("lock"), "lock")
+        self.t_lock = metrics.TimedLock(metrics.LOCK_WAIT_SECONDS.labels("t_lock"), "t_lock")
         self.storage = []
         self.transaction_pool = []
+        # Time each transaction in the pool arrived, by signature
+        self.pool_arrival = {}
+        # Transactions of the pool by hash, copy-on-write and replaced with "transaction_pool"
+        self.pool_index = {}
+        # Functions called with the event name and data after changes, see "notify"
+        self.listeners = []
+        # Votes by candidate and by voter, updated with "storage" under "lock"
+        self.votes = VoteIndex()
+        # Serialized blocks of "storage", updated with it under "lock"
+        self.serialized = ChainCache()
+        # Pruning keeps at least the head and the block before, needed to replace the head
+        self.prune_depth = max(2, prune_depth) if prune_depth else None
+        # Blocks below this height are pruned
+        self.pruned_height = 0
+
+    def add_listener(self, listener):
+        """
+        Register function to be called as listener(event, data) after changes to the chain:
+          * "block": a block was added to the chain, replacing the head or not
+          * "transaction": a transaction was added to the pool
+        """
+        self.listeners.append(listener)
+
+    def notify(self, event, data):
+        """
+        Call listeners for the event
+        """
+        for listener in self.listeners:
+            listener(event, data)
 
     def empty(self):
         """
@@ -34,29 +79,68 @@ class Blockchain():
         """
         Start new chain (block list) from current result
         """
-        self.storage = list(json_list)
+        with self.lock:
+            chain = list(json_list)
+            self.votes.update(chain)
+            self.pruned_height = 0
+            self.prune(chain)
+            self.serialized.update(chain)
+            self.storage = chain
     
-    def create_genesis_block(self, private_key, miner_id):
+    def create_genesis_block(self, private_key, miner_id, prev_hash="Genesis Block"):
         """
         Create the first block of the chain, using specific values as transactions and previous hash.
+        A different "prev_hash" gives a different genesis block, so every chain can have its own.
         """
         logger.info("Creating genesis block")
         transaction = Transaction("Genesis Addr", "Genesis Block")
-        genesis = Block("Genesis Block", 0, [transaction.get_signed_json(private_key)], miner_id)
+        genesis = Block(prev_hash, 0, [transaction.get_signed_json(private_key)], miner_id)
         genesis.mine()
-        self.storage = [genesis.get_json()]
+        with self.lock:
+            chain = [genesis.get_json()]
+            self.votes.update(chain)
+            self.serialized.update(chain)
+            self.storage = chain
+
+    def prune(self, chain):
+        """
+        Replace the blocks of "chain" older than "prune_depth" by their headers. The chain must be
+        a new list, not published yet, and indexed in "votes"
+        """
+        if self.prune_depth is None:
+            return
+        while self.pruned_height < len(chain) - self.prune_depth:
+            block = chain[self.pruned_height]
+            if not block.get("pruned", False):
+                self.votes.prune_block(block)
+                chain[self.pruned_height] = get_pruned_block(block)
+            self.pruned_height += 1
 
-    def check_double_spending(self, miner_id):
+    def check_double_spending(self, miner_id, chain=None):
         """
         Check the chain to find if miner has already voted.
+        When "chain" is given, check that snapshot instead of the current chain.
+        The vote index answers for the current chain and its prefixes, other chains are scanned.
         """
-        for block in self.storage:
-            logger.info("Block {}".format(block))
+        if chain is None:
+            chain = self.storage
+        votes = self.votes
+        if votes.covers(chain):
+            # Each voter is in the index once, with the height of its vote
+            vote = votes.get_vote(miner_id)
+            if vote is not None and vote["height"] < len(chain):
+                logger.info("User %s has already issued his vote in block #%s", miner_id, vote["height"])
+                return True
+            return False
+        # Pruned blocks are the same in every chain, their votes are only in the index
+        vote = votes.get_vote(miner_id)
+        if vote is not None and vote["height"] < len(chain) and chain[vote["height"]].get("pruned", False):
+            return True
+        for block in chain:
             transactions = block["data"]
             for transaction in transactions:
-                logger.info("Checking transaction {}".format(transaction))
                 if transaction["addr_from"] == miner_id:
-                    logger.error("User has already issued his vote")
+                    logger.info("User %s has already issued his vote in block #%s", miner_id, block["height"])
                     return True
         return False
 
@@ -66,76 +150,131 @@ class Blockchain():
         """
         for transaction in self.transaction_pool:
             if transaction["addr_from"] == miner_id:
-                logger.error("User has vote on transaction pool")
+                logger.info("User %s has vote on transaction pool", miner_id)
                 return True
         return False
 
+    def get_block(self, block_hash):
+        """
+        Return block with the given hash from the chain, None if it is not there or it was pruned
+        """
+        # Blocks asked by peers are usually the most recent ones
+        for block in reversed(self.storage):
+            if block["hash"] == block_hash:
+                return block if not block.get("pruned", False) else None
+        return None
+
+    def get_transaction_from_pool(self, t_hash):
+        """
+        Return transaction with the given hash from the pool, None if it is not there
+        """
+        return self.pool_index.get(t_hash)
+
     def remove_transactions_from_pool(self, block):
         """
         After receiveing a new block, check if the transactions were in the pool and remove them
         """
-        logger.info("Current pool {}".format(self.transaction_pool))
-        for transaction in block["data"]:
-            if transaction in self.transaction_pool:
-                self.transaction_pool.remove(transaction)
-        logger.info("New pool {}".format(self.transaction_pool))
+        self.update_pool(block["data"], [])
         return
 
-    def validate_block(self, block, prevBlock):
+    def update_pool(self, removed, recovered):
+        """
+        Replace the transaction pool with a new list without the "removed" transactions
+        and with the "recovered" ones that are not there yet
+        """
+        with self.t_lock:
+            now = time.time()
+            pool = []
+            index = dict(self.pool_index)
+            for transaction in self.transaction_pool:
+                if transaction not in removed:
+                    pool.append(transaction)
+                else:
+                    index.pop(transaction_hash(transaction), None)
+                    if transaction["signature"] in self.pool_arrival:
+                        metrics.POOL_TIME_SECONDS.observe(now - self.pool_arrival.pop(transaction["signature"]))
+            for transaction in recovered:
+                if transaction not in pool:
+                    pool.append(transaction)
+                    index[transaction_hash(transaction)] = transaction
+                    self.pool_arrival.setdefault(transaction["signature"], now)
+            logger.debug("Pool had %d transactions, now %d", len(self.transaction_pool), len(pool))
+            self.transaction_pool = pool
+            self.pool_index = index
+
+    @metrics.timed(metrics.VALIDATE_BLOCK_SECONDS)
+    def validate_block(self, block, prevBlock, chain=None):
         """
         Validate block data and if it should be the next on the chain.
+        Double spending is checked against "chain" (defaults to the current chain).
         """
-        logger.info("Validate block")
-        if prevBlock is not None:
-            # Validate consistence with blockchain
-            if block["prevHash"] == prevBlock["hash"]:
-                logger.info("Block is consistent with blockchain")
-                # Validate PoW
-                if block["hash"][0:3] == "000":
-                    logger.info("Block has PoW")
-                    # Validate the block hash is from itself, create same block structure
-                    transactions = []
-                    for t in block["data"]:
-                        new_t = OrderedDict({"addr_from": t["addr_from"]})
-                        new_t["addr_to"] = t["addr_to"]
-                        new_t["signature"] = t["signature"]
-                        new_t["pubkey"] = t["pubkey"]
-                        transactions.append(new_t)
-                        
-                    striped_block = Block(block["prevHash"], block["height"], transactions, block["miner"])
-                    striped_block.block["nonce"] = block["nonce"]
-                    striped_block.block["hash"] = ""
-                    logger.info("Striped {}".format(striped_block.get_json()))
-                    sha256 = SHA256.new()
-                    sha256.update(json.dumps(striped_block.get_json()).encode())
-                    hexdigest = sha256.hexdigest()
-                    if hexdigest == block["hash"]:
-                        logger.info("Block generates the hash provided")
-                        for transaction in block["data"]:
-                            if not self.validate_transaction(transaction) or self.check_double_spending(transaction["addr_from"]):
-                                return False
-                        logger.info("Block has all transactions valid")
-                        logger.info("Accept block")
-                        return True
-                    else:
-                        logger.info("Invalid block hash")
-        return False
+        # Cheap checks first, junk is rejected before hashing anything
+        if prevBlock is None or not check_block_format(block):
+            logger.info("Invalid block format")
+            return False
+        logger.debug("Validate block %s", logs.BlockSummary(block))
+        # Validate consistence with blockchain
+        if block["prevHash"] != prevBlock["hash"]:
+            return False
+        logger.debug("Block is consistent with blockchain")
+        # Validate the block hash is from itself, hashing the same bytes the miner hashed
+        with tracing.span("hash"):
+            hexdigest = get_block_hash(block)
+        if hexdigest != block["hash"]:
+            logger.info("Invalid block hash")
+            return False
+        logger.debug("Block generates the hash provided")
+        with tracing.span("verify_signatures"):
+            for transaction in block["data"]:
+                if not self.validate_transaction(transaction):
+                    return False
+        with tracing.span("double_spend_scan"):
+            voters = set()
+            for transaction in block["data"]:
+                if transaction["addr_from"] in voters or self.check_double_spending(transaction["addr_from"], chain):
+                    return False
+                voters.add(transaction["addr_from"])
+        logger.debug("Block has all transactions valid")
+        return True
 
     def create_and_add_block(self, miner_id):
         """
         Using miner_id and current transaction_pool, create block and add to chain.
+        Return the block, None if it was not added. When it is not valid, the votes that made it
+        invalid are removed from the pool, see "remove_invalid_transactions".
         """
-        block = None
-        if not self.empty():
-            # Get last block
-            prevBlock = self.storage[-1]
-            # Use it to create new block with the current transactions in pool
-            block = Block(prevBlock["hash"], prevBlock["height"] + 1, self.transaction_pool, miner_id)
-            block.mine()
-            logger.info("Block created: {}".format(block.get_json()))
-            self.validate_and_add_block(block.get_json())
+        if self.empty():
+            return None
+        # Get last block
+        prevBlock = self.storage[-1]
+        # Use it to create new block with the current transactions in pool
+        block = Block(prevBlock["hash"], prevBlock["height"] + 1, self.transaction_pool, miner_id)
+        metrics.BLOCK_TRANSACTIONS.observe(len(block.block["data"]))
+        block.mine()
+        logger.info("Block created %s", logs.BlockSummary(block.get_json()))
+        if not self.validate_and_add_block(block.get_json()):
+            logger.info("Created block was not added %s", logs.BlockSummary(block.get_json()))
+            self.remove_invalid_transactions(block.get_json()["data"])
+            return None
         return block
 
+    def remove_invalid_transactions(self, transactions):
+        """
+        Remove from the pool the votes of "transactions" from voters that already voted in the chain,
+        or that vote more than once in "transactions" (the first vote is kept).
+        Received votes are only checked against the chain when they are added to a block.
+        """
+        voters = set()
+        invalid = []
+        for transaction in transactions:
+            if transaction["addr_from"] in voters or self.check_double_spending(transaction["addr_from"]):
+                invalid.append(transaction)
+            voters.add(transaction["addr_from"])
+        if len(invalid) > 0:
+            logger.info("Removing %d double votes from the pool", len(invalid))
+            self.update_pool(invalid, [])
+
+    @metrics.timed(metrics.VALIDATE_TRANSACTION_SECONDS)
     def validate_transaction(self, transaction):
         """
         Validate that a transaction signature corresponds to the provided data
@@ -157,51 +296,156 @@ class Blockchain():
         """
         Add transaction to pool with concurrency protection
         """
-        self.t_lock.acquire()
-        self.transaction_pool.append(transaction)
-        self.t_lock.release()
+        with self.t_lock:
+            self.transaction_pool = self.transaction_pool + [transaction]
+            self.pool_index = dict(self.pool_index, **{transaction_hash(transaction): transaction})
+            self.pool_arrival[transaction["signature"]] = time.time()
+        self.notify("transaction", transaction)
         return
 
+    def get_pool_age(self):
+        """
+        Return how long the oldest transaction in the pool has been waiting, in seconds
+        """
+        arrivals = list(self.pool_arrival.values())
+        if len(arrivals) == 0:
+            return 0
+        return time.time() - min(arrivals)
+
     def validate_and_add_block(self, block):
         """
         Validate block in JSON format and add to chain.
         Change transaction pool accordingly.
+
+        Validation runs without holding the lock, against a snapshot of the chain. The lock
+        is only taken to commit the result, and only if the chain is still the snapshot
+        used to validate it, otherwise the block is validated again against the new chain.
+        Return True if the block was added to the chain.
         """
-        logger.info("Validate and add block")
-        if len(self.storage) > 0:
-            self.lock.acquire()
-            current_head = self.storage[-1]
+        while True:
+            snapshot = self.storage
+            if len(snapshot) == 0:
+                return False
+            current_head = snapshot[-1]
             # Check if node has the same height as the current head and untie the conflict with the timestamp
             if current_head["height"] == block["height"]:
-                logger.info("Validate conflicting block")
-                prevBlock = self.storage[-2]
-                if current_head["timestamp"] > block["timestamp"]:
-                    if self.validate_block(block, prevBlock):
-                        # Recover transactions that do not match
-                        for transaction in current_head["data"]:
-                            if transaction not in block["data"]:
-                                self.add_transaction_to_pool(transaction)
-                        self.storage[-1] = block
-                elif current_head["timestamp"] == block["timestamp"]:
-                    # Untie timestamp conflict with miner id
-                    if current_head["miner"] > block["miner"]:
-                        if self.validate_block(block, prevBlock):
-                            # Recover transactions that do not match
-                            for transaction in current_head["data"]:
-                                if transaction not in block["data"]:
-                                    self.add_transaction_to_pool(transaction)
-                            self.storage[-1] = block
+                logger.debug("Validate conflicting block")
+                if len(snapshot) < 2:
+                    return False
+                if not is_preferred_head(block, current_head) or not self.validate_block(block, snapshot[-2], snapshot[:-1]):
+                    return False
+                new_chain = snapshot[:-1] + [block]
+                # Recover transactions that do not match
+                recovered = [t for t in current_head["data"] if t not in block["data"]]
             # Otherwise, the node just must be valid
             elif current_head["height"] == block["height"] - 1:
-                logger.info("Validate next block")
-                if self.validate_block(block, current_head):
-                    self.storage.append(block)
-                    self.remove_transactions_from_pool(block)
-            self.lock.release()
-        return False
+                logger.debug("Validate next block")
+                if not self.validate_block(block, current_head, snapshot):
+                    return False
+                new_chain = snapshot + [block]
+                recovered = []
+            else:
+                return False
+
+            with self.lock:
+                committed = self.storage is snapshot
+                if committed:
+                    self.votes.update(new_chain)
+                    self.prune(new_chain)
+                    self.serialized.update(new_chain)
+                    self.storage = new_chain
+                    with tracing.span("pool_cleanup"):
+                        self.update_pool(block["data"], recovered)
+            if committed:
+                logger.info("Accepted block %s", logs.BlockSummary(block))
+                self.notify("block", block)
+                return True
+            logger.debug("Chain changed during validation, validate block again")
+
+    def adopt_chain(self, chain):
+        """
+        Replace the chain by "chain", received from a peer, if it is longer (or as long, with a head that
+        wins the conflict with the local head, see "is_preferred_head") and its blocks after the last
+        block in common are valid, so a node that missed blocks or followed another fork catches up.
+        The transactions of the replaced blocks that are not in the new ones go back to the pool.
+        Return True if the chain was replaced.
+        """
+        while True:
+            snapshot = self.storage
+            if len(snapshot) == 0 or len(chain) < len(snapshot):
+                return False
+            if not all(check_block_format(block) for block in chain):
+                return False
+            # A chain of the same height replaces the local one only if its head wins the conflict
+            if len(chain) == len(snapshot) and (chain[-1]["hash"] == snapshot[-1]["hash"]
+                                                 or not is_preferred_head(chain[-1], snapshot[-1])):
+                return False
+            fork = 0
+            while fork < len(snapshot) and chain[fork]["hash"] == snapshot[fork]["hash"]:
+                fork += 1
+            if fork == 0:
+                logger.info("Chain from another genesis block")
+                return False
+            # The blocks in common are indexed, the votes of the new blocks are checked against them and each other
+            prefix = snapshot[:fork]
+            new_chain = list(prefix)
+            voters = set()
+            for block in chain[fork:]:
+                if block.get("pruned", False) or block["height"] != len(new_chain):
+                    return False
+                if not self.validate_block(block, new_chain[-1], prefix):
+                    return False
+                if any(transaction["addr_from"] in voters for transaction in block["data"]):
+                    return False
+                voters.update(transaction["addr_from"] for transaction in block["data"])
+                new_chain.append(block)
+            with self.lock:
+                committed = self.storage is snapshot
+                if committed:
+                    self.votes.update(new_chain)
+                    self.prune(new_chain)
+                    self.serialized.update(new_chain)
+                    self.storage = new_chain
+                    added = [transaction for block in new_chain[fork:] for transaction in block["data"]]
+                    recovered = [transaction for block in snapshot[fork:] for transaction in block["data"]
+                                 if transaction not in added and not self.check_double_spending(transaction["addr_from"])]
+                    with tracing.span("pool_cleanup"):
+                        self.update_pool(added, recovered)
+            if committed:
+                logger.info("Adopted chain of height %d, replacing %d blocks", new_chain[-1]["height"], len(snapshot) - fork)
+                for block in new_chain[fork:]:
+                    self.notify("block", block)
+                return True
+            logger.debug("Chain changed during validation, validate chain again")
 
     def get_chain(self):
         """
         Return list representing the blockchain
         """
-        return self.storage
\ No newline at end of file
+        return self.storage
+
+    def get_chain_json(self, chain=None):
+        """
+        Return the chain (defaults to the current one) as JSON bytes, from the cached block fragments
+        """
+        if chain is None:
+            chain = self.storage
+        return self.serialized.get_json(chain)
+
+    def get_chain_gzip(self, chain=None):
+        """
+        Return the chain (defaults to the current one) as gzip compressed JSON bytes, compressed once per chain
+        """
+        if chain is None:
+            chain = self.storage
+        return self.serialized.get_gzip(chain)
+
+    def get_etag(self, chain=None):
+        """
+        Return ETag of the chain (defaults to the current one), the hash of its last block
+        """
+        if chain is None:
+            chain = self.storage
+        if len(chain) == 0:
+            return "empty"
+        return chain[-1]["hash"]
\ No newline at end of file
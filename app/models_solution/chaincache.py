@@ -0,0 +1,57 @@
+import gzip
+import json
+
+from threading import Lock
+
+from app.wire import COMPRESS_LEVEL
+
+def encode_block(block):
+    """
+    Serialize block to compact JSON bytes
+    """
+    return json.dumps(block, separators=(",", ":")).encode()
+
+class ChainCache():
+    """
+    JSON fragments of the blocks of a chain, serialized once when the chain is committed, so chain
+    responses are a concatenation of bytes instead of serializing every block again.
+    Blocks are never modified, only replaced (a new head, pruning), so a block with the same
+    reference as in the previous chain keeps its fragment. Must be updated by one thread at a time.
+    The gzip compressed JSON of the chain is also kept, compressed once for all the peers that ask for it.
+    """
+    def __init__(self):
+        # Chain and its fragments, replaced together so readers get a consistent pair
+        self.state = ([], [])
+        # Chain and its compressed JSON, "gzip_lock" makes concurrent requests wait for a single compression
+        self.compressed = ([], None)
+        self.gzip_lock = Lock()
+
+    def update(self, chain):
+        """
+        Serialize the blocks of "chain" that are not in the previously cached chain
+        """
+        cached, fragments = self.state
+        self.state = (chain, [fragments[i] if i < len(cached) and cached[i] is block else encode_block(block)
+                              for i, block in enumerate(chain)])
+
+    def get_json(self, chain):
+        """
+        Return "chain" as JSON bytes, from the fragments if it is the cached chain
+        """
+        cached, fragments = self.state
+        if cached is not chain:
+            fragments = [encode_block(block) for block in chain]
+        return b"[" + b",".join(fragments) + b"]"
+
+    def get_gzip(self, chain):
+        """
+        Return "chain" as gzip compressed JSON bytes, compressed once if it is the cached chain
+        """
+        with self.gzip_lock:
+            cached, body = self.compressed
+            if cached is chain and body is not None:
+                return body
+            body = gzip.compress(self.get_json(chain), COMPRESS_LEVEL)
+            if chain is self.state[0]:
+                self.compressed = (chain, body)
+            return body
@@ -0,0 +1,81 @@
+import re
+
+from threading import Lock
+
+from app.models_solution.blockchain import Blockchain
+from app.models_solution.seencache import SeenCache
+
+# Election served by the routes without election id, hosted by every node
+DEFAULT_ELECTION = "default"
+DEFAULT_CANDIDATES = [{"name": "Candidate 1", "address": "12345"},
+                      {"name": "Candidate 2", "address": "5678"},
+                      {"name": "Candidate 3", "address": "9999"}]
+
+# Election ids are part of the URLs
+ELECTION_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def check_election(info):
+    """
+    Return True if the election description (in JSON format) has a valid id and a list of candidates
+    with different addresses
+    """
+    if not isinstance(info, dict) or not isinstance(info.get("id"), str) or not ELECTION_ID.match(info["id"]):
+        return False
+    candidates = info.get("candidates")
+    if not isinstance(candidates, list) or len(candidates) == 0:
+        return False
+    if not all(isinstance(c, dict) and isinstance(c.get("name"), str) and isinstance(c.get("address"), str)
+               for c in candidates):
+        return False
+    return len({c["address"] for c in candidates}) == len(candidates)
+
+class Election():
+    """
+    Election hosted by a node: its candidates and its own chain, with its own transaction pool and locks,
+    and the schedule of its blocks. Elections only share the network, so the blocks of different
+    elections are validated and created concurrently.
+    """
+    def __init__(self, election_id, candidates, prune_depth=None):
+        self.id = election_id
+        # Valid addresses you can issue a vote to
+        self.valid_addresses = candidates
+        self.blockchain = Blockchain(prune_depth)
+        # Previous hash of the genesis block, different in every election
+        self.genesis = "Genesis Block" if election_id == DEFAULT_ELECTION else "Genesis Block " + election_id
+        # Received blocks and transactions of the election, set by the node
+        self.ingestion = None
+        # Hashes of the blocks and transactions already processed
+        self.seen = SeenCache()
+        # Hashes of the announced blocks and transactions already requested from peers
+        self.requested = SeenCache()
+        # Protects the block schedule: when the next block is due (time.time()), and if one is being mined
+        self.block_lock = Lock()
+        self.block_due = None
+        # Id of the scheduler job of the next block, every job gets a new id
+        self.block_job = None
+        # Held while the chain catches up with the peers, see "PeerToPeer.catch_up"
+        self.sync_lock = Lock()
+        self.mining = False
+
+    def path(self, path):
+        """
+        Return the path of an endpoint for this election, the default election uses the plain paths
+        """
+        if self.id == DEFAULT_ELECTION:
+            return path
+        return "/elections/" + self.id + path
+
+    def get_info(self):
+        """
+        Return the description of the election announced to the peers
+        """
+        return {"id": self.id, "candidates": self.valid_addresses}
+
+    def get_tip(self):
+        """
+        Return hash and height of the last block
+        """
+        chain = self.blockchain.get_chain()
+        if len(chain) == 0:
+            return {"hash": None, "height": -1}
+        return {"hash": chain[-1]["hash"], "height": chain[-1]["height"]}
@@ -0,0 +1,141 @@
+import time
+import itertools
+
+from queue import PriorityQueue, Full
+from threading import Thread, Condition
+
+from app import logs
+from app import tracing
+
+# Log configuration
+logger = logs.get_logger("ingestion")
+
+# Lower values are processed first
+STOP_PRIORITY = -1
+BLOCK_PRIORITY = 0
+TRANSACTION_PRIORITY = 1
+TRACE_NAMES = {BLOCK_PRIORITY: "ingest block", TRANSACTION_PRIORITY: "ingest transaction"}
+
+class IngestionQueue():
+    """
+    Bounded queue in front of block and transaction validation.
+    Received data is enqueued and validated by a pool of worker threads, blocks before
+    transactions and each kind in arrival order. When the queue is full new data is refused,
+    so the caller can shed load instead of piling up requests.
+    """
+    def __init__(self, block_handler, transaction_handler, workers=2, maxsize=1000):
+        self.handlers = {BLOCK_PRIORITY: block_handler, TRANSACTION_PRIORITY: transaction_handler}
+        self.queue = PriorityQueue(maxsize)
+        self.counter = itertools.count()
+        # Blocks depend on the previous ones, so they are validated one at a time in order
+        self.block_turn = Condition()
+        self.block_counter = itertools.count()
+        self.next_block = 0
+        self.workers = []
+        for _ in range(workers):
+            worker = Thread(target=self.work, daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def add_block(self, block, *args):
+        """
+        Enqueue received block, return False if the queue is full.
+        Extra arguments are passed to the block handler.
+        """
+        return self.put(BLOCK_PRIORITY, block, *args)
+
+    def add_transaction(self, transaction, *args):
+        """
+        Enqueue received transaction, return False if the queue is full
+        Extra arguments are passed to the transaction handler.
+        """
+        return self.put(TRANSACTION_PRIORITY, transaction, *args)
+
+    def add_transactions(self, transactions, *args):
+        """
+        Enqueue a batch of received transactions, all of them or none: return False if they do not fit,
+        so the sender can send the whole batch again without duplicates
+        """
+        with self.block_turn:
+            # Only producers hold the lock, so the free space can only grow until the batch is enqueued
+            if self.queue.maxsize > 0 and self.queue.maxsize - self.queue.qsize() < len(transactions):
+                logger.error("Ingestion queue is full, refusing %d transactions", len(transactions))
+                return False
+            for transaction in transactions:
+                self.put(TRANSACTION_PRIORITY, transaction, *args)
+        return True
+
+    def put(self, priority, *data):
+        """
+        Enqueue data without blocking, keeping the arrival order inside each priority
+        """
+        with self.block_turn:
+            turn = next(self.block_counter) if priority == BLOCK_PRIORITY else None
+            # Keep the request trace, so the processing can be traced as part of it
+            parent = tracing.current()
+            origin = (parent.id if parent is not None else None, time.perf_counter())
+            try:
+                self.queue.put_nowait((priority, next(self.counter), turn, origin, data))
+            except Full:
+                if turn is not None:
+                    # Give the turn back, nobody will wait for it
+                    self.block_counter = itertools.count(turn)
+                logger.error("Ingestion queue is full, refusing data")
+                return False
+        return True
+
+    def stop(self):
+        """
+        Stop the workers once they finish the items they are processing, the items left in the queue are dropped
+        """
+        for _ in self.workers:
+            # Blocks if the queue is full, until a worker takes an item
+            self.queue.put((STOP_PRIORITY, next(self.counter), None, None, None))
+
+    def size(self):
+        """
+        Return the number of items waiting for validation
+        """
+        return self.queue.qsize()
+
+    def join(self):
+        """
+        Wait until every enqueued item was processed
+        """
+        self.queue.join()
+
+    def process(self, priority, turn, data):
+        """
+        Call the handler for the data, waiting for the turn if it is a block
+        """
+        if turn is None:
+            self.handlers[priority](*data)
+            return
+        with self.block_turn:
+            while self.next_block != turn:
+                self.block_turn.wait()
+        try:
+            self.handlers[priority](*data)
+        finally:
+            with self.block_turn:
+                self.next_block += 1
+                self.block_turn.notify_all()
+
+    def work(self):
+        """
+        Worker loop, validate items from the queue until the queue is stopped
+        """
+        while True:
+            priority, _, turn, origin, data = self.queue.get()
+            if priority == STOP_PRIORITY:
+                self.queue.task_done()
+                return
+            parent_id, enqueued = origin
+            try:
+                with tracing.trace(TRACE_NAMES[priority], parent_id, parent_id is not None or None, enqueued):
+                    tracing.add_span("queue_wait", enqueued, time.perf_counter())
+                    self.process(priority, turn, data)
+            except Exception:
+                logger.exception("Error processing received data")
+            finally:
+                self.queue.task_done()
@@ -0,0 +1,107 @@
+import time
+import requests
+
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from app import logs
+from app import metrics
+from app.wire import encode_json, accepts_gzip
+
+# Log configuration
+logger = logs.get_logger("peerclient")
+
+class PeerClient():
+    """
+    HTTP client used to talk to other peers.
+    Keeps one keep-alive session per peer, applies a timeout to every request and
+    sends messages to several peers concurrently through a bounded thread pool.
+    Request bodies are compressed for the peers that said they accept it, responses are
+    compressed by peers that support it since requests asks for it by default.
+    """
+    def __init__(self, timeout=3, max_workers=8, listener=None):
+        self.timeout = timeout
+        # Called with the peer address, the latency and if it answered without a server error after each request
+        self.listener = listener
+        self.sessions = {}
+        self.sessions_lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Latency in seconds of the last request made to each peer
+        self.latency = {}
+        # Peers that accept gzip compressed requests
+        self.gzip_peers = set()
+        # ETag of the last response received for each (address, path)
+        self.etags = {}
+
+    def get_session(self, address):
+        """
+        Return the persistent session used for the peer, creating it if needed
+        """
+        with self.sessions_lock:
+            if address not in self.sessions:
+                self.sessions[address] = requests.Session()
+            return self.sessions[address]
+
+    def request(self, method, address, path, **kwargs):
+        """
+        Make request to the peer, return the response or None if the peer could not be reached
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        r = None
+        try:
+            r = self.get_session(address).request(method, "http://" + address + path, **kwargs)
+        except requests.RequestException as e:
+            logger.error("Request to %s%s failed: %s", address, path, e)
+            return None
+        finally:
+            self.latency[address] = time.perf_counter() - start
+            metrics.PEER_REQUEST_SECONDS.labels(address).observe(self.latency[address])
+            failed = r is None or r.status_code >= 500
+            if failed:
+                metrics.PEER_ERRORS.labels(address).inc()
+            if self.listener is not None:
+                self.listener(address, self.latency[address], not failed)
+        logger.debug("%s %s%s returned %d in %.3fs", method, address, path, r.status_code, self.latency[address])
+        if accepts_gzip(r):
+            self.gzip_peers.add(address)
+        return r
+
+    def get(self, address, path, **kwargs):
+        return self.request("GET", address, path, **kwargs)
+
+    def get_if_changed(self, address, path, etag=None):
+        """
+        Conditional GET, the peer answers 304 without data if its ETag is still "etag".
+        Without "etag", the one from the last response for the same address and path is used.
+        """
+        if etag is None:
+            etag = self.etags.get((address, path))
+        headers = {"If-None-Match": '"{}"'.format(etag)} if etag is not None else {}
+        r = self.get(address, path, headers=headers)
+        if r is not None and r.status_code == 200 and "ETag" in r.headers:
+            self.etags[(address, path)] = r.headers["ETag"].strip('"')
+        return r
+
+    def post(self, address, path, data, **kwargs):
+        body, headers = encode_json(data, address in self.gzip_peers)
+        headers.update(kwargs.pop("headers", None) or {})
+        return self.request("POST", address, path, data=body, headers=headers, **kwargs)
+
+    def post_all(self, addresses, path, data, **kwargs):
+        """
+        Post the same data to all the addresses concurrently.
+        Return dictionary from address to response (None for the peers that failed).
+        """
+        futures = {address: self.executor.submit(self.post, address, path, data, **kwargs) for address in addresses}
+        return {address: future.result() for address, future in futures.items()}
+
+    def close(self):
+        """
+        Close all the open sessions and stop sending new requests
+        """
+        self.executor.shutdown(wait=False)
+        with self.sessions_lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
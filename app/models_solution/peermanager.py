@@ -0,0 +1,116 @@
+import time
+import uuid
+
+from threading import Lock
+from collections import OrderedDict
+
+from app import logs
+
+# Log configuration
+logger = logs.get_logger("peermanager")
+
+# Latency assumed for peers that were never contacted, in seconds
+DEFAULT_LATENCY = 1.0
+# Weight of the last request in the latency moving average
+LATENCY_WEIGHT = 0.3
+
+class PeerManager():
+    """
+    Participant list with health information about each peer: latency, consecutive failures
+    and last time it answered. Peers are ranked by score to choose sync sources and are evicted
+    after "max_failures" consecutive failures.
+    """
+    def __init__(self, max_failures=3):
+        self.max_failures = max_failures
+        self.lock = Lock()
+        # Address to peer advertisement ({"miner_id", "address"}), in insertion order
+        self.peers = OrderedDict()
+        self.stats = {}
+        # Changes every time the participant list changes
+        self.version = 0
+        # Makes the ETag unique to this process, since the version starts again on every restart
+        self.instance = uuid.uuid4().hex[0:8]
+
+    def get_list(self):
+        """
+        Return the participant list
+        """
+        return list(self.peers.values())
+
+    def get_etag(self):
+        """
+        Return ETag of the current participant list
+        """
+        return "{}-{}".format(self.instance, self.version)
+
+    def add(self, peer):
+        """
+        Add peer to the list if it is not there yet, return True if it was added
+        """
+        with self.lock:
+            if peer["address"] in self.peers:
+                return False
+            self.peers[peer["address"]] = peer
+            self.stats[peer["address"]] = {"latency": DEFAULT_LATENCY, "failures": 0, "last_seen": None}
+            self.version += 1
+            return True
+
+    def remove(self, address):
+        """
+        Remove peer from the list
+        """
+        with self.lock:
+            if address in self.peers:
+                del self.peers[address]
+                del self.stats[address]
+                self.version += 1
+
+    def record_success(self, address, latency):
+        """
+        Update the peer statistics after it answered a request
+        """
+        with self.lock:
+            stats = self.stats.get(address)
+            if stats is not None:
+                stats["latency"] = (1 - LATENCY_WEIGHT) * stats["latency"] + LATENCY_WEIGHT * latency
+                stats["failures"] = 0
+                stats["last_seen"] = time.time()
+
+    def record_failure(self, address):
+        """
+        Update the peer statistics after a failed request, evicting it after too many failures
+        """
+        with self.lock:
+            stats = self.stats.get(address)
+            if stats is None:
+                return
+            stats["failures"] += 1
+            evict = stats["failures"] >= self.max_failures
+        if evict:
+            logger.error("Evicting unresponsive peer %s", address)
+            self.remove(address)
+
+    def record(self, address, latency, ok):
+        """
+        Record the result of a request, used as PeerClient listener
+        """
+        if ok:
+            self.record_success(address, latency)
+        else:
+            self.record_failure(address)
+
+    def score(self, address):
+        """
+        Return the peer score, lower is better
+        """
+        stats = self.stats.get(address)
+        if stats is None:
+            return float("inf")
+        return stats["latency"] * (1 + stats["failures"])
+
+    def best(self, exclude=None):
+        """
+        Return the peer addresses sorted from the best to the worst score, without "exclude"
+        """
+        addresses = [address for address in list(self.peers) if address != exclude]
+        return sorted(addresses, key=self.score)
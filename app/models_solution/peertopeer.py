@@ -1,44 +1,296 @@
-import sys
-import logging
 import json
 import random
-import requests
+import itertools
 import os
+import time
 
 from datetime import datetime,timedelta
+from threading import Thread, Event, Lock
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import JobLookupError
 from Crypto.PublicKey import RSA
 
-from app.models_solution.blockchain import Blockchain
-from app.models_solution.transaction import Transaction
+from app import logs
+from app import metrics
+from app import tracing
+from app.models_solution.election import Election, DEFAULT_ELECTION, DEFAULT_CANDIDATES, check_election
+from app.models_solution.block import get_compact_block, rebuild_block, check_block_format, check_compact_block, get_block_hash
+from app.models_solution.transaction import Transaction, transaction_hash, short_transaction_id, get_canonical_transaction
+from app.models_solution.ingestion import IngestionQueue
+from app.models_solution.peerclient import PeerClient
+from app.models_solution.peermanager import PeerManager
+from app.models_solution.batcher import Batcher
+
+# HTTP header carrying the number of hops a gossip message can still travel
+TTL_HEADER = "X-Gossip-TTL"
+
+# Times the chain of an election of the peers is requested, one second apart, before the node stops hosting it
+ELECTION_JOIN_ATTEMPTS = 30
 
 # Log configuration
-logging.basicConfig(format = "%(asctime)-15s %(message)s", stream=sys.stdout)
-logger = logging.getLogger("blockchain_logger")
-logger.setLevel(logging.DEBUG)
+logger = logs.get_logger("peertopeer")
+
+def get_response_field(r, field):
+    """
+    Return the field of the JSON object in the response of a peer, None if the request failed
+    or the response is not a JSON object
+    """
+    if r is None or r.status_code != 200:
+        return None
+    try:
+        data = r.json()
+    except ValueError:
+        return None
+    return data.get(field) if isinstance(data, dict) else None
 
 class PeerToPeer():
-    def __init__(self, addr):
+    def __init__(self, addr, gossip_fanout=None, gossip_ttl=6, relay_mode="push", peer_max_failures=3, peer_probe_interval=30,
+                 batch_window=0, batch_size=100, prune_depth=None, block_policy="wait", block_threshold=None,
+                 block_max_wait=5, max_elections=16, sync_interval=10, master="localhost:5000", data_dir="."):
         """
-        PeerToPeer network initialization routine, generates miner ID and synchronizes blockchain (blocks and participants)
+        PeerToPeer network initialization routine, the node joins the network when "start" is called.
+        With "gossip_fanout" set, blocks and transactions are sent to that many random peers, which
+        forward them while the TTL allows, instead of being sent by the origin to every peer.
+        With "relay_mode" set to "announce", only the hashes are sent and peers fetch the data they need,
+        blocks as compact blocks.
+        With "relay_mode" set to "compact", blocks are sent with short transaction ids instead of the transactions.
+        Peers are probed every "peer_probe_interval" seconds and evicted after "peer_max_failures" failed requests.
+        Every "sync_interval" seconds the node compares its chains with the tips of the peers and catches up.
+        With "batch_window" set, transactions are sent in batches of up to "batch_size" transactions
+        gathered during that many seconds.
+        With "prune_depth" set, blocks older than the last "prune_depth" ones are kept without transactions.
+        Blocks are created "block_max_wait" seconds after the oldest transaction in the pool arrived, or right away
+        once the pool has "block_threshold" transactions. With "block_policy" set to "continuous", blocks are
+        created one after the other while the pool has transactions.
+        The miner ID and private key are kept in "data_dir".
+        Besides the default election, the node hosts the elections created with "create_election"
+        or announced by its peers, each one with its own chain, see "Election", up to "max_elections" elections.
         """
-        self.master_node = "localhost:5000"
+        self.master_node = master
+        self.data_dir = data_dir
         random.seed()
-        self.generate_miner_id()
         self.address = addr
-        self.participant_list = []
-        self.get_current_participant_list()
-        self.advertise()
-        self.blockchain = Blockchain()
-
-        while self.blockchain.empty():
-            self.get_current_blockchain()
-        # Valid addresses you can issue a vote to
-        self.valid_addresses = [{"name": "Candidate 1", "address": "12345"},
-                                {"name": "Candidate 2", "address": "5678"},
-                                {"name": "Candidate 3", "address": "9999"}]
+        self.peers = PeerManager(peer_max_failures)
+        self.client = PeerClient(listener=self.peers.record)
+        self.gossip_fanout = gossip_fanout
+        self.gossip_ttl = gossip_ttl
+        self.relay_mode = relay_mode
+        # Outgoing transactions are grouped by election and TTL, since they are sent once for the whole batch
+        self.batcher = None
+        if batch_window > 0:
+            self.batcher = Batcher(self.propagate_transactions, batch_window, batch_size)
+        self.prune_depth = prune_depth
+        # Set when the node has its miner ID and the current blockchain
+        self.ready = Event()
+        # Set once a participant list was received from the network. From then on, the node never
+        # creates a genesis block of its own when it runs out of peers, it waits for them instead
+        self.joined = False
         self.sched = BackgroundScheduler(daemon=True)
         self.sched.start()
+        self.sched.add_job(self.probe_peers, 'interval', seconds=peer_probe_interval, id="probe_peers")
+        self.sched.add_job(self.check_tips, 'interval', seconds=sync_interval, id="check_tips")
+        self.block_policy = block_policy
+        self.block_threshold = block_threshold
+        self.block_max_wait = block_max_wait
+        self.block_jobs = itertools.count()
+        # Elections by id, copy-on-write like the chain, "elections_lock" serializes the changes
+        self.max_elections = max_elections
+        self.elections = {}
+        self.elections_lock = Lock()
+        self.add_election(DEFAULT_ELECTION, DEFAULT_CANDIDATES)
+
+    def start(self, background=True):
+        """
+        Join the network: generate miner ID, get participants, advertise and synchronize the blockchain.
+        By default it runs in background, so the node can serve requests meanwhile. Use "ready" to know when it is done.
+        """
+        if background:
+            Thread(target=self.bootstrap, daemon=True).start()
+        else:
+            self.bootstrap()
+
+    def bootstrap(self):
+        """
+        Node initialization, retrying the blockchain synchronization until it succeeds
+        """
+        start = time.perf_counter()
+        self.generate_miner_id()
+        self.get_current_participant_list()
+        self.advertise()
+        self.join_election(self.get_election())
+        self.get_current_elections()
+        self.ready.set()
+        logger.info("Node ready in %.3fs", time.perf_counter() - start)
+
+    def stop(self):
+        """
+        Stop background jobs and validation workers, and close connections to the peers
+        """
+        self.sched.shutdown(wait=False)
+        for election in self.elections.values():
+            election.ingestion.stop()
+        self.client.close()
+
+    @property
+    def blockchain(self):
+        """
+        Chain of the default election
+        """
+        return self.get_election().blockchain
+
+    @property
+    def valid_addresses(self):
+        """
+        Candidates of the default election
+        """
+        return self.get_election().valid_addresses
+
+    def get_election(self, election_id=None):
+        """
+        Return the election with the id (defaults to the default election), None if the node does not host it
+        """
+        return self.elections.get(election_id or DEFAULT_ELECTION)
+
+    def get_elections(self):
+        """
+        Return the description of every hosted election
+        """
+        return [election.get_info() for election in self.elections.values()]
+
+    def add_election(self, election_id, candidates):
+        """
+        Host an election with an empty chain and its own ingestion queue, return None if it is already hosted.
+        Raise ValueError if the node hosts "max_elections" elections, or if a candidate is a candidate of
+        another election: votes only name the candidate, so they would be valid in both elections.
+        """
+        with self.elections_lock:
+            if election_id in self.elections:
+                return None
+            if len(self.elections) >= self.max_elections:
+                raise ValueError("too many elections")
+            hosted = {candidate["address"] for election in self.elections.values() for candidate in election.valid_addresses}
+            if any(candidate["address"] in hosted for candidate in candidates):
+                raise ValueError("candidate of another election")
+            election = Election(election_id, candidates, self.prune_depth)
+            # Received blocks and transactions are validated by background workers
+            election.ingestion = IngestionQueue(self.validate_and_add_block, self.validate_and_add_transaction)
+            self.elections = dict(self.elections, **{election_id: election})
+        logger.info("Hosting election %s", election_id)
+        return election
+
+    def create_election(self, election_id, candidates):
+        """
+        Start a new election: create its genesis block and announce it to the peers, that synchronize
+        its chain from the network. Return None if the election already exists
+        """
+        election = self.add_election(election_id, candidates)
+        if election is None:
+            return None
+        election.blockchain.create_genesis_block(self.private_key, self.miner_id, election.genesis)
+        self.propagate("/announce_election", dict(election.get_info(), address=self.address))
+        return election
+
+    def remove_election(self, election_id):
+        """
+        Stop hosting the election, with its block schedule and its validation workers
+        """
+        with self.elections_lock:
+            election = self.elections.get(election_id)
+            if election is None:
+                return
+            self.elections = {key: value for key, value in self.elections.items() if key != election_id}
+        try:
+            if election.block_job is not None:
+                self.sched.remove_job(election.block_job)
+        except JobLookupError:
+            pass
+        election.ingestion.stop()
+        logger.info("Stopped hosting election %s", election_id)
+
+    def receive_election(self, announcement):
+        """
+        Host an election announced by a peer. Anybody can claim to be a peer, so the election is only
+        hosted once the peer confirms it, see "confirm_election". Return False if the announcement
+        does not name a known peer.
+        """
+        address = announcement["address"]
+        if address not in self.other_peers():
+            logger.warning("Election %s announced by unknown peer %s", announcement["id"], address)
+            return False
+        if self.get_election(announcement["id"]) is None:
+            self.client.executor.submit(self.confirm_election, address, announcement["id"])
+        return True
+
+    def confirm_election(self, address, election_id):
+        """
+        Host the election if the peer lists it in "/elections", with the candidates the peer sent.
+        Return False if the peer does not host it or the election is refused
+        """
+        r = self.client.get(address, "/elections")
+        try:
+            elections = r.json() if r is not None and r.status_code == 200 else []
+        except ValueError:
+            elections = []
+        for info in elections if isinstance(elections, list) else []:
+            if check_election(info) and info["id"] == election_id:
+                return self.host_election(info)
+        logger.warning("Election %s announced by %s is not hosted by it", election_id, address)
+        return False
+
+    def host_election(self, info):
+        """
+        Host an election of the peers and synchronize its chain in background, return False if it is refused
+        """
+        try:
+            election = self.add_election(info["id"], info["candidates"])
+        except ValueError as e:
+            logger.warning("Refused election %s: %s", info["id"], e)
+            return False
+        if election is not None:
+            Thread(target=self.join_peer_election, args=(election,), daemon=True).start()
+        return True
+
+    def join_peer_election(self, election):
+        """
+        Synchronize the chain of an election of the peers, stop hosting it if no peer has its chain
+        """
+        if not self.join_election(election, ELECTION_JOIN_ATTEMPTS):
+            logger.error("Could not get the chain of election %s", election.id)
+            self.remove_election(election.id)
+
+    def join_election(self, election, attempts=None):
+        """
+        Synchronize the chain of the election, retrying until it succeeds, or at most "attempts" times if set.
+        Return True if the chain was synchronized
+        """
+        for attempt in itertools.count(1):
+            self.get_current_blockchain(election=election)
+            if not election.blockchain.empty():
+                return True
+            if attempts is not None and attempt >= attempts:
+                return False
+            time.sleep(1)
+            # The peers may have been evicted meanwhile
+            self.get_current_participant_list()
+
+    def get_current_elections(self):
+        """
+        Host the elections of the other peers, asking the best peers until one answers
+        """
+        for address in self.peers.best(exclude=self.address):
+            r = self.client.get(address, "/elections")
+            if r is not None and r.status_code == 200:
+                for info in r.json():
+                    if check_election(info):
+                        self.host_election(info)
+                return
+
+    @property
+    def participant_list(self):
+        """
+        Current participant list, as advertised by the peers
+        """
+        return self.peers.get_list()
 
     def get_current_participant_list(self):
         """
@@ -49,201 +301,618 @@ class PeerToPeer():
             logger.info("Assuming this node as Master")
             return
 
-        if len(self.participant_list) == 0:
+        if len(self.other_peers()) == 0:
             logger.info("Use master node as source")
             # Treat as the first list insertion
-            try:
-                r = requests.get("http://" + self.master_node + "/list")
-                logger.debug("Request return: {}".format(r.status_code))
-                if r.status_code == 200:
-                    self.participant_list = r.json()
-            except:
-                logger.error("Could not get data from master node")
-
+            sources = [self.master_node]
         else:
             logger.info("Use current participants as source")
-            done = False
-            while not done:
-                random_participant = random.randint(0,len(self.participant_list)-1)
-                r = requests.get("http://" + self.participant_list[random_participant]["address"] + "/list")
-                if r.status_code == 200:
-                    self.participant_list = r.json()
-                    done = True
-                elif r.status_code == 408:
-                    # Client timeout, remove participant from list and try another
-                    self.participant_list.pop(random_participant)
-                    if len(self.participant_list) == 0:
-                        logger.error("Participant list is empty now, will keep trying on master node for now")
-                        done = True
-                else:
-                    logger.error("Invalid return code, finish operation")
-                    done = True
-
-    def get_current_blockchain(self):
-        """
-        Request current blockchain from another peer and save it.
-        """
-        logger.info("Get current blockchain")
-        if self.participant_list is not None:
-            if len(self.participant_list) > 1:
-                random_participant = random.randint(0,len(self.participant_list)-1)
-                # Check if the participant is not himself. If it is just abort with error
-                if self.participant_list[random_participant]["address"] == self.address:
-                    return
-                r = requests.get("http://" + self.participant_list[random_participant]["address"] + "/blockchain")
-                logger.debug("Request result: {}".format(r.status_code))
-                if r.status_code == 200:
-                    self.blockchain.setup_new_chain(r.json())
-            else:
-                logger.info("Current node is the only one in the participant list")
-                if self.blockchain.empty():
-                    self.blockchain.create_genesis_block(self.private_key, self.miner_id)
-        else:
-            # There should never be an empty participant list
-            logger.error("Empty participant list, won't get blockchain for now")        
+            sources = self.peers.best(exclude=self.address)
+        # Try the best sources first, unreachable ones are evicted by the peer manager
+        for address in sources:
+            r = self.client.get_if_changed(address, "/list")
+            if r is not None and r.status_code == 304:
+                logger.debug("Participant list from %s did not change", address)
+                return
+            if r is not None and r.status_code == 200:
+                for peer in r.json():
+                    self.peers.add(peer)
+                self.joined = True
+                return
+        logger.error("Could not get participant list from any peer")
+
+    def get_current_blockchain(self, max_sources=3, election=None):
+        """
+        Request current blockchain of the election (defaults to the default one) from another peer and save it.
+        The tip of the "max_sources" best peers is requested in parallel and the chain is
+        downloaded from the one with the highest block.
+        """
+        election = election or self.get_election()
+        blockchain = election.blockchain
+        logger.info("Get current blockchain of election %s", election.id)
+        sources = self.peers.best(exclude=self.address)
+        if len(sources) == 0:
+            logger.info("Current node is the only one in the participant list")
+            # Only the master starts a chain, other nodes that lost their peers would fork.
+            # Other elections start with the genesis block of the node that created them, see "create_election"
+            if (blockchain.empty() and election.id == DEFAULT_ELECTION
+                    and (self.address == self.master_node or not self.joined)):
+                blockchain.create_genesis_block(self.private_key, self.miner_id, election.genesis)
+            return
+        tips = self.get_tips(sources[0:max_sources], election)
+        # Sync from the peer with the highest tip and then from the best peers that answer
+        sources = sorted(tips, key=lambda a: tips[a]["height"], reverse=True) + [a for a in sources if a not in tips]
+        for address in sources:
+            # The peer doesn't send the chain if it ends in the same block as the local one
+            r = self.client.get_if_changed(address, election.path("/blockchain"), blockchain.get_etag())
+            if r is not None and r.status_code == 304:
+                return
+            if r is not None and r.status_code == 200:
+                chain = r.json()
+                # Pruned nodes only have the headers of old blocks, the chain must come from a full node
+                if any(block.get("pruned", False) for block in chain):
+                    logger.info("Chain from %s is pruned, trying other peers", address)
+                    continue
+                blockchain.setup_new_chain(chain)
+                return
+
+    def get_tips(self, addresses, election=None):
+        """
+        Request the tip of the election to the peers in parallel, return the hash and height of each peer that answers
+        """
+        election = election or self.get_election()
+        futures = {address: self.client.executor.submit(self.client.get, address, election.path("/tip"))
+                   for address in addresses}
+        tips = {}
+        for address, future in futures.items():
+            r = future.result()
+            height = get_response_field(r, "height")
+            if type(height) is int:
+                tips[address] = {"hash": get_response_field(r, "hash"), "height": height}
+        return tips
+
+    def catch_up(self, election=None, max_sources=3):
+        """
+        Adopt the chain of a peer with a higher tip than the local one, or with a different tip at the same
+        height that wins the conflict with the local head, see "Blockchain.adopt_chain".
+        Called when a received block does not follow the local head and every "sync_interval" seconds,
+        so nodes that missed blocks (gossip does not reach every node) or followed another fork converge.
+        The tips of the "max_sources" best peers and as many random ones are compared, one catch up
+        at a time for each election. Return True if the chain was replaced.
+        """
+        election = election or self.get_election()
+        if not election.sync_lock.acquire(blocking=False):
+            return False
+        try:
+            tip = election.get_tip()
+            height = tip["height"]
+            if height < 0:
+                return False
+            sources = self.peers.best(exclude=self.address)
+            sources = sources[0:max_sources] + random.sample(sources[max_sources:], min(max_sources, len(sources[max_sources:])))
+            tips = self.get_tips(sources, election)
+            ahead = [a for a in tips if tips[a]["height"] > height or (tips[a]["height"] == height and tips[a]["hash"] != tip["hash"])]
+            for address in sorted(ahead, key=lambda a: tips[a]["height"], reverse=True):
+                logger.info("Peer %s is at height %d of election %s, local height %d",
+                            address, tips[address]["height"], election.id, height)
+                r = self.client.get(address, election.path("/blockchain"))
+                try:
+                    chain = r.json() if r is not None and r.status_code == 200 else None
+                except ValueError:
+                    chain = None
+                if isinstance(chain, list) and election.blockchain.adopt_chain(chain):
+                    return True
+            return False
+        finally:
+            election.sync_lock.release()
+
+    def check_tips(self):
+        """
+        Catch up with the peers in every election, in background every "sync_interval" seconds
+        """
+        if not self.ready.is_set():
+            return
+        for election in list(self.elections.values()):
+            self.catch_up(election)
 
     def get_current_transaction_pool(self):
         """
         Request transaction pool from other peer and save it.
         """
         logger.info("Get current transaction pool")
-        if self.participant_list is not None:
-            random_participant = random.randint(0,len(self.participant_list)-1)
-            r = requests.get("http://" + self.participant_list[random_participant]["address"] + "/pool")
-            logger.debug("Request result: {}".format(r.status_code))
-            if r.status_code == 200:
+        sources = self.peers.best(exclude=self.address)
+        if len(sources) > 0:
+            r = self.client.get(sources[0], "/pool")
+            if r is not None and r.status_code == 200:
                 self.transaction_pool = r.json()
-                logger.debug("Current Transaction Pool {}".format(self.transaction_pool))
+                logger.debug("Current transaction pool has %d transactions", len(self.transaction_pool))
         else:
             # There should never be an empty participant list
             logger.error("Empty participant list, won't get transaction pool for now")
 
-    def create_and_add_transaction(self, addr_to):
+    def probe_peers(self):
+        """
+        Check in background if the other peers are alive, so unresponsive ones are evicted,
+        and refresh the participant list
+        """
+        addresses = self.other_peers()
+        if len(addresses) > 0:
+            logger.debug("Probe %d peers", len(addresses))
+            for future in [self.client.executor.submit(self.client.get, address, "/ping") for address in addresses]:
+                future.result()
+            self.get_current_participant_list()
+
+    def other_peers(self):
+        """
+        Return the addresses of all the peers but this node
+        """
+        return [peer["address"] for peer in self.participant_list if peer["address"] != self.address]
+
+    def schedule_block(self, election=None, min_delay=0):
+        """
+        Schedule the creation of a block with the transaction pool of the election, see "block_policy".
+        Called when transactions arrive and after every block created here. A scheduled block is moved
+        earlier if needed, and nothing is scheduled while a block is being mined, since it is scheduled after.
+        Each election has its own job, so blocks of different elections are mined concurrently.
+        The block is not scheduled earlier than "min_delay" seconds from now.
+        """
+        election = election or self.get_election()
+        pool_size = len(election.blockchain.transaction_pool)
+        if pool_size == 0:
+            return
+        if self.block_policy == "continuous":
+            reason, delay = "continuous", 0
+        elif self.block_threshold is not None and pool_size >= self.block_threshold:
+            reason, delay = "threshold", 0
+        else:
+            reason, delay = "max_wait", max(0, self.block_max_wait - election.blockchain.get_pool_age())
+        delay = max(delay, min_delay)
+        due = time.time() + delay
+        with election.block_lock:
+            if election.mining or (election.block_due is not None and election.block_due <= due):
+                return
+            logger.debug("Block of election %s scheduled in %.3fs (%s)", election.id, delay, reason)
+            run_date = datetime.now() + timedelta(seconds=delay)
+            if election.block_due is None:
+                # A new id each time: the job that is running may still be in the job store
+                election.block_job = "create_block:%s:%d" % (election.id, next(self.block_jobs))
+                self.sched.add_job(self.create_and_add_block, 'date', run_date=run_date, args=[reason, election],
+                                   id=election.block_job)
+            else:
+                try:
+                    self.sched.modify_job(election.block_job, next_run_time=run_date, args=[reason, election])
+                except JobLookupError:
+                    # The job already started and is waiting for the lock to mine the block
+                    return
+            election.block_due = due
+
+    def create_and_add_transaction(self, addr_to, election=None):
         """
         Used to make a transaction from current node to another
         """
+        election = election or self.get_election()
         logger.info("Add transaction to pool")
-        if self.has_to_vote():
-            if self.check_valid_address(addr_to):
-                transaction = Transaction(self.miner_id, addr_to)
-                self.blockchain.add_transaction_to_pool(transaction.get_signed_json(self.private_key))
-                self.propagate_transaction(transaction.get_signed_json(self.private_key))
-                if len(self.sched.get_jobs()) == 0:
-                    logger.info("Start block schedule")
-                    self.sched.add_job(self.create_and_add_block, 'date',run_date=datetime.now()+timedelta(seconds=5))
+        with tracing.span("has_to_vote"):
+            has_to_vote = self.has_to_vote(election)
+        if has_to_vote:
+            if self.check_valid_address(addr_to, election):
+                with tracing.span("sign"):
+                    transaction = Transaction(self.miner_id, addr_to).get_signed_json(self.private_key)
+                self.add_new_transaction(transaction, election)
             else:
                 logger.error("Cannot vote for this ledger, check the address")
 
-    def has_to_vote(self):
+    def submit_transaction(self, transaction, election=None):
+        """
+        Add transaction signed by a client (not a peer) to the pool and propagate it like the ones created here.
+        Return False if the transaction is not a valid vote.
+        """
+        election = election or self.get_election()
+        blockchain = election.blockchain
+        transaction = get_canonical_transaction(transaction)
+        if (transaction is None or not blockchain.validate_transaction(transaction) or not self.check_valid_address(transaction["addr_to"], election)
+                or blockchain.check_double_spending(transaction["addr_from"])
+                or blockchain.has_transaction_in_pool(transaction["addr_from"])):
+            return False
+        self.add_new_transaction(transaction, election)
+        return True
+
+    def add_new_transaction(self, transaction, election=None):
+        """
+        Add new signed transaction to the pool, propagate it and schedule the next block
+        """
+        election = election or self.get_election()
+        election.seen.add(transaction_hash(transaction))
+        with tracing.span("add_to_pool"):
+            election.blockchain.add_transaction_to_pool(transaction)
+        with tracing.span("propagate"):
+            self.propagate_transaction(transaction, election=election)
+        self.schedule_block(election)
+
+    def has_to_vote(self, election=None):
         """
         Check if node still hasn't voted
         """
-        logger.info("Checking blockchain for node votes")
-        if not self.blockchain.empty():
-            if self.blockchain.check_double_spending(self.miner_id):
+        blockchain = (election or self.get_election()).blockchain
+        logger.debug("Checking blockchain for node votes")
+        if not blockchain.empty():
+            if blockchain.check_double_spending(self.miner_id):
                 return False
-            if self.blockchain.has_transaction_in_pool(self.miner_id):
+            if blockchain.has_transaction_in_pool(self.miner_id):
                 return False
         return True
 
-    def check_valid_address(self, address):
+    def check_valid_address(self, address, election=None):
         """
         Check if the value inserted is a valid candidate in the list
         """
-        logger.info("Check destination address")
-        for valid_candidate in self.valid_addresses:
+        logger.debug("Check destination address")
+        for valid_candidate in (election or self.get_election()).valid_addresses:
             if address in valid_candidate["address"]:
                 return True
         return False
 
-    def create_and_add_block(self):
+    def create_and_add_block(self, reason="max_wait", election=None):
         """
-        Create block using current transaction pool as data
+        Create block using current transaction pool of the election as data, then schedule the next one
         """
-        block = self.blockchain.create_and_add_block(self.miner_id)
-        self.propagate_block(block.get_json())
-        return
+        election = election or self.get_election()
+        with election.block_lock:
+            election.block_due = None
+            election.mining = True
+        # Wait before trying again if the block is rejected and the pool does not change
+        min_delay = 0
+        try:
+            # The pool may have been emptied by a block from a peer since it was scheduled
+            pool = election.blockchain.transaction_pool
+            if len(pool) > 0:
+                metrics.BLOCKS_TRIGGERED.labels(reason).inc()
+                block = election.blockchain.create_and_add_block(self.miner_id)
+                if block is not None:
+                    election.seen.add(block.get_json()["hash"])
+                    self.propagate_block(block.get_json(), election=election)
+                elif election.blockchain.transaction_pool is pool:
+                    min_delay = self.block_max_wait
+        finally:
+            with election.block_lock:
+                election.mining = False
+        self.schedule_block(election, min_delay)
 
     def generate_miner_id(self):
         """
         Check if there is already an ID for this node and load it, otherwise create.
         Also, keep a private key to use when signing transactions
         """
-        if os.path.isfile("private_key.pem") :
+        key_file = os.path.join(self.data_dir, "private_key.pem")
+        id_file = os.path.join(self.data_dir, "miner_id.txt")
+        if os.path.isfile(key_file) :
             logger.info("Loading private key")
-            with open("private_key.pem") as fr:
+            with open(key_file) as fr:
                 self.private_key = RSA.importKey(fr.read())
             
-            with open("miner_id.txt") as fr:
+            with open(id_file) as fr:
                 self.miner_id = fr.read()
 
         else:
             logger.info("Create new miner ID")
             self.miner_id = str(random.randint(0, 10000))
             logger.info("Saving miner ID")
-            with open("miner_id.txt", "w") as fw:
+            with open(id_file, "w") as fw:
                 fw.write(self.miner_id)
 
             logger.info("Create private key")
             self.private_key = RSA.generate(1024)
-            with open("private_key.pem", "w") as fw:
+            with open(key_file, "w") as fw:
                 fw.write(self.private_key.exportKey("PEM").decode())
             
         return 
 
-    def propagate_transaction(self, transaction):
+    def propagate_transaction(self, transaction, ttl=None, election=None):
+        """
+        Post transaction to the peers in the list, right away or in the next batch
+        """
+        election = election or self.get_election()
+        if self.batcher is not None:
+            self.batcher.add((election, ttl), transaction)
+            return
+        logger.debug("Propagate transaction")
+        self.relay("/update_pool", transaction, {"transactions": [transaction_hash(transaction)]}, ttl, election)
+
+    def propagate_transactions(self, key, transactions):
+        """
+        Post a batch of transactions of an election to the peers in the list in a single message,
+        "key" is the election and the TTL of the batch
+        """
+        election, ttl = key
+        logger.debug("Propagate %d transactions", len(transactions))
+        self.relay("/update_pool", transactions, {"transactions": [transaction_hash(t) for t in transactions]}, ttl, election)
+
+    def propagate_block(self, block, ttl=None, election=None):
+        """
+        Post block to the peers in the list
+        """
+        logger.debug("Propagate block %s", logs.BlockSummary(block))
+        if self.relay_mode == "compact":
+            compact = get_compact_block(block)
+            compact["address"] = self.address
+            self.relay("/compact_block", compact, {"blocks": [block["hash"]]}, ttl, election)
+        else:
+            self.relay("/add_new_block", block, {"blocks": [block["hash"]]}, ttl, election)
+
+    def relay(self, path, data, inventory, ttl=None, election=None):
         """
-        Post generated transaction to all the peers in the list
+        Send new data of the election to other peers, posting it to "path" or announcing the hashes in "inventory".
+        Without gossip, data created on this node goes to every peer and received data is not forwarded.
+        With gossip, data goes to "gossip_fanout" random peers while its TTL ("ttl" hops left,
+        None for data created on this node) is not over.
         """
-        logger.info("Propagate transaction")
-        for peer in self.participant_list:
-            if peer["address"] != self.address:
-                r = requests.post("http://" + peer["address"] + "/update_pool", json = transaction)
-                if r.status_code == 200:
-                    logger.info("Sent transaction to {}".format(peer["address"]))
+        headers = None
+        peers = self.other_peers()
+        if self.gossip_fanout is None:
+            if ttl is not None:
+                return
+        else:
+            if ttl is None:
+                ttl = self.gossip_ttl
+            if ttl <= 0:
+                return
+            peers = random.sample(peers, min(self.gossip_fanout, len(peers)))
+            headers = {TTL_HEADER: str(ttl - 1)}
+
+        election = election or self.get_election()
+        if self.relay_mode == "announce":
+            announcement = dict(inventory, address=self.address)
+            self.propagate(election.path("/inventory"), announcement, peers, headers)
+        else:
+            self.propagate(election.path(path), data, peers, headers)
 
-    def propagate_block(self, block):
+    def receive_inventory(self, inventory, ttl=None, election=None):
         """
-        Post generated block to all the peers in the list
+        Receive block and transaction hashes announced by a peer and fetch the unknown ones in background.
+        Blocks are fetched as compact blocks, rebuilt from the transactions in the pool.
         """
-        logger.info("Propagate block")
-        for peer in self.participant_list:
-            if peer["address"] != self.address:
-                r = requests.post("http://" + peer["address"] + "/add_new_block", json = block)
-                if r.status_code == 200:
-                    logger.info("Sent block to {}".format(peer["address"]))
+        election = election or self.get_election()
+        wanted = {"compact": True}
+        for kind in ("blocks", "transactions"):
+            wanted[kind] = [h for h in inventory.get(kind, []) if h not in election.seen and election.requested.add(h)]
+        if len(wanted["blocks"]) > 0 or len(wanted["transactions"]) > 0:
+            self.client.executor.submit(self.fetch_data, inventory["address"], wanted, ttl, election)
 
+    def fetch_data(self, address, wanted, ttl=None, election=None):
+        """
+        Request blocks and transactions from the peer that announced them and process them like
+        the ones that are pushed. With "compact" set in "wanted", the peer sends compact blocks, that are
+        rebuilt like the ones relayed in "compact" mode. The hashes the peer did not send can be requested
+        again when other peers announce them.
+        """
+        election = election or self.get_election()
+        logger.info("Fetch %d blocks and %d transactions from %s", len(wanted["blocks"]), len(wanted["transactions"]), address)
+        r = self.client.post(address, election.path("/get_data"), wanted)
+        blocks, transactions = get_response_field(r, "blocks"), get_response_field(r, "transactions")
+        if blocks is None and transactions is None:
+            logger.error("Could not fetch announced data from %s", address)
+        received = set()
+        for block in blocks if isinstance(blocks, list) else []:
+            if isinstance(block, dict) and "short_ids" in block:
+                if check_compact_block(block) and block["hash"] in wanted["blocks"] and block["hash"] not in received:
+                    received.add(block["hash"])
+                    self.rebuild_compact_block(dict(block, address=address), ttl, election)
+                continue
+            if isinstance(block, dict):
+                received.add(block.get("hash"))
+            election.ingestion.add_block(block, ttl, election)
+        for transaction in transactions if isinstance(transactions, list) else []:
+            if isinstance(transaction, dict) and isinstance(transaction.get("signature"), str):
+                received.add(transaction_hash(transaction))
+            election.ingestion.add_transaction(transaction, ttl, election)
+        for h in wanted["blocks"] + wanted["transactions"]:
+            if h not in received:
+                election.requested.remove(h)
 
-    def validate_and_add_block(self, block):
+    def receive_compact_block(self, compact, ttl=None, election=None):
         """
-        Validate received block and add it to local chain
+        Rebuild block from its compact version using the transaction pool and enqueue it for validation,
+        see "rebuild_compact_block"
         """
-        self.blockchain.validate_and_add_block(block)
+        election = election or self.get_election()
+        if not check_compact_block(compact):
+            logger.info("Dropped malformed compact block")
+            return
+        if compact["hash"] in election.seen or not election.requested.add(compact["hash"]):
+            return
+        self.rebuild_compact_block(compact, ttl, election)
+
+    def rebuild_compact_block(self, compact, ttl=None, election=None):
+        """
+        Rebuild requested block from its compact version using the transaction pool and enqueue it for validation.
+        Transactions missing from the pool are requested in background to the peer in its "address".
+        """
+        election = election or self.get_election()
+        pool = {}
+        for transaction in election.blockchain.transaction_pool:
+            pool[short_transaction_id(transaction)] = transaction
+        transactions = [pool.get(short_id) for short_id in compact["short_ids"]]
+        missing = [i for i, t in enumerate(transactions) if t is None]
+        if len(missing) == 0:
+            self.add_rebuilt_block(compact, transactions, ttl, election)
+        else:
+            self.client.executor.submit(self.fetch_block_transactions, compact, transactions, missing, ttl, election)
+
+    def fetch_block_transactions(self, compact, transactions, missing, ttl=None, election=None):
+        """
+        Request the transactions missing to rebuild a compact block and enqueue it for validation
+        """
+        election = election or self.get_election()
+        logger.info("Fetch %d of %d transactions from %s", len(missing), len(transactions), compact["address"])
+        rebuilt = False
+        try:
+            r = self.client.post(compact["address"], election.path("/get_block_transactions"),
+                                 {"hash": compact["hash"], "indexes": missing})
+            fetched = get_response_field(r, "transactions")
+            if isinstance(fetched, list) and len(fetched) == len(missing):
+                for i, transaction in zip(missing, fetched):
+                    transactions[i] = transaction
+                self.add_rebuilt_block(compact, transactions, ttl, election)
+                rebuilt = True
+        finally:
+            if not rebuilt:
+                logger.error("Could not fetch block transactions from %s", compact["address"])
+                # Let other peers relay the block again
+                election.requested.remove(compact["hash"])
+
+    def add_rebuilt_block(self, compact, transactions, ttl=None, election=None):
+        """
+        Enqueue block rebuilt from its compact version for validation. If the rebuilt block does not
+        have the hash of the compact one, a short id matched another transaction of the pool,
+        so the full block is fetched from the peer instead.
+        """
+        election = election or self.get_election()
+        block = rebuild_block(compact, transactions)
+        if check_block_format(block) and get_block_hash(block) == block["hash"]:
+            election.ingestion.add_block(block, ttl, election)
+            return
+        logger.info("Rebuilt block %s does not match its hash, fetching the full block", compact["hash"][0:12])
+        self.client.executor.submit(self.fetch_data, compact["address"], {"blocks": [compact["hash"]], "transactions": []},
+                                    ttl, election)
+
+    def get_block_transactions(self, wanted, election=None):
+        """
+        Return the transactions in the given indexes of a block, used to rebuild compact blocks
+        """
+        block = (election or self.get_election()).blockchain.get_block(wanted["hash"])
+        if block is None:
+            return {"transactions": []}
+        return {"transactions": [block["data"][i] for i in wanted["indexes"] if 0 <= i < len(block["data"])]}
+
+    def get_data(self, wanted, election=None):
+        """
+        Return the blocks and transactions requested by hash that this node has.
+        With "compact" set, blocks are sent as compact blocks, the peer has most of their transactions.
+        """
+        blockchain = (election or self.get_election()).blockchain
+        data = {"blocks": [], "transactions": []}
+        for block_hash in wanted.get("blocks", []):
+            block = blockchain.get_block(block_hash)
+            if block is not None:
+                data["blocks"].append(get_compact_block(block) if wanted.get("compact") else block)
+        for t_hash in wanted.get("transactions", []):
+            transaction = blockchain.get_transaction_from_pool(t_hash)
+            if transaction is not None:
+                data["transactions"].append(transaction)
+        return data
+
+    def propagate(self, path, data, peers=None, headers=None):
+        """
+        Post data to the peers (every other peer by default) concurrently and log the result for each one
+        """
+        if peers is None:
+            peers = self.other_peers()
+        results = self.client.post_all(peers, path, data, headers=headers)
+        for address, r in results.items():
+            if r is not None and r.status_code == 200:
+                logger.debug("Sent %s to %s in %.3fs", path, address, self.client.latency[address])
+            else:
+                logger.error("Could not send %s to %s", path, address)
+
+    def receive_block(self, block, ttl=None, election=None):
+        """
+        Enqueue block received from a peer for validation, return False if the node is too busy.
+        Malformed blocks and blocks without PoW are dropped here, they never take a place in the queue.
+        """
+        election = election or self.get_election()
+        if not check_block_format(block):
+            logger.info("Dropped malformed block")
+            return True
+        return election.ingestion.add_block(block, ttl, election)
+
+    def receive_transactions(self, data, ttl=None, election=None):
+        """
+        Enqueue a transaction or a list of transactions received from a peer for validation,
+        return False if the node is too busy. A list is enqueued whole or not at all.
+        """
+        election = election or self.get_election()
+        transactions = data if isinstance(data, list) else [data]
+        return election.ingestion.add_transactions(transactions, ttl, election)
+
+    def get_tip(self):
+        """
+        Return hash and height of the last block of the default election
+        """
+        return self.get_election().get_tip()
+
+    def validate_and_add_block(self, block, ttl=None, election=None):
+        """
+        Validate received block and add it to local chain.
+        Gossiped blocks come with "ttl", the hops they can still travel, and are forwarded if valid.
+        Only accepted blocks are marked as seen, so an invalid copy reusing the hash of a real block,
+        or a block that arrived out of order, does not stop the real one later.
+        """
+        election = election or self.get_election()
+        # Data received while joining the network waits in the ingestion queue
+        self.ready.wait()
+        if not check_block_format(block):
+            logger.info("Dropped malformed block")
+            return
+        if block["hash"] in election.seen:
+            logger.debug("Block already seen, ignoring it")
+            return
+        if not election.blockchain.validate_and_add_block(block):
+            # It can be requested again, e.g. after the blocks before it arrive
+            election.requested.remove(block["hash"])
+            # A block above the local head: blocks were missed, or the node is on another fork
+            if block["height"] > election.get_tip()["height"] and get_block_hash(block) == block["hash"]:
+                logger.info("Block %s does not follow the local chain, catching up", block["hash"][0:12])
+                self.client.executor.submit(self.catch_up, election)
+            return
+        election.seen.add(block["hash"])
+        if ttl is not None:
+            with tracing.span("propagate"):
+                self.propagate_block(block, ttl, election)
         return
 
-    def validate_and_add_transaction(self, transaction):
+    def validate_and_add_transaction(self, transaction, ttl=None, election=None):
         """
-        Validate received transaction and add it to transaction pool
+        Validate received transaction and add it to transaction pool.
+        Gossiped transactions come with "ttl", the hops they can still travel, and are forwarded if valid.
+        Only valid transactions are marked as seen: the hash is the one of the signature, so a tampered
+        copy with the same signature must not stop the real transaction.
         """
-        logger.info("Transaction received: {}".format(transaction))
+        election = election or self.get_election()
+        self.ready.wait()
+        # Only the fields hashed in blocks are kept, so blocks mined with the pool are valid
+        transaction = get_canonical_transaction(transaction)
+        if transaction is None:
+            logger.info("Dropped malformed transaction")
+            return
+        logger.debug("Transaction received %s", logs.TransactionSummary(transaction))
+        t_hash = transaction_hash(transaction)
+        if t_hash in election.seen:
+            logger.debug("Transaction already seen, ignoring it")
+            return
         # First check if the signature is ok
-        if self.blockchain.validate_transaction(transaction):
+        with tracing.span("verify_signature"):
+            valid = election.blockchain.validate_transaction(transaction)
+        if valid:
             # Then check the destination address
-            logger.info("Verified signature")
-            for valid_addr in self.valid_addresses:
+            logger.debug("Verified signature")
+            for valid_addr in election.valid_addresses:
                 if transaction["addr_to"] == valid_addr["address"]:
-                    self.blockchain.add_transaction_to_pool(transaction)
-                    if len(self.sched.get_jobs()) == 0:
-                        logger.info("Start block schedule")
-                        self.sched.add_job(self.create_and_add_block, 'date',run_date=datetime.now()+timedelta(seconds=5))
+                    # Another worker may have validated the same transaction meanwhile
+                    if not election.seen.add(t_hash):
+                        return
+                    with tracing.span("add_to_pool"):
+                        election.blockchain.add_transaction_to_pool(transaction)
+                    if ttl is not None:
+                        with tracing.span("propagate"):
+                            self.propagate_transaction(transaction, ttl, election)
+                    self.schedule_block(election)
         return
 
     def add_participant_to_list(self, peer):
         """
         Receive peer advertisement and add him to the list
         """
-        if peer not in self.participant_list:
-            self.participant_list.append(peer)
+        self.peers.add(peer)
 
     def advertise(self):
         """
@@ -252,11 +921,6 @@ class PeerToPeer():
         logger.info("Advertise node to other peers")
         if len(self.participant_list) > 0:
             advertisement = {"miner_id":self.miner_id, "address": self.address}
-            for peer in self.participant_list:
-                if peer["address"] != self.address:
-                    try:
-                        requests.post("http://" + peer["address"] + "/advertise", json = advertisement)
-                    except:
-                        logger.error("Error advertising for {}".format(peer["address"]))
+            self.propagate("/advertise", advertisement)
         # Add current node to its own list
-        self.participant_list.append({"miner_id":self.miner_id, "address": self.address})
\ No newline at end of file
+        self.peers.add({"miner_id":self.miner_id, "address": self.address})
\ No newline at end of file
@@ -0,0 +1,34 @@
+from threading import Lock
+from collections import OrderedDict
+
+class SeenCache():
+    """
+    Bounded set of message ids already processed by the node, used to suppress duplicates.
+    When full, the oldest ids are forgotten first.
+    """
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.ids = OrderedDict()
+        self.lock = Lock()
+
+    def add(self, message_id):
+        """
+        Mark message as seen, return False if it was already seen before
+        """
+        with self.lock:
+            if message_id in self.ids:
+                return False
+            self.ids[message_id] = True
+            if len(self.ids) > self.maxsize:
+                self.ids.popitem(last=False)
+            return True
+
+    def remove(self, message_id):
+        """
+        Forget message id, so it can be added again
+        """
+        with self.lock:
+            self.ids.pop(message_id, None)
+
+    def __contains__(self, message_id):
+        return message_id in self.ids
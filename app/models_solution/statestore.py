@@ -0,0 +1,278 @@
+import json
+import uuid
+import sqlite3
+
+from threading import Thread, Event, local
+
+from app import logs
+from app.models_solution.voteindex import VoteIndex
+from app.models_solution.chaincache import ChainCache
+from app.models_solution.election import DEFAULT_ELECTION
+
+logger = logs.get_logger("statestore")
+
+class StateStore():
+    """
+    Node state shared between processes through a SQLite database: the chain, one row per block,
+    and the transaction pool, participant list and candidates as JSON values.
+    A single process (the writer) changes it, any number of processes read it.
+    """
+    def __init__(self, path):
+        self.path = path
+        # SQLite connections cannot be shared between threads
+        self.local = local()
+        conn = self.connection()
+        # Readers do not block the writer and see the last committed state
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS blocks (height INTEGER PRIMARY KEY, hash TEXT NOT NULL, block TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self.local.conn = conn
+        return conn
+
+    def write_blocks(self, blocks, etag):
+        """
+        Replace the blocks from the height of the first one on and set the chain ETag
+        """
+        conn = self.connection()
+        with conn:
+            if len(blocks) > 0:
+                conn.execute("DELETE FROM blocks WHERE height >= ?", (blocks[0]["height"],))
+                conn.executemany("INSERT INTO blocks VALUES (?, ?, ?)",
+                                 [(block["height"], block["hash"], json.dumps(block)) for block in blocks])
+            conn.execute("INSERT OR REPLACE INTO state VALUES ('chain_etag', ?)", (json.dumps(etag),))
+
+    def read_blocks(self, from_height=0):
+        """
+        Return the blocks from "from_height" on
+        """
+        rows = self.connection().execute("SELECT block FROM blocks WHERE height >= ? ORDER BY height", (from_height,))
+        return [json.loads(row[0]) for row in rows]
+
+    def read_hash(self, height):
+        """
+        Return hash of the block at "height", None if there is no such block
+        """
+        row = self.connection().execute("SELECT hash FROM blocks WHERE height = ?", (height,)).fetchone()
+        return row[0] if row is not None else None
+
+    def write(self, values):
+        """
+        Set several state values at once, from a dictionary
+        """
+        conn = self.connection()
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO state VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in values.items()])
+
+    def read(self, keys):
+        """
+        Return dictionary with the state values of the keys that are set
+        """
+        rows = self.connection().execute("SELECT key, value FROM state WHERE key IN ({})".format(",".join("?" * len(keys))),
+                                         list(keys))
+        return {key: json.loads(value) for key, value in rows}
+
+class StateWriter():
+    """
+    Copies the state of the node to the store every "interval" seconds, only if it changed.
+    The chain and the pool are replaced (never modified) on every change, so comparing references is enough
+    to detect changes, and only the blocks after the first one that differs are written.
+    The chain must not be pruned: readers index the votes from the stored blocks.
+    """
+    def __init__(self, store, network, interval=0.2):
+        if getattr(network.blockchain, "prune_depth", None) is not None:
+            raise ValueError("Cannot store the state of a pruned chain, readers need the transactions of every block")
+        self.store = store
+        self.network = network
+        self.interval = interval
+        self.chain = []
+        self.pool = None
+        self.peers_etag = None
+        # Pool versions are unique to this process, since the counter starts again on every restart
+        self.instance = uuid.uuid4().hex[0:8]
+        self.pool_count = 0
+        self.stopped = Event()
+
+    def start(self):
+        self.store.write({"valid_addresses": self.network.valid_addresses})
+        Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except sqlite3.Error:
+                logger.exception("Could not write the node state")
+
+    def write(self):
+        chain = self.network.blockchain.get_chain()
+        if chain is not self.chain:
+            # Find the first block that changed, usually only new blocks are appended
+            start = 0
+            while start < min(len(chain), len(self.chain)) and chain[start]["hash"] == self.chain[start]["hash"]:
+                start += 1
+            self.store.write_blocks(chain[start:], self.network.blockchain.get_etag(chain))
+            self.chain = chain
+        pool = self.network.blockchain.transaction_pool
+        if pool is not self.pool:
+            self.pool_count += 1
+            self.store.write({"pool": pool, "pool_version": "{}-{}".format(self.instance, self.pool_count)})
+            self.pool = pool
+        peers_etag = self.network.peers.get_etag()
+        if peers_etag != self.peers_etag:
+            self.store.write({"peers": self.network.participant_list, "peers_etag": peers_etag})
+            self.peers_etag = peers_etag
+
+class StoredChain():
+    """
+    Read-only copy of the chain and the transaction pool from the store,
+    with the parts of the Blockchain interface used to serve queries
+    """
+    def __init__(self):
+        self.storage = []
+        # ETag of the stored chain when it was read, to know when it changes
+        self.etag = "empty"
+        self.transaction_pool = []
+        self.pool_version = None
+        self.listeners = []
+        self.votes = VoteIndex()
+        self.serialized = ChainCache()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, data):
+        for listener in self.listeners:
+            listener(event, data)
+
+    def get_chain(self):
+        return self.storage
+
+    def get_chain_json(self, chain=None):
+        if chain is None:
+            chain = self.storage
+        return self.serialized.get_json(chain)
+
+    def get_chain_gzip(self, chain=None):
+        if chain is None:
+            chain = self.storage
+        return self.serialized.get_gzip(chain)
+
+    def get_etag(self, chain=None):
+        if chain is None:
+            chain = self.storage
+        if len(chain) == 0:
+            return "empty"
+        return chain[-1]["hash"]
+
+    def get_pool_age(self):
+        return 0
+
+class StoredPeers():
+    """
+    Read-only copy of the participant list from the store
+    """
+    def __init__(self):
+        self.peers = []
+        self.etag = "empty"
+
+    def get_list(self):
+        return self.peers
+
+    def get_etag(self):
+        return self.etag
+
+class ReadOnlyNode():
+    """
+    Node that serves queries from the state written by another process, without taking part in the network.
+    The state is refreshed in background every "interval" seconds, so requests are answered from memory.
+    Listeners of "blockchain" are notified of the new blocks and pool transactions, like in the writer.
+    Only the default election is stored, the other elections are served by the writer.
+    """
+    def __init__(self, store, interval=0.2):
+        self.store = store
+        self.interval = interval
+        self.blockchain = StoredChain()
+        self.peers = StoredPeers()
+        self.valid_addresses = []
+        # Ready once the state was read for the first time
+        self.ready = Event()
+        self.stopped = Event()
+
+    @property
+    def participant_list(self):
+        return self.peers.get_list()
+
+    def get_election(self, election_id=None):
+        """
+        Return the node itself for the default election, None for the others
+        """
+        return self if election_id in (None, DEFAULT_ELECTION) else None
+
+    def get_tip(self):
+        chain = self.blockchain.get_chain()
+        if len(chain) == 0:
+            return {"hash": None, "height": -1}
+        return {"hash": chain[-1]["hash"], "height": chain[-1]["height"]}
+
+    def start(self):
+        Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while True:
+            try:
+                self.refresh()
+                self.ready.set()
+            except sqlite3.Error:
+                logger.exception("Could not read the node state")
+            if self.stopped.wait(self.interval):
+                return
+
+    def refresh(self):
+        """
+        Read the parts of the state that changed since the last refresh
+        """
+        state = self.store.read(["chain_etag", "pool_version", "peers_etag"])
+        if len(self.valid_addresses) == 0:
+            self.valid_addresses = self.store.read(["valid_addresses"]).get("valid_addresses", [])
+        if state.get("chain_etag", "empty") != self.blockchain.etag:
+            self.refresh_chain(state["chain_etag"])
+        if state.get("pool_version") != self.blockchain.pool_version:
+            pool = self.store.read(["pool"]).get("pool", [])
+            known = set(t["signature"] for t in self.blockchain.transaction_pool)
+            self.blockchain.transaction_pool = pool
+            self.blockchain.pool_version = state.get("pool_version")
+            for transaction in pool:
+                if transaction["signature"] not in known:
+                    self.blockchain.notify("transaction", transaction)
+        if state.get("peers_etag", "empty") != self.peers.etag:
+            self.peers.peers = self.store.read(["peers"]).get("peers", [])
+            self.peers.etag = state["peers_etag"]
+
+    def refresh_chain(self, etag):
+        chain = self.blockchain.storage
+        # Read only the new blocks when the cached tip is still in the stored chain
+        if len(chain) > 0 and self.store.read_hash(chain[-1]["height"]) == chain[-1]["hash"]:
+            new_blocks = self.store.read_blocks(chain[-1]["height"] + 1)
+            chain = chain + new_blocks
+        else:
+            chain = self.store.read_blocks()
+            new_blocks = chain
+        self.blockchain.votes.update(chain)
+        self.blockchain.serialized.update(chain)
+        self.blockchain.storage = chain
+        self.blockchain.etag = etag
+        for block in new_blocks:
+            self.blockchain.notify("block", block)
@@ -1,16 +1,16 @@
-import sys
-import logging
-
 from Crypto.Signature import PKCS1_v1_5
 from Crypto.PublicKey import RSA
 from Crypto.Hash import SHA256
 from base64 import b64encode, b64decode
 from collections import OrderedDict
 
+from app import logs
+
 # Log configuration
-logging.basicConfig(format = "%(asctime)-15s %(message)s", stream=sys.stdout)
-logger = logging.getLogger("blockchain_logger")
-logger.setLevel(logging.DEBUG)
+logger = logs.get_logger("transaction")
+
+# Fields of a signed transaction, in the order they are hashed in blocks
+TRANSACTION_FIELDS = ["addr_from", "addr_to", "signature", "pubkey"]
 
 class Transaction():
     """
@@ -54,4 +54,27 @@ class Transaction():
         ordered_json = self.get_json()
         ordered_json["signature"] = self.signature
         ordered_json["pubkey"] = pubkey
-        return ordered_json
\ No newline at end of file
+        return ordered_json
+
+def get_canonical_transaction(transaction):
+    """
+    Return the signed transaction (in JSON format) with only its fields, in order, as blocks hash it.
+    None if it is not an object or a field is missing or not a string.
+    """
+    if not isinstance(transaction, dict):
+        return None
+    if not all(isinstance(transaction.get(field), str) for field in TRANSACTION_FIELDS):
+        return None
+    return OrderedDict((field, transaction[field]) for field in TRANSACTION_FIELDS)
+
+def transaction_hash(transaction):
+    """
+    Return the hash that identifies a signed transaction (in JSON format) on the network
+    """
+    return SHA256.new(transaction["signature"].encode()).hexdigest()
+
+def short_transaction_id(transaction):
+    """
+    Return the short id used to reference a signed transaction in compact blocks
+    """
+    return transaction_hash(transaction)[0:12]
\ No newline at end of file
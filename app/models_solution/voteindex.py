@@ -0,0 +1,74 @@
+class VoteIndex():
+    """
+    Indexes of the votes in a chain: candidate address to its voters, in chain order, and voter address
+    to its vote. It follows the chain incrementally, see "update", and must be changed by one thread at a time.
+    The votes of pruned blocks stay in the indexes, without their signatures, see "prune_block".
+    """
+    def __init__(self):
+        # Chain the indexes were built from
+        self.chain = []
+        self.candidates = {}
+        self.voters = {}
+
+    def update(self, chain):
+        """
+        Index "chain", only the blocks that changed since the last update, found comparing hashes from the tip.
+        A pruned block is the same block as the full one it replaced.
+        """
+        start = min(len(chain), len(self.chain))
+        while start > 0 and chain[start - 1]["hash"] != self.chain[start - 1]["hash"]:
+            start -= 1
+        if any(block.get("pruned", False) for block in self.chain[start:]):
+            # The votes of pruned blocks cannot be removed one by one, index the whole chain again
+            self.candidates = {}
+            self.voters = {}
+            start = 0
+        else:
+            for block in reversed(self.chain[start:]):
+                self.remove_block(block)
+        for block in chain[start:]:
+            self.add_block(block)
+        self.chain = chain
+
+    def add_block(self, block):
+        for transaction in block["data"]:
+            self.candidates.setdefault(transaction["addr_to"], []).append(
+                {"addr_from": transaction["addr_from"], "height": block["height"]})
+            self.voters[transaction["addr_from"]] = {"height": block["height"], "hash": block["hash"],
+                                                     "transaction": transaction}
+
+    def remove_block(self, block):
+        # The block is the last indexed one, so its votes are at the end of the lists
+        for transaction in reversed(block["data"]):
+            self.candidates[transaction["addr_to"]].pop()
+            if self.voters.get(transaction["addr_from"], {}).get("hash") == block["hash"]:
+                del self.voters[transaction["addr_from"]]
+
+    def prune_block(self, block):
+        """
+        Keep only the voter and the candidate of the votes of a block that is being pruned
+        """
+        for transaction in block["data"]:
+            vote = self.voters.get(transaction["addr_from"])
+            if vote is not None and vote["hash"] == block["hash"]:
+                vote["transaction"] = {"addr_from": transaction["addr_from"], "addr_to": transaction["addr_to"]}
+
+    def covers(self, chain):
+        """
+        Return True if "chain" is the indexed chain or a prefix of it
+        """
+        return len(chain) <= len(self.chain) and (len(chain) == 0 or chain[-1]["hash"] == self.chain[len(chain) - 1]["hash"])
+
+    def get_votes(self, candidate, offset=0, limit=None):
+        """
+        Return the total votes of the candidate and the voters from "offset", at most "limit" of them
+        """
+        votes = self.candidates.get(candidate, [])
+        end = len(votes) if limit is None else offset + limit
+        return len(votes), votes[offset:end]
+
+    def get_vote(self, voter):
+        """
+        Return the vote of the voter, with the height and hash of its block, None if it did not vote
+        """
+        return self.voters.get(voter)
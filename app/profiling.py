@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import pstats
+import cProfile
+import tempfile
+import threading
+
+from collections import Counter
+
+from app import logs
+
+logger = logs.get_logger("profiling")
+
+# Shortest interval between samples, shorter ones would keep the sampler thread busy
+MIN_SAMPLE_INTERVAL = 0.001
+
+class SamplingProfiler():
+    """
+    Wall-clock sampling profiler of all the threads of the process (request handlers, ingestion workers,
+    the scheduler that mines blocks...). Every "interval" seconds it records the stack of each thread.
+    The result is in folded stacks format, one "thread;outer function;...;inner function count" line
+    per stack, that flame graph viewers (speedscope, flamegraph.pl) read.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.samples = Counter()
+        self.started = None
+        self.duration = None
+
+    def start(self, interval=0.005):
+        """
+        Start a new profile, return False if one is already running
+        """
+        with self.lock:
+            if self.thread is not None:
+                return False
+            self.samples = Counter()
+            self.stopped.clear()
+            self.started = time.time()
+            self.duration = None
+            self.thread = threading.Thread(target=self.run, args=(interval,), daemon=True, name="profiler")
+            self.thread.start()
+        logger.info("Sampling profiler started, interval %.3fs", interval)
+        return True
+
+    def stop(self):
+        """
+        Stop the profile, return False if none was running
+        """
+        with self.lock:
+            if self.thread is None:
+                return False
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+            self.duration = time.time() - self.started
+        logger.info("Sampling profiler stopped after %.1fs", self.duration)
+        return True
+
+    def run(self, interval):
+        own = threading.get_ident()
+        while not self.stopped.wait(interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != own:
+                    self.samples[self.fold(names.get(ident, str(ident)), frame)] += 1
+
+    def fold(self, thread_name, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+            frame = frame.f_back
+        stack.append(thread_name)
+        return ";".join(reversed(stack))
+
+    def get_folded(self):
+        """
+        Return the samples of the last profile, or the current one so far, in folded stacks format
+        """
+        samples = sorted(list(self.samples.items()), key=lambda item: item[1], reverse=True)
+        return "".join("{} {}\n".format(stack, count) for stack, count in samples)
+
+class RequestProfiler():
+    """
+    cProfile of the next request to a path, armed with "arm". Only the thread handling the request is profiled.
+    The result is saved in the pstats format, read by pstats, snakeviz or gprof2dot.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        # File with the last result
+        self.result = None
+
+    def arm(self, path):
+        """
+        Profile the next request to "path"
+        """
+        with self.lock:
+            self.path = path
+        logger.info("Profiling next request to %s", path)
+
+    def begin(self, path):
+        """
+        Start profiling if the request is to the armed path, return the profile or None
+        """
+        if self.path != path:
+            return None
+        with self.lock:
+            if self.path != path:
+                return None
+            self.path = None
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def end(self, profile):
+        """
+        Stop profiling the request and keep the result to download it
+        """
+        profile.disable()
+        fd, filename = tempfile.mkstemp(suffix=".pstats")
+        os.close(fd)
+        pstats.Stats(profile).dump_stats(filename)
+        with self.lock:
+            if self.result is not None:
+                os.remove(self.result)
+            self.result = filename
@@ -0,0 +1,65 @@
+import os
+
+# Node configuration, read from environment variables so it can be set in "run.sh"
+
+# Address other peers use to reach this node
+NODE_ADDRESS = os.environ.get("BLOCKCHAIN_ADDRESS", "localhost:5000")
+
+# Number of random peers each message is forwarded to. When not set, messages are sent to every peer
+GOSSIP_FANOUT = int(os.environ["BLOCKCHAIN_GOSSIP_FANOUT"]) if "BLOCKCHAIN_GOSSIP_FANOUT" in os.environ else None
+# Number of hops a gossip message can travel before it stops being forwarded
+GOSSIP_TTL = int(os.environ.get("BLOCKCHAIN_GOSSIP_TTL", 6))
+
+# How blocks and transactions are relayed: "push" sends the data itself, "announce" sends
+# only the hashes and lets peers fetch the data they don't have yet, "compact" pushes transactions
+# but sends blocks with short transaction ids, rebuilt by peers from their transaction pool
+RELAY_MODE = os.environ.get("BLOCKCHAIN_RELAY_MODE", "push")
+
+# "node" runs a complete node. To serve queries from several processes, run one "writer", a complete node
+# that also saves its state in STATE_DB, and any number of "reader" processes, that serve queries from
+# STATE_DB and redirect everything else to the writer, at NODE_ADDRESS
+ROLE = os.environ.get("BLOCKCHAIN_ROLE", "node")
+# SQLite database shared by the writer and the readers
+STATE_DB = os.environ.get("BLOCKCHAIN_STATE_DB", "state.db")
+
+# When blocks are created: "wait" creates a block BLOCK_MAX_WAIT seconds after the oldest transaction in the pool
+# arrived, or right away when the pool has BLOCK_THRESHOLD transactions (if set). "continuous" creates blocks one
+# after the other while the pool has transactions
+BLOCK_POLICY = os.environ.get("BLOCKCHAIN_BLOCK_POLICY", "wait")
+BLOCK_THRESHOLD = int(os.environ["BLOCKCHAIN_BLOCK_THRESHOLD"]) if "BLOCKCHAIN_BLOCK_THRESHOLD" in os.environ else None
+BLOCK_MAX_WAIT = float(os.environ.get("BLOCKCHAIN_BLOCK_MAX_WAIT", 5))
+
+# Blocks older than the last PRUNE_DEPTH keep only their header, the votes stay in the indexes.
+# Not set by default: the node keeps the whole chain and can be the source of new nodes.
+# Ignored with the writer role, since readers need the whole chain
+PRUNE_DEPTH = int(os.environ["BLOCKCHAIN_PRUNE_DEPTH"]) if "BLOCKCHAIN_PRUNE_DEPTH" in os.environ else None
+
+# Maximum number of elections hosted by the node, the default election included
+MAX_ELECTIONS = int(os.environ.get("BLOCKCHAIN_MAX_ELECTIONS", 16))
+
+# Token of the admin endpoints (profiling), sent as "Authorization: Bearer <token>". They are disabled when not set
+ADMIN_TOKEN = os.environ.get("BLOCKCHAIN_ADMIN_TOKEN")
+
+# Peers are evicted after this number of consecutive failed requests
+PEER_MAX_FAILURES = int(os.environ.get("BLOCKCHAIN_PEER_MAX_FAILURES", 3))
+# Interval in seconds between liveness probes of the peers
+PEER_PROBE_INTERVAL = int(os.environ.get("BLOCKCHAIN_PEER_PROBE_INTERVAL", 30))
+
+# Interval in seconds between comparisons of the chain with the tips of the peers, to catch up missed blocks
+SYNC_INTERVAL = float(os.environ.get("BLOCKCHAIN_SYNC_INTERVAL", 10))
+
+# Seconds outgoing transactions are buffered to be sent in a single batch, 0 sends them right away.
+# All the peers must support batches on "/update_pool" to enable it
+BATCH_WINDOW = float(os.environ.get("BLOCKCHAIN_BATCH_WINDOW", 0))
+# Maximum number of transactions in a batch, a full batch is sent before the window ends
+BATCH_SIZE = int(os.environ.get("BLOCKCHAIN_BATCH_SIZE", 100))
+
+# Log level of all the components: DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.environ.get("BLOCKCHAIN_LOG_LEVEL", "INFO")
+# Log level of single components, overriding LOG_LEVEL, e.g. "peertopeer=DEBUG,blockchain=WARNING"
+LOG_LEVELS = os.environ.get("BLOCKCHAIN_LOG_LEVELS", "")
+
+# Fraction of the requests traced, the traces are exported on "/traces"
+TRACE_SAMPLE_RATE = float(os.environ.get("BLOCKCHAIN_TRACE_SAMPLE_RATE", 0.1))
+# Traced requests slower than this, in seconds, are logged
+SLOW_TRACE_SECONDS = float(os.environ.get("BLOCKCHAIN_SLOW_TRACE_SECONDS", 0.5))
@@ -0,0 +1,160 @@
+import json
+import time
+import uuid
+import random
+import functools
+import threading
+
+from collections import deque
+from contextlib import contextmanager
+
+from app import logs
+
+# Log configuration
+logger = logs.get_logger("tracing")
+
+# Fraction of the requests traced
+sample_rate = 0.1
+# Traces slower than this, in seconds, are logged
+slow_seconds = 0.5
+# Last finished traces, exported on "/traces"
+RECENT = deque(maxlen=200)
+
+# Trace of the request being handled by each thread
+local = threading.local()
+
+class Trace():
+    """
+    Timing of the stages (spans) of a request. Spans are timed relative to the trace start
+    and keep their nesting depth.
+    """
+    def __init__(self, name, parent_id=None, start=None):
+        self.id = uuid.uuid4().hex[0:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.timestamp = time.time()
+        self.start = start if start is not None else time.perf_counter()
+        self.duration = None
+        self.depth = 0
+        self.spans = []
+
+    def add_span(self, name, start, end, depth=None):
+        self.spans.append({"name": name,
+                           "start_ms": round((start - self.start) * 1000, 3),
+                           "duration_ms": round((end - start) * 1000, 3),
+                           "depth": self.depth if depth is None else depth})
+
+    def get_json(self):
+        return {"id": self.id, "parent_id": self.parent_id, "name": self.name, "timestamp": self.timestamp,
+                "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+                "spans": self.spans}
+
+class Span():
+    """
+    Context manager that adds a span to the trace with the time spent inside it
+    """
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        self.trace.depth -= 1
+        self.trace.add_span(self.name, self.start, end, self.depth)
+
+class NullSpan():
+    """
+    Span used when the request is not traced, does nothing
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+NULL_SPAN = NullSpan()
+
+def configure(rate, slow):
+    """
+    Set the sample rate and the slow trace threshold
+    """
+    global sample_rate, slow_seconds
+    sample_rate = rate
+    slow_seconds = slow
+
+def current():
+    """
+    Return trace of the current thread, None if the request is not traced
+    """
+    return getattr(local, "trace", None)
+
+def span(name):
+    """
+    Return context manager that times a stage of the current trace
+    """
+    trace = current()
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name)
+
+def add_span(name, start, end):
+    """
+    Add span measured by the caller with time.perf_counter() to the current trace
+    """
+    trace = current()
+    if trace is not None:
+        trace.add_span(name, start, end)
+
+@contextmanager
+def trace(name, parent_id=None, sampled=None, start=None):
+    """
+    Trace the code inside the context as a request called "name".
+    When "sampled" is None the request is traced with probability "sample_rate".
+    "start" is the time (from time.perf_counter()) the request started, defaults to now.
+    """
+    if sampled is None:
+        sampled = random.random() < sample_rate
+    if not sampled:
+        yield None
+        return
+    new_trace = Trace(name, parent_id, start)
+    previous = current()
+    local.trace = new_trace
+    try:
+        yield new_trace
+    finally:
+        local.trace = previous
+        finish(new_trace)
+
+def traced(name):
+    """
+    Decorator that traces each call to the function as a request called "name"
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with trace(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def finish(finished):
+    """
+    Store finished trace and log it if it was slow
+    """
+    finished.duration = time.perf_counter() - finished.start
+    RECENT.append(finished)
+    if finished.duration > slow_seconds:
+        logger.warning("Slow request %s", json.dumps(finished.get_json()))
+
+def recent():
+    """
+    Return the last finished traces as JSON, the most recent first
+    """
+    return [t.get_json() for t in reversed(list(RECENT))]
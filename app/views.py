@@ -1,25 +1,236 @@
-from flask import request, jsonify, render_template, redirect
+import hmac
+import functools
+
+from flask import request, jsonify, render_template, redirect, Response, g, abort, make_response
 from app import app
-from app.models_solution.peertopeer import PeerToPeer
+from app import settings
+from app import logs
+from app import events
+from app import metrics
+from app import tracing
+from app import profiling
+from app.models_solution.peertopeer import PeerToPeer, TTL_HEADER
+from app.models_solution.statestore import StateStore, StateWriter, ReadOnlyNode
+from app.models_solution.election import check_election
+
+logs.configure(settings.LOG_LEVEL, logs.parse_levels(settings.LOG_LEVELS))
+logger = logs.get_logger("views")
+
+prune_depth = settings.PRUNE_DEPTH
+if settings.ROLE == "writer" and prune_depth is not None:
+    # Readers index the votes from the stored blocks, they need the transactions of every block
+    logger.warning("Pruning is not supported with the writer role, keeping the whole chain")
+    prune_depth = None
+
+if settings.ROLE == "reader":
+    network = ReadOnlyNode(StateStore(settings.STATE_DB))
+else:
+    network = PeerToPeer(settings.NODE_ADDRESS, gossip_fanout=settings.GOSSIP_FANOUT, gossip_ttl=settings.GOSSIP_TTL,
+                         relay_mode=settings.RELAY_MODE, peer_max_failures=settings.PEER_MAX_FAILURES,
+                         peer_probe_interval=settings.PEER_PROBE_INTERVAL, batch_window=settings.BATCH_WINDOW,
+                         batch_size=settings.BATCH_SIZE, prune_depth=prune_depth,
+                         block_policy=settings.BLOCK_POLICY, block_threshold=settings.BLOCK_THRESHOLD,
+                         block_max_wait=settings.BLOCK_MAX_WAIT, max_elections=settings.MAX_ELECTIONS,
+                         sync_interval=settings.SYNC_INTERVAL)
+    if settings.ROLE == "writer":
+        StateWriter(StateStore(settings.STATE_DB), network).start()
+network.start()
+
+tracing.configure(settings.TRACE_SAMPLE_RATE, settings.SLOW_TRACE_SECONDS)
+
+metrics.CHAIN_HEIGHT.set_function(lambda: network.get_tip()["height"])
+metrics.POOL_SIZE.set_function(lambda: len(network.blockchain.transaction_pool))
+metrics.POOL_AGE_SECONDS.set_function(network.blockchain.get_pool_age)
+
+broker = events.EventBroker()
+
+def publish_change(event, data):
+    """Push changes of the chain and the pool to the clients of "/events" """
+    if event == "block":
+        votes = [{"addr_from": t["addr_from"], "addr_to": t["addr_to"]} for t in data["data"]]
+        tally = {}
+        for vote in votes:
+            tally[vote["addr_to"]] = tally.get(vote["addr_to"], 0) + 1
+        broker.publish("block", {"height": data["height"], "hash": data["hash"], "votes": votes, "tally": tally})
+        broker.publish("pool_remove", {"addr_from": [vote["addr_from"] for vote in votes]})
+    elif event == "transaction":
+        broker.publish("pool_add", {"addr_from": data["addr_from"], "addr_to": data["addr_to"]})
+
+network.blockchain.add_listener(publish_change)
+
+# Endpoints served by "reader" processes, the rest are redirected to the writer
+READ_ENDPOINTS = set(["index", "get_miner_list", "ping", "get_metrics", "ready", "get_tip", "get_blockchain",
+                      "get_candidate_votes", "get_voter", "get_events", "get_traces", "static", "start_profile",
+                      "stop_profile", "get_profile", "profile_request", "get_request_profile"])
+
+# Suffix of the ETag of gzip compressed responses
+GZIP_ETAG_SUFFIX = "-gzip"
+
+# Maximum votes returned in a page of "/votes"
+MAX_PAGE_SIZE = 1000
+
+@app.before_request
+def redirect_to_writer():
+    """Redirect requests that change the state to the writer, when running as reader"""
+    if settings.ROLE == "reader" and request.endpoint not in READ_ENDPOINTS:
+        return redirect("http://" + settings.NODE_ADDRESS + request.full_path.rstrip("?"), code=307)
+
+sampling_profiler = profiling.SamplingProfiler()
+request_profiler = profiling.RequestProfiler()
 
-network = PeerToPeer("localhost:5000")
+@app.before_request
+def begin_request_profile():
+    """Profile the request if the request profiler is armed for its path"""
+    g.profile = request_profiler.begin(request.path)
+
+@app.teardown_request
+def end_request_profile(exception):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        request_profiler.end(profile)
+
+def admin_only(function):
+    """Decorator of the admin endpoints: 404 if they are disabled, 401 without the admin token"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if settings.ADMIN_TOKEN is None:
+            return jsonify({"status": "not found"}), 404
+        if not hmac.compare_digest(request.headers.get("Authorization", ""), "Bearer " + settings.ADMIN_TOKEN):
+            return jsonify({"status": "unauthorized"}), 401
+        return function(*args, **kwargs)
+    return wrapper
+
+def attachment(data, filename, mimetype):
+    """Return response that downloads the data as a file"""
+    return Response(data, mimetype=mimetype, headers={"Content-Disposition": "attachment; filename=" + filename})
+
+def get_election(election_id):
+    """Return the election of the request, the default one without election id. 404 if the node does not host it"""
+    election = network.get_election(election_id)
+    if election is None:
+        abort(make_response(jsonify({"status": "unknown election"}), 404))
+    return election
+
+def get_gossip_ttl():
+    """Return hops left for the received gossip message, None if it is not gossip. 400 if it is not a number"""
+    ttl = request.headers.get(TTL_HEADER)
+    if ttl is None:
+        return None
+    try:
+        return int(ttl)
+    except ValueError:
+        abort(make_response(jsonify({"status": "invalid " + TTL_HEADER}), 400))
+
+def conditional_response(etag, get_data, get_gzip=None):
+    """
+    Return 304 if the client already has the data with the ETag, otherwise the data from "get_data" as JSON.
+    "get_data" can return JSON bytes, sent as they are. With "get_gzip", clients that accept gzip get the
+    compressed JSON bytes it returns, with the ETag plus "-gzip". Both ETags get a 304, they name the same data.
+    """
+    compressed = get_gzip is not None and "gzip" in request.accept_encodings
+    if request.if_none_match.contains(etag) or (compressed and request.if_none_match.contains(etag + GZIP_ETAG_SUFFIX)):
+        response = Response(status=304)
+    elif compressed:
+        response = Response(get_gzip(), mimetype="application/json", headers={"Content-Encoding": "gzip"})
+    else:
+        data = get_data()
+        response = Response(data, mimetype="application/json") if isinstance(data, bytes) else jsonify(data)
+    response.set_etag(etag + GZIP_ETAG_SUFFIX if compressed else etag)
+    if get_gzip is not None:
+        response.vary.add("Accept-Encoding")
+    return response
 
 @app.route("/")
 @app.route("/status")
 def index():
     return render_template("status.html", blockchain=network)
 
+@app.route("/events")
+def get_events():
+    """Stream of changes to the chain and the pool, as Server-Sent Events"""
+    client = broker.subscribe()
+    return Response(broker.stream(client), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/cast_vote", methods=["POST"])
-def cast_vote():
+@app.route("/elections/<election_id>/cast_vote", methods=["POST"])
+@tracing.traced("POST /cast_vote")
+def cast_vote(election_id=None):
+    election = get_election(election_id)
+    if not network.ready.is_set():
+        return jsonify({"status": "starting"}), 503
     if request.form is not None:
-        print("Cast vote to {}".format(request.form["vote_addr"]))
-        network.create_and_add_transaction(request.form["vote_addr"])
+        logger.info("Cast vote to %s", request.form["vote_addr"])
+        network.create_and_add_transaction(request.form["vote_addr"], election)
     return redirect("/status")
 
+@app.route("/elections")
+def elections():
+    """List the elections hosted by the node"""
+    return jsonify(network.get_elections())
+
+@app.route("/elections", methods=["POST"])
+@admin_only
+def create_election():
+    """
+    Start a new election with the description in the JSON body,
+    e.g. {"id": "city-council", "candidates": [{"name": "Candidate 1", "address": "12345"}]}
+    """
+    received_data = request.get_json(silent=True)
+    if not check_election(received_data):
+        return jsonify({"status": "invalid election"}), 400
+    if not network.ready.is_set():
+        return jsonify({"status": "starting"}), 503
+    try:
+        election = network.create_election(received_data["id"], received_data["candidates"])
+    except ValueError as e:
+        return jsonify({"status": str(e)}), 409
+    if election is None:
+        return jsonify({"status": "already exists"}), 409
+    return jsonify({"status": "created"}), 201
+
+@app.route("/announce_election", methods=["POST"])
+def announce_election():
+    """Peers announce their new elections here, with the "address" of the peer"""
+    received_data = request.get_json(silent=True)
+    if not check_election(received_data) or not isinstance(received_data.get("address"), str):
+        return jsonify({"status": "invalid election"}), 400
+    if not network.receive_election(received_data):
+        return jsonify({"status": "refused"}), 403
+    return jsonify({"status": "ok"})
+
 @app.route("/list")
 def get_miner_list():
     """Return list of miners advertised to this node"""
-    return jsonify(network.participant_list)
+    return conditional_response(network.peers.get_etag(), lambda: network.participant_list)
+
+@app.route("/ping")
+def ping():
+    """Liveness probe used by peers"""
+    return jsonify({"status": "ok"})
+
+@app.route("/metrics")
+def get_metrics():
+    """Node metrics in Prometheus text format"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4")
+
+@app.route("/traces")
+def get_traces():
+    """Last sampled request traces, the most recent first"""
+    return jsonify(tracing.recent())
+
+@app.route("/ready")
+def ready():
+    """Readiness probe, the node is ready after synchronizing the blockchain"""
+    if not network.ready.is_set():
+        return jsonify({"ready": False}), 503
+    return jsonify({"ready": True})
+
+@app.route("/tip")
+@app.route("/elections/<election_id>/tip")
+def get_tip(election_id=None):
+    """Return hash and height of the last block"""
+    return jsonify(get_election(election_id).get_tip())
 
 @app.route("/advertise", methods=["POST"])
 def advertise():
@@ -30,24 +241,148 @@ def advertise():
     return jsonify({"status": "ok"})
 
 @app.route("/blockchain")
-def get_blockchain():
+@app.route("/elections/<election_id>/blockchain")
+def get_blockchain(election_id=None):
     """Return current blockchain"""
-    return jsonify(network.blockchain.get_chain())
+    blockchain = get_election(election_id).blockchain
+    chain = blockchain.get_chain()
+    return conditional_response(blockchain.get_etag(chain), lambda: blockchain.get_chain_json(chain),
+                                lambda: blockchain.get_chain_gzip(chain))
 
-@app.route("/update_pool", methods=["POST"])
-def add_transaction():
-    """Update transaction pool"""
+@app.route("/admin/profile/start", methods=["POST"])
+@admin_only
+def start_profile():
+    """Start sampling the stacks of all the threads, every "interval" seconds"""
+    interval = request.args.get("interval", 0.005, type=float)
+    # NaN fails every comparison
+    if not profiling.MIN_SAMPLE_INTERVAL <= interval < float("inf"):
+        return jsonify({"status": "interval must be at least {}".format(profiling.MIN_SAMPLE_INTERVAL)}), 400
+    if not sampling_profiler.start(interval):
+        return jsonify({"status": "already running"}), 409
+    return jsonify({"status": "started"})
+
+@app.route("/admin/profile/stop", methods=["POST"])
+@admin_only
+def stop_profile():
+    """Stop sampling, the profile is downloaded from "/admin/profile" """
+    if not sampling_profiler.stop():
+        return jsonify({"status": "not running"}), 409
+    return jsonify({"status": "stopped", "seconds": sampling_profiler.duration,
+                    "samples": sum(sampling_profiler.samples.values())})
+
+@app.route("/admin/profile")
+@admin_only
+def get_profile():
+    """Download the last sampling profile in folded stacks format"""
+    return attachment(sampling_profiler.get_folded(), "profile.folded", "text/plain")
+
+@app.route("/admin/profile/request", methods=["POST"])
+@admin_only
+def profile_request():
+    """Profile the next request to the path in the JSON body, e.g. {"path": "/blockchain"}"""
     received_data = request.get_json()
+    if received_data is None or "path" not in received_data:
+        return jsonify({"status": "missing path"}), 400
+    request_profiler.arm(received_data["path"])
+    return jsonify({"status": "armed"})
+
+@app.route("/admin/profile/request")
+@admin_only
+def get_request_profile():
+    """Download the profile of the last profiled request, in pstats format"""
+    if request_profiler.result is None:
+        return jsonify({"status": "no profile"}), 404
+    with open(request_profiler.result, "rb") as f:
+        return attachment(f.read(), "request.pstats", "application/octet-stream")
+
+@app.route("/votes/<candidate>")
+@app.route("/elections/<election_id>/votes/<candidate>")
+def get_candidate_votes(candidate, election_id=None):
+    """Return a page of the voters of the candidate, in chain order, and the total votes"""
+    blockchain = get_election(election_id).blockchain
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = min(MAX_PAGE_SIZE, max(1, request.args.get("limit", 100, type=int)))
+    total, votes = blockchain.votes.get_votes(candidate, offset, limit)
+    return jsonify({"candidate": candidate, "total": total, "offset": offset, "limit": limit, "votes": votes})
+
+@app.route("/voter/<voter>")
+@app.route("/elections/<election_id>/voter/<voter>")
+def get_voter(voter, election_id=None):
+    """Return the vote of the voter in the chain and the block it is in"""
+    vote = get_election(election_id).blockchain.votes.get_vote(voter)
+    if vote is None:
+        return jsonify({"voter": voter, "voted": False}), 404
+    return jsonify({"voter": voter, "voted": True, "height": vote["height"], "hash": vote["hash"],
+                    "transaction": vote["transaction"]})
+
+@app.route("/update_pool", methods=["POST"])
+@app.route("/elections/<election_id>/update_pool", methods=["POST"])
+@tracing.traced("POST /update_pool")
+def add_transaction(election_id=None):
+    """Update transaction pool, with a single transaction or a batch of them"""
+    election = get_election(election_id)
+    with tracing.span("parse_json"):
+        received_data = request.get_json()
     if received_data is not None:
-        print("Received Pool {}".format(received_data))
-        network.validate_and_add_transaction(received_data)
-    return redirect("/status")
+        logger.debug("Received %d transactions", len(received_data) if isinstance(received_data, list) else 1)
+        with tracing.span("enqueue"):
+            queued = network.receive_transactions(received_data, get_gossip_ttl(), election)
+        if not queued:
+            return jsonify({"status": "busy"}), 503
+    return jsonify({"status": "ok"})
 
 @app.route("/add_new_block", methods=["POST"])
-def add_block():
+@app.route("/elections/<election_id>/add_new_block", methods=["POST"])
+@tracing.traced("POST /add_new_block")
+def add_block(election_id=None):
     """Add block to chain"""
-    received_data = request.get_json()
+    election = get_election(election_id)
+    with tracing.span("parse_json"):
+        received_data = request.get_json()
     if request.json is not None:
-        print("Received Block {}".format(received_data))
-        network.validate_and_add_block(received_data)
+        logger.debug("Received block %s", logs.BlockSummary(received_data))
+        with tracing.span("enqueue"):
+            queued = network.receive_block(received_data, get_gossip_ttl(), election)
+        if not queued:
+            return jsonify({"status": "busy"}), 503
     return jsonify({"status": "ok"})
+
+@app.route("/inventory", methods=["POST"])
+@app.route("/elections/<election_id>/inventory", methods=["POST"])
+def receive_inventory(election_id=None):
+    """Receive hashes of blocks and transactions announced by a peer"""
+    election = get_election(election_id)
+    received_data = request.get_json()
+    if received_data is not None:
+        network.receive_inventory(received_data, get_gossip_ttl(), election)
+    return jsonify({"status": "ok"})
+
+@app.route("/get_data", methods=["POST"])
+@app.route("/elections/<election_id>/get_data", methods=["POST"])
+def get_data(election_id=None):
+    """Return blocks and transactions requested by hash"""
+    election = get_election(election_id)
+    received_data = request.get_json()
+    if received_data is None:
+        return jsonify({"blocks": [], "transactions": []})
+    return jsonify(network.get_data(received_data, election))
+
+@app.route("/compact_block", methods=["POST"])
+@app.route("/elections/<election_id>/compact_block", methods=["POST"])
+def add_compact_block(election_id=None):
+    """Rebuild block from short transaction ids and add it to chain"""
+    election = get_election(election_id)
+    received_data = request.get_json()
+    if received_data is not None:
+        network.receive_compact_block(received_data, get_gossip_ttl(), election)
+    return jsonify({"status": "ok"})
+
+@app.route("/get_block_transactions", methods=["POST"])
+@app.route("/elections/<election_id>/get_block_transactions", methods=["POST"])
+def get_block_transactions(election_id=None):
+    """Return transactions of a block by index"""
+    election = get_election(election_id)
+    received_data = request.get_json()
+    if received_data is None:
+        return jsonify({"transactions": []})
+    return jsonify(network.get_block_transactions(received_data, election))
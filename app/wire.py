@@ -0,0 +1,106 @@
+import gzip
+import json
+import zlib
+
+from io import BytesIO
+from flask import request
+
+# Header a node adds to every response to tell peers which request encodings it accepts
+ACCEPT_HEADER = "X-Accept-Encoding"
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+COMPRESS_LEVEL = 6
+# Largest request body accepted, after decompressing it
+MAX_REQUEST_SIZE = 16 * 1024 * 1024
+
+def encode_json(data, compress=False):
+    """
+    Serialize data to JSON bytes, compressed with gzip if requested.
+    Return the body and the headers that describe it.
+    """
+    body = json.dumps(data, separators=(",", ":")).encode()
+    headers = {"Content-Type": "application/json"}
+    if compress:
+        body = gzip.compress(body, COMPRESS_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+def accepts_gzip(response):
+    """
+    Check if the peer that sent the response accepts gzip compressed requests
+    """
+    return "gzip" in response.headers.get(ACCEPT_HEADER, "")
+
+class GzipRequestMiddleware():
+    """
+    WSGI middleware that decompresses gzip request bodies, so the views can read JSON as usual.
+    Old nodes and browsers keep sending plain bodies, that pass through untouched.
+    Bodies that are not valid gzip get a 400 and bodies larger than "max_size" once decompressed a 413,
+    without decompressing more than "max_size" bytes.
+    """
+    def __init__(self, wsgi_app, max_size=MAX_REQUEST_SIZE):
+        self.wsgi_app = wsgi_app
+        self.max_size = max_size
+
+    def __call__(self, environ, start_response):
+        if environ.get("HTTP_CONTENT_ENCODING", "") == "gzip":
+            try:
+                length = int(environ.get("CONTENT_LENGTH") or 0)
+                if length > self.max_size:
+                    return error_response(start_response, "413 Request Entity Too Large", "request too large")
+                body = gunzip(environ["wsgi.input"].read(length), self.max_size)
+            except (ValueError, zlib.error, EOFError):
+                return error_response(start_response, "400 Bad Request", "invalid gzip body")
+            if body is None:
+                return error_response(start_response, "413 Request Entity Too Large", "request too large")
+            environ["wsgi.input"] = BytesIO(body)
+            environ["CONTENT_LENGTH"] = str(len(body))
+            del environ["HTTP_CONTENT_ENCODING"]
+        return self.wsgi_app(environ, start_response)
+
+def gunzip(data, max_size):
+    """
+    Decompress gzip data, return None if it is larger than "max_size" once decompressed.
+    Raise zlib.error or EOFError if the data is not complete and valid gzip.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    body = decompressor.decompress(data, max_size)
+    if decompressor.unconsumed_tail:
+        return None
+    if not decompressor.eof:
+        raise EOFError("Truncated gzip data")
+    return body
+
+def error_response(start_response, status, message):
+    """
+    Answer the request from the middleware with a JSON error
+    """
+    body = json.dumps({"status": message}).encode()
+    start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(body)))])
+    return [body]
+
+def compress_response(response):
+    """
+    Compress JSON responses with gzip for clients that accept it
+    """
+    response.headers[ACCEPT_HEADER] = "gzip"
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or response.mimetype != "application/json" or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    if "gzip" not in request.accept_encodings:
+        return response
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(gzip.compress(body, COMPRESS_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+def init_app(app):
+    """
+    Enable compressed requests and responses on the Flask app
+    """
+    app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_SIZE
+    app.wsgi_app = GzipRequestMiddleware(app.wsgi_app)
+    app.after_request(compress_response)
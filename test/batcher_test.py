@@ -0,0 +1,32 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from threading import Event
+
+from app.models_solution.batcher import Batcher
+
+class BatcherTest(unittest.TestCase):
+    def test_flush_on_size(self):
+        flushed = []
+        batcher = Batcher(lambda key, items: flushed.append((key, items)), window=60, max_size=3)
+        batcher.add(None, 1)
+        batcher.add(2, 2)
+        self.assertEqual(flushed, [])
+        batcher.add(None, 3)
+        self.assertEqual(flushed, [(None, [1, 3]), (2, [2])])
+
+    def test_flush_on_window(self):
+        done = Event()
+        flushed = []
+        def flush(key, items):
+            flushed.append(items)
+            done.set()
+        batcher = Batcher(flush, window=0.01, max_size=100)
+        batcher.add(None, 1)
+        batcher.add(None, 2)
+        self.assertTrue(done.wait(5))
+        self.assertEqual(flushed, [[1, 2]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import json
+import unittest
+import sys
+sys.path.append("../")
+
+from app.models_solution.block import Block, block_preimage, check_block_format, get_block_hash
+
+def transaction(voter, candidate):
+    return {"addr_from": voter, "addr_to": candidate, "signature": "c2lnbmF0dXJl", "pubkey": "-----BEGIN é\n"}
+
+class BlockHashTest(unittest.TestCase):
+    def setUp(self):
+        mined = Block("prev", 3, [transaction("v1", "c1"), transaction("v2", "c2")], "miner")
+        mined.mine()
+        # Received blocks come as plain dictionaries
+        self.block = json.loads(json.dumps(mined.get_json()))
+
+    def test_preimage(self):
+        striped = Block("prev", 3, self.block["data"], "miner")
+        striped.block["nonce"] = self.block["nonce"]
+        self.assertEqual(block_preimage(self.block), json.dumps(striped.get_json()).encode())
+        self.assertEqual(get_block_hash(self.block), self.block["hash"])
+
+    def test_empty_block(self):
+        self.block["data"] = []
+        self.assertEqual(block_preimage(self.block), json.dumps(Block("prev", 3, [], "miner").get_json())
+                         .replace('"nonce": 0', '"nonce": {}'.format(self.block["nonce"])).encode())
+
+    def test_extra_transaction_fields(self):
+        # Fields other than the transaction fields are not hashed, by the miner or the validators
+        mined = Block("prev", 3, [dict(transaction("v1", "c1"), extra="x")], "miner")
+        mined.mine()
+        block = json.loads(json.dumps(mined.get_json()))
+        self.assertEqual(get_block_hash(block), block["hash"])
+
+    def test_format(self):
+        self.assertTrue(check_block_format(self.block))
+        self.assertFalse(check_block_format([]))
+        self.assertFalse(check_block_format(dict(self.block, height=True)))
+        self.assertFalse(check_block_format(dict(self.block, hash="1" + self.block["hash"][1:])))
+        self.assertFalse(check_block_format(dict(self.block, data=[{"addr_from": "v1"}])))
+        self.assertFalse(check_block_format({key: value for key, value in self.block.items() if key != "miner"}))
+        # A timestamp that is not a string would crash the hashing of the block
+        self.assertFalse(check_block_format(dict(self.block, timestamp=None)))
+        self.assertFalse(check_block_format({key: value for key, value in self.block.items() if key != "timestamp"}))
+
+if __name__ == "__main__":
+    unittest.main()
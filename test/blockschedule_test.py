@@ -0,0 +1,60 @@
+import unittest
+import sys
+import time
+import tempfile
+sys.path.append("../")
+
+from app.models_solution.peertopeer import PeerToPeer
+
+class BlockScheduleTest(unittest.TestCase):
+    def create_node(self, **kwargs):
+        node = PeerToPeer("localhost:5999", data_dir=tempfile.mkdtemp(), **kwargs)
+        node.miner_id = "miner"
+        node.created = []
+        def create_and_add_block(miner_id):
+            # Record the pool size and empty the pool, instead of mining
+            node.created.append((time.time(), len(node.blockchain.transaction_pool)))
+            node.blockchain.transaction_pool = []
+        node.blockchain.create_and_add_block = create_and_add_block
+        self.addCleanup(node.stop)
+        return node
+
+    def add_transactions(self, node, count):
+        for i in range(count):
+            node.blockchain.add_transaction_to_pool({"addr_from": str(i), "addr_to": "12345", "signature": str(i)})
+            node.schedule_block()
+
+    def test_max_wait(self):
+        node = self.create_node(block_max_wait=0.3)
+        start = time.time()
+        self.add_transactions(node, 2)
+        time.sleep(0.6)
+        self.assertEqual(len(node.created), 1)
+        self.assertEqual(node.created[0][1], 2)
+        self.assertGreaterEqual(node.created[0][0] - start, 0.25)
+
+    def test_threshold(self):
+        node = self.create_node(block_threshold=3, block_max_wait=10)
+        start = time.time()
+        self.add_transactions(node, 3)
+        time.sleep(0.3)
+        self.assertEqual(len(node.created), 1)
+        self.assertLess(node.created[0][0] - start, 0.3)
+
+    def test_empty_pool(self):
+        node = self.create_node(block_policy="continuous")
+        node.schedule_block()
+        time.sleep(0.2)
+        self.assertEqual(node.created, [])
+
+    def test_reschedule_while_job_in_store(self):
+        node = self.create_node(block_max_wait=0.2)
+        self.add_transactions(node, 1)
+        # The job started, but the scheduler did not remove it from the job store yet
+        node.get_election().block_due = None
+        node.schedule_block()
+        time.sleep(0.5)
+        self.assertGreaterEqual(len(node.created), 1)
+
+if __name__ == "__main__":
+    unittest.main()
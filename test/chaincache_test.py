@@ -0,0 +1,51 @@
+import gzip
+import json
+import unittest
+import sys
+sys.path.append("../")
+
+from app.models_solution.chaincache import ChainCache
+
+def block(height, block_hash):
+    return {"height": height, "hash": block_hash, "data": [{"addr_from": "v", "addr_to": "c"}]}
+
+class ChainCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.chain = [block(0, "a"), block(1, "b")]
+        self.cache = ChainCache()
+        self.cache.update(self.chain)
+
+    def test_get_json(self):
+        self.assertEqual(json.loads(self.cache.get_json(self.chain)), self.chain)
+        self.assertEqual(self.cache.get_json([]), b"[]")
+
+    def test_reuses_fragments(self):
+        fragments = self.cache.state[1]
+        chain = self.chain[:-1] + [block(1, "x"), block(2, "y")]
+        self.cache.update(chain)
+        self.assertIs(self.cache.state[1][0], fragments[0])
+        self.assertEqual(json.loads(self.cache.get_json(chain)), chain)
+
+    def test_replaced_block(self):
+        # Pruning replaces blocks by new ones with the same hash
+        chain = [{"height": 0, "hash": "a", "data": [], "pruned": True}] + self.chain[1:]
+        self.cache.update(chain)
+        self.assertEqual(json.loads(self.cache.get_json(chain)), chain)
+
+    def test_other_chain(self):
+        other = [block(0, "z")]
+        self.assertEqual(json.loads(self.cache.get_json(other)), other)
+
+    def test_gzip_once(self):
+        body = self.cache.get_gzip(self.chain)
+        self.assertEqual(json.loads(gzip.decompress(body)), self.chain)
+        self.assertIs(self.cache.get_gzip(self.chain), body)
+        chain = self.chain + [block(2, "c")]
+        self.cache.update(chain)
+        self.assertEqual(json.loads(gzip.decompress(self.cache.get_gzip(chain))), chain)
+        # Chains other than the cached one are compressed on every call
+        self.assertEqual(json.loads(gzip.decompress(self.cache.get_gzip(self.chain))), self.chain)
+        self.assertIsNot(self.cache.get_gzip(self.chain), self.cache.get_gzip(self.chain))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from app.models_solution.blockchain import Blockchain
+
+def block(height, block_hash, prev_hash, timestamp):
+    return {"miner": "m", "hash": block_hash, "prevHash": prev_hash, "height": height, "nonce": 0,
+            "timestamp": timestamp, "data": []}
+
+class ChainCommitTest(unittest.TestCase):
+    def setUp(self):
+        self.blockchain = Blockchain()
+        self.blockchain.setup_new_chain([block(0, "g", "", "0")])
+        self.calls = []
+
+    def validate_during(self, change):
+        """
+        Replace "validate_block" by one that accepts every block, changing the chain during the first call
+        """
+        def validate_block(block, prev_block, chain=None):
+            self.calls.append(chain)
+            if len(self.calls) == 1:
+                change()
+            return True
+        self.blockchain.validate_block = validate_block
+
+    def test_commit(self):
+        self.validate_during(lambda: None)
+        new_block = block(1, "b", "g", "1")
+        self.assertTrue(self.blockchain.validate_and_add_block(new_block))
+        self.assertEqual(len(self.calls), 1)
+        self.assertIs(self.blockchain.get_chain()[-1], new_block)
+
+    def test_retry_when_chain_changes(self):
+        # Another thread commits an equal chain during the validation, the block is validated again
+        self.validate_during(lambda: self.blockchain.setup_new_chain(list(self.blockchain.get_chain())))
+        new_block = block(1, "b", "g", "1")
+        self.assertTrue(self.blockchain.validate_and_add_block(new_block))
+        self.assertEqual(len(self.calls), 2)
+        self.assertIsNot(self.calls[0], self.calls[1])
+        self.assertIs(self.blockchain.get_chain()[-1], new_block)
+
+    def test_retry_against_new_head(self):
+        # An older block at the same height is committed during the validation, so the block loses the tie
+        older = block(1, "o", "g", "0")
+        self.validate_during(lambda: self.blockchain.setup_new_chain(self.blockchain.get_chain() + [older]))
+        self.assertFalse(self.blockchain.validate_and_add_block(block(1, "b", "g", "1")))
+        self.assertEqual(len(self.calls), 1)
+        self.assertIs(self.blockchain.get_chain()[-1], older)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+import sys
+import tempfile
+sys.path.append("../")
+
+from unittest import mock
+
+from app.models_solution.peertopeer import PeerToPeer
+from app.models_solution.election import check_election
+
+CANDIDATES = [{"name": "Candidate A", "address": "aaaa"}, {"name": "Candidate B", "address": "bbbb"}]
+
+class ElectionTest(unittest.TestCase):
+    def setUp(self):
+        # A node alone in the network, its own master
+        self.node = PeerToPeer("localhost:5999", master="localhost:5999", data_dir=tempfile.mkdtemp())
+        self.addCleanup(self.node.stop)
+        self.node.start(background=False)
+
+    def test_create(self):
+        election = self.node.create_election("council", CANDIDATES)
+        self.assertIsNotNone(election)
+        self.assertIsNone(self.node.create_election("council", CANDIDATES))
+        self.assertIs(self.node.get_election("council"), election)
+        self.assertIsNone(self.node.get_election("unknown"))
+        self.assertEqual(len(election.blockchain.get_chain()), 1)
+        self.assertNotEqual(election.get_tip(), self.node.get_tip())
+        self.assertEqual(sorted(info["id"] for info in self.node.get_elections()), ["council", "default"])
+
+    def test_independent_chains(self):
+        election = self.node.create_election("council", CANDIDATES)
+        # Candidates of one election are not valid in the other
+        self.node.create_and_add_transaction("12345", election)
+        self.assertEqual(election.blockchain.transaction_pool, [])
+        self.node.create_and_add_transaction("aaaa", election)
+        self.assertEqual(len(election.blockchain.transaction_pool), 1)
+        self.assertEqual(self.node.blockchain.transaction_pool, [])
+        # The node can still vote in the default election
+        self.assertTrue(self.node.has_to_vote())
+        self.assertFalse(self.node.has_to_vote(election))
+
+    def test_paths(self):
+        self.assertEqual(self.node.get_election().path("/tip"), "/tip")
+        self.assertEqual(self.node.create_election("council", CANDIDATES).path("/tip"), "/elections/council/tip")
+
+    def test_check_election(self):
+        self.assertTrue(check_election({"id": "council", "candidates": CANDIDATES}))
+        self.assertFalse(check_election({"id": "a/b", "candidates": CANDIDATES}))
+        self.assertFalse(check_election({"id": "council", "candidates": []}))
+        self.assertFalse(check_election({"id": "council", "candidates": [{"name": "A"}]}))
+        self.assertFalse(check_election({"id": "council", "candidates": CANDIDATES + CANDIDATES[0:1]}))
+
+    def test_limits(self):
+        self.node.max_elections = 3
+        self.node.create_election("council", CANDIDATES)
+        # Votes for the same candidate address would be valid in both elections
+        with self.assertRaises(ValueError):
+            self.node.create_election("mayor", [{"name": "Candidate A", "address": "aaaa"}])
+        self.node.create_election("mayor", [{"name": "Candidate C", "address": "cccc"}])
+        with self.assertRaises(ValueError):
+            self.node.create_election("senate", [{"name": "Candidate D", "address": "dddd"}])
+        self.assertIsNone(self.node.get_election("senate"))
+
+    def test_announcements(self):
+        announcement = {"id": "council", "candidates": CANDIDATES, "address": "unknown:5000"}
+        self.assertFalse(self.node.receive_election(announcement))
+        self.assertIsNone(self.node.get_election("council"))
+
+    def test_join_failure(self):
+        node = PeerToPeer("localhost:5998", master="master:5000", data_dir=tempfile.mkdtemp())
+        self.addCleanup(node.stop)
+        # No peer has the chain of the election
+        node.get_current_blockchain = lambda election=None: None
+        node.get_current_participant_list = lambda: None
+        election = node.add_election("council", CANDIDATES)
+        with mock.patch("app.models_solution.peertopeer.time.sleep") as sleep:
+            node.join_peer_election(election)
+        self.assertEqual(sleep.call_count, 29)
+        self.assertIsNone(node.get_election("council"))
+        for worker in election.ingestion.workers:
+            worker.join(5)
+            self.assertFalse(worker.is_alive())
+
+    def test_stop(self):
+        node = PeerToPeer("localhost:5998", master="master:5000", data_dir=tempfile.mkdtemp())
+        election = node.add_election("council", CANDIDATES)
+        node.stop()
+        for worker in election.ingestion.workers + node.get_election().ingestion.workers:
+            worker.join(5)
+            self.assertFalse(worker.is_alive())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from app.events import EventBroker, MAX_PENDING
+
+class EventBrokerTest(unittest.TestCase):
+    def test_publish(self):
+        broker = EventBroker()
+        client = broker.subscribe()
+        stream = broker.stream(client)
+        self.assertEqual(next(stream), ": connected\n\n")
+        broker.publish("pool_add", {"addr_from": "a"})
+        self.assertEqual(next(stream), 'event: pool_add\ndata: {"addr_from": "a"}\n\n')
+
+    def test_slow_client_disconnected(self):
+        broker = EventBroker()
+        client = broker.subscribe()
+        for i in range(MAX_PENDING + 1):
+            broker.publish("block", i)
+        self.assertEqual(broker.clients, [])
+        # The stream ends after the pending events
+        self.assertEqual(len(list(broker.stream(client))), MAX_PENDING)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from threading import Event, Thread
+
+from app.models_solution.ingestion import IngestionQueue
+
+class IngestionTest(unittest.TestCase):
+    def test_blocks_before_transactions(self):
+        processed = []
+        queue = IngestionQueue(lambda b: processed.append(("block", b)),
+                               lambda t: processed.append(("transaction", t)), workers=0)
+        self.assertTrue(queue.add_transaction(1))
+        self.assertTrue(queue.add_block(1))
+        self.assertTrue(queue.add_transaction(2))
+        self.assertTrue(queue.add_block(2))
+        # Start a single worker after everything is enqueued to check the processing order
+        Thread(target=queue.work, daemon=True).start()
+        queue.join()
+        self.assertEqual(processed, [("block", 1), ("block", 2), ("transaction", 1), ("transaction", 2)])
+
+    def test_full_queue(self):
+        release = Event()
+        queue = IngestionQueue(lambda b: release.wait(), lambda t: release.wait(), workers=1, maxsize=1)
+        self.assertTrue(queue.add_block(1))
+        # Wait for the worker to take the first block
+        while queue.size() > 0:
+            pass
+        self.assertTrue(queue.add_block(2))
+        self.assertFalse(queue.add_block(3))
+        self.assertFalse(queue.add_transaction(1))
+        release.set()
+        queue.join()
+        self.assertTrue(queue.add_block(4))
+        queue.join()
+
+    def test_batch_all_or_nothing(self):
+        queue = IngestionQueue(lambda b: None, lambda t: None, workers=0, maxsize=3)
+        self.assertTrue(queue.add_transactions([1, 2]))
+        self.assertFalse(queue.add_transactions([3, 4]))
+        self.assertEqual(queue.size(), 2)
+        self.assertTrue(queue.add_transactions([3]))
+
+    def test_stop(self):
+        processed = []
+        queue = IngestionQueue(lambda b: processed.append(b), lambda t: None, workers=2)
+        self.assertTrue(queue.add_block(1))
+        queue.join()
+        queue.stop()
+        for worker in queue.workers:
+            worker.join(5)
+            self.assertFalse(worker.is_alive())
+        self.assertEqual(processed, [1])
+
+if __name__ == "__main__":
+    unittest.main()
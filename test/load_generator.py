@@ -0,0 +1,180 @@
+"""
+Load generator: sends votes from many distinct voters to running nodes at a target rate and reports
+the achieved throughput and the latency until the votes are committed to the chain.
+
+Every voter needs its own RSA key. Keys are slow to generate, so they are generated once, in parallel,
+and cached in a file (--keys, in the temporary directory by default, out of the repository). Voter ids are new on every run, so the same keys can be used against the
+same chain again without double voting. Votes are signed in parallel processes before sending them.
+
+Votes are posted to "/update_pool" of the nodes, in turns. Commits are observed on the "/events" stream
+of the first node, so it must have every transaction: use a single node, or set --ttl when the nodes gossip.
+"/cast_vote" can be used instead (--endpoint cast_vote), but then each node signs its own vote and only the
+first one per node is accepted, so it only measures the request handling.
+
+Usage: python load_generator.py --nodes localhost:5000 --voters 2000 --rate 50 (see --help for all the options)
+"""
+import sys
+import os
+import json
+import time
+import uuid
+import random
+import argparse
+import requests
+import tempfile
+import multiprocessing
+sys.path.append("../")
+
+from threading import Thread, Lock, Event
+from concurrent.futures import ThreadPoolExecutor
+from Crypto.PublicKey import RSA
+
+from app.models_solution.transaction import Transaction
+from app.models_solution.peertopeer import TTL_HEADER
+
+CANDIDATES = ["12345", "5678", "9999"]
+
+def generate_key(_):
+    return RSA.generate(1024).exportKey().decode()
+
+def load_keys(path, count, processes):
+    """
+    Return "count" private keys in PEM format from the cache file, generating the missing ones
+    """
+    keys = []
+    if os.path.exists(path):
+        with open(path) as f:
+            keys = [json.loads(line) for line in f][0:count]
+    if len(keys) < count:
+        print("Generating {} voter keys".format(count - len(keys)))
+        with multiprocessing.Pool(processes) as pool:
+            new_keys = pool.map(generate_key, range(count - len(keys)), chunksize=16)
+        with open(path, "a") as f:
+            for key in new_keys:
+                f.write(json.dumps(key) + "\n")
+        keys.extend(new_keys)
+    return keys
+
+def sign_vote(args):
+    voter, candidate, key = args
+    return Transaction(voter, candidate).get_signed_json(RSA.importKey(key))
+
+def sign_votes(keys, processes):
+    """
+    Return one signed vote per key, from new voter ids to random candidates
+    """
+    run = uuid.uuid4().hex[0:8]
+    work = [("voter-{}-{}".format(run, i), random.choice(CANDIDATES), key) for i, key in enumerate(keys)]
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(sign_vote, work, chunksize=16)
+
+class CommitWatcher():
+    """
+    Records when each voter appears in a block, from the "/events" stream of a node
+    """
+    def __init__(self, address):
+        self.address = address
+        self.lock = Lock()
+        self.committed = {}
+        self.connected = Event()
+
+    def start(self):
+        Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        r = requests.get("http://" + self.address + "/events", stream=True, timeout=None)
+        self.connected.set()
+        event = None
+        # Without chunk size, lines are read as soon as they arrive
+        for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: ") and event == "block":
+                now = time.time()
+                with self.lock:
+                    for vote in json.loads(line[len("data: "):])["votes"]:
+                        self.committed.setdefault(vote["addr_from"], now)
+
+def percentile(values, p):
+    if len(values) == 0:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def send(session, address, endpoint, vote, ttl):
+    """
+    Send the vote, return the status code or None if the node could not be reached
+    """
+    try:
+        if endpoint == "cast_vote":
+            r = session.post("http://" + address + "/cast_vote", data={"vote_addr": vote["addr_to"]},
+                             allow_redirects=False, timeout=10)
+        else:
+            headers = {TTL_HEADER: str(ttl)} if ttl is not None else {}
+            r = session.post("http://" + address + "/update_pool", json=vote, headers=headers, timeout=10)
+        return r.status_code
+    except requests.RequestException:
+        return None
+
+def run(args):
+    nodes = args.nodes.split(",")
+    keys = load_keys(args.keys, args.voters, args.processes)
+    start = time.perf_counter()
+    votes = sign_votes(keys, args.processes)
+    print("Signed {} votes in {:.1f}s".format(len(votes), time.perf_counter() - start))
+
+    watcher = CommitWatcher(nodes[0])
+    watcher.start()
+    if not watcher.connected.wait(10):
+        print("Could not connect to the events of {}, commits will not be measured".format(nodes[0]))
+    sessions = [requests.Session() for _ in nodes]
+    sent = {}
+    results = {}
+    print("Sending {} votes to {} at {} votes/s".format(len(votes), ", ".join(nodes), args.rate))
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = []
+        for i, vote in enumerate(votes):
+            delay = start + i / args.rate - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            sent[vote["addr_from"]] = time.time()
+            futures.append(executor.submit(send, sessions[i % len(nodes)], nodes[i % len(nodes)], args.endpoint, vote, args.ttl))
+        for future in futures:
+            status = future.result()
+            results[status] = results.get(status, 0) + 1
+    send_time = time.time() - start
+
+    # Wait until every vote is committed, at most "settle" seconds
+    deadline = time.time() + args.settle
+    while time.time() < deadline and len(watcher.committed) < len(sent):
+        time.sleep(0.5)
+
+    report(sent, results, send_time, watcher.committed, start)
+
+def report(sent, results, send_time, committed, start):
+    committed = {voter: t for voter, t in committed.items() if voter in sent}
+    latency = [committed[voter] - sent[voter] for voter in committed]
+    elapsed = max(committed.values()) - start if len(committed) > 0 else float("nan")
+    print("")
+    print("Votes sent:            {} in {:.1f}s ({:.1f} votes/s)".format(len(sent), send_time, len(sent) / send_time))
+    print("Responses:             {}".format(", ".join("{}: {}".format(status if status is not None else "error", count)
+                                                       for status, count in sorted(results.items(), key=str))))
+    print("Votes committed:       {} of {}".format(len(committed), len(sent)))
+    print("Throughput:            {:.1f} votes/s".format(len(committed) / elapsed))
+    print("Commit latency:        p50 {:.3f}s  p90 {:.3f}s  p99 {:.3f}s".format(
+        percentile(latency, 50), percentile(latency, 90), percentile(latency, 99)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send signed votes from many voters to running nodes")
+    parser.add_argument("--nodes", default="localhost:5000", help="comma separated node addresses, commits are watched on the first")
+    parser.add_argument("--voters", type=int, default=1000, help="number of distinct voters, one vote each")
+    parser.add_argument("--rate", type=float, default=50, help="votes sent per second")
+    parser.add_argument("--endpoint", default="update_pool", choices=["update_pool", "cast_vote"])
+    parser.add_argument("--ttl", type=int, default=None, help="gossip TTL sent with the votes, so gossiping nodes relay them")
+    parser.add_argument("--keys", default=os.path.join(tempfile.gettempdir(), "voter_keys.jsonl"),
+                        help="file caching the voter private keys")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="processes generating keys and signing")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight")
+    parser.add_argument("--settle", type=float, default=60, help="maximum seconds waiting for the commits at the end")
+    run(parser.parse_args())
@@ -0,0 +1,26 @@
+import unittest
+import sys
+import logging
+sys.path.append("../")
+
+from app import logs
+
+class LogsTest(unittest.TestCase):
+    def test_parse_levels(self):
+        self.assertEqual(logs.parse_levels("peertopeer=debug, blockchain=WARNING"),
+                         {"peertopeer": "DEBUG", "blockchain": "WARNING"})
+        self.assertEqual(logs.parse_levels(""), {})
+
+    def test_component_level(self):
+        logger = logs.get_logger("test")
+        logs.configure("WARNING", {"test": "DEBUG"}, queued=False)
+        self.assertTrue(logger.isEnabledFor(logging.DEBUG))
+        self.assertFalse(logs.get_logger("other").isEnabledFor(logging.INFO))
+        logs.configure("INFO", {"test": "NOTSET"}, queued=False)
+
+    def test_summary(self):
+        block = {"height": 3, "hash": "000abcdef0123456789", "data": [{}, {}]}
+        self.assertEqual(str(logs.BlockSummary(block)), "#3 000abcdef012 (2 transactions)")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from app.metrics import Counter, Gauge, Histogram, REGISTRY
+
+class MetricsTest(unittest.TestCase):
+    def tearDown(self):
+        # Keep the test metrics out of the node registry
+        del REGISTRY[-1]
+
+    def test_counter(self):
+        counter = Counter("test_requests_total", "Requests", ["peer"])
+        counter.labels("a").inc()
+        counter.labels("a").inc(2)
+        counter.labels("b").inc()
+        self.assertEqual(counter.render(), ["# HELP test_requests_total Requests",
+                                            "# TYPE test_requests_total counter",
+                                            'test_requests_total{peer="a"} 3.0',
+                                            'test_requests_total{peer="b"} 1.0'])
+
+    def test_gauge_function(self):
+        gauge = Gauge("test_size", "Size")
+        gauge.set_function(lambda: 42)
+        self.assertEqual(gauge.render()[-1], "test_size 42")
+
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Latency", buckets=[0.1, 1])
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(histogram.render()[2:], ['test_seconds_bucket{le="0.1"} 1',
+                                                  'test_seconds_bucket{le="1"} 2',
+                                                  'test_seconds_bucket{le="+Inf"} 3',
+                                                  "test_seconds_sum 5.55",
+                                                  "test_seconds_count 3"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import time
+import unittest
+import sys
+sys.path.append("../")
+
+from threading import Thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from app.models_solution.peerclient import PeerClient
+
+class Handler(BaseHTTPRequestHandler):
+    # Keep-alive connections
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.ports.append(self.client_address[1])
+        if self.path == "/slow":
+            time.sleep(0.5)
+        if self.path == "/etag" and self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+        self.send_response(500 if self.path == "/error" else 200)
+        if self.path == "/etag":
+            self.send_header("ETag", '"v1"')
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+class PeerClientTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("localhost", 0), Handler)
+        self.server.ports = []
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.address = "localhost:{}".format(self.server.server_address[1])
+        self.results = []
+        self.client = PeerClient(timeout=0.2, listener=lambda address, latency, ok: self.results.append((address, ok)))
+        self.addCleanup(self.client.close)
+
+    def test_session_reuse(self):
+        self.assertIs(self.client.get_session(self.address), self.client.get_session(self.address))
+        self.assertEqual(self.client.get(self.address, "/").status_code, 200)
+        self.assertEqual(self.client.get(self.address, "/").status_code, 200)
+        # Both requests went through the same connection
+        self.assertEqual(len(set(self.server.ports)), 1)
+
+    def test_latency(self):
+        self.client.get(self.address, "/")
+        self.assertGreater(self.client.latency[self.address], 0)
+        self.assertLess(self.client.latency[self.address], 0.2)
+        self.assertEqual(self.results, [(self.address, True)])
+
+    def test_timeout(self):
+        self.assertIsNone(self.client.get(self.address, "/slow"))
+        self.assertGreaterEqual(self.client.latency[self.address], 0.2)
+        self.assertEqual(self.results, [(self.address, False)])
+
+    def test_server_error(self):
+        self.assertEqual(self.client.get(self.address, "/error").status_code, 500)
+        self.assertEqual(self.results, [(self.address, False)])
+
+    def test_get_if_changed(self):
+        self.assertEqual(self.client.get_if_changed(self.address, "/etag").status_code, 200)
+        # The ETag of the last response is sent back
+        self.assertEqual(self.client.get_if_changed(self.address, "/etag").status_code, 304)
+        self.assertEqual(self.client.get_if_changed(self.address, "/etag", "v0").status_code, 200)
+
+    def test_unreachable(self):
+        self.assertIsNone(self.client.get("localhost:1", "/"))
+        self.assertEqual(self.results, [("localhost:1", False)])
+
+if __name__ == "__main__":
+    unittest.main()
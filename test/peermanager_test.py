@@ -0,0 +1,37 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from app.models_solution.peermanager import PeerManager
+
+class PeerManagerTest(unittest.TestCase):
+    def test_add_peer(self):
+        peers = PeerManager()
+        self.assertTrue(peers.add({"miner_id": "1", "address": "localhost:5000"}))
+        self.assertFalse(peers.add({"miner_id": "1", "address": "localhost:5000"}))
+        self.assertEqual(peers.get_list(), [{"miner_id": "1", "address": "localhost:5000"}])
+        self.assertEqual(peers.version, 1)
+
+    def test_best_peers(self):
+        peers = PeerManager()
+        for i in range(3):
+            peers.add({"miner_id": str(i), "address": "localhost:500" + str(i)})
+        peers.record_success("localhost:5000", 2.0)
+        peers.record_success("localhost:5001", 0.01)
+        peers.record_failure("localhost:5002")
+        self.assertEqual(peers.best(), ["localhost:5001", "localhost:5000", "localhost:5002"])
+        self.assertEqual(peers.best(exclude="localhost:5001"), ["localhost:5000", "localhost:5002"])
+
+    def test_eviction(self):
+        peers = PeerManager(max_failures=2)
+        peers.add({"miner_id": "1", "address": "localhost:5001"})
+        peers.record_failure("localhost:5001")
+        peers.record_success("localhost:5001", 0.1)
+        # Failures must be consecutive
+        peers.record_failure("localhost:5001")
+        self.assertEqual(len(peers.get_list()), 1)
+        peers.record_failure("localhost:5001")
+        self.assertEqual(peers.get_list(), [])
+
+if __name__ == "__main__":
+    unittest.main()
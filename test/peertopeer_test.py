@@ -0,0 +1,356 @@
+import json
+import unittest
+import sys
+import tempfile
+import time
+sys.path.append("../")
+
+from unittest import mock
+from concurrent.futures import Future
+
+from app.models_solution.peertopeer import PeerToPeer
+from app.models_solution.transaction import transaction_hash
+from app.models_solution.block import Block, get_compact_block
+
+def vote(voter, candidate="12345"):
+    return {"addr_from": voter, "addr_to": candidate, "signature": "sig-" + voter, "pubkey": "key"}
+
+class FakeResponse():
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        # An exception stands for a body that is not JSON
+        if isinstance(self.data, Exception):
+            raise self.data
+        return self.data
+
+class FakeClient():
+    """
+    Peer client that records the posts and answers them with the given responses, in order,
+    and answers GET requests with the response of the path in "routes". Background work runs right away.
+    """
+    def __init__(self, responses=(), routes=None):
+        self.responses = list(responses)
+        self.routes = routes or {}
+        self.posts = []
+        self.gets = []
+        self.latency = {}
+        self.executor = self
+
+    def submit(self, function, *args):
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+    def post(self, address, path, data, **kwargs):
+        self.posts.append((address, path, data))
+        self.latency[address] = 0
+        return self.responses.pop(0) if len(self.responses) > 0 else FakeResponse({"status": "ok"})
+
+    def post_all(self, addresses, path, data, **kwargs):
+        return {address: self.post(address, path, data) for address in addresses}
+
+    def get(self, address, path, **kwargs):
+        self.gets.append((address, path))
+        return self.routes.get(path)
+
+    def get_if_changed(self, address, path, etag=None):
+        return self.get(address, path)
+
+    def close(self):
+        pass
+
+class PeerToPeerTest(unittest.TestCase):
+    def create_node(self, start=True, master="localhost:5999", **kwargs):
+        # By default a node alone in the network, its own master
+        kwargs.setdefault("block_max_wait", 60)
+        node = PeerToPeer("localhost:5999", master=master, data_dir=tempfile.mkdtemp(), **kwargs)
+        self.addCleanup(node.stop)
+        if start:
+            node.start(background=False)
+        # Signatures are valid for the candidate they were made for, "12345"
+        node.blockchain.validate_transaction = lambda t: t["addr_to"] == "12345"
+        return node
+
+    def test_tampered_transaction_before_real(self):
+        node = self.create_node()
+        real = vote("v1")
+        # Same signature, so same hash, but another candidate
+        node.validate_and_add_transaction(dict(real, addr_to="5678"))
+        self.assertEqual(node.blockchain.transaction_pool, [])
+        node.validate_and_add_transaction(real)
+        self.assertEqual(node.blockchain.transaction_pool, [real])
+        node.validate_and_add_transaction(real)
+        self.assertEqual(node.blockchain.transaction_pool, [real])
+
+    def test_invalid_block_before_real(self):
+        node = self.create_node()
+        real = self.mined_block([vote("v1")])
+        # Same hash, other votes
+        junk = dict(real, data=[vote("v2")])
+        validated = []
+        def validate_and_add_block(block):
+            validated.append(block)
+            return block is real
+        node.blockchain.validate_and_add_block = validate_and_add_block
+        node.validate_and_add_block(junk)
+        node.validate_and_add_block(real)
+        # Accepted blocks are not validated again
+        node.validate_and_add_block(real)
+        self.assertEqual(validated, [junk, real])
+
+    def test_extra_transaction_fields(self):
+        node = self.create_node()
+        node.validate_and_add_transaction(dict(vote("v1"), extra="x"))
+        self.assertEqual(node.blockchain.transaction_pool, [vote("v1")])
+        self.assertEqual(list(node.blockchain.transaction_pool[0]), ["addr_from", "addr_to", "signature", "pubkey"])
+        node.validate_and_add_transaction({"addr_from": "v2"})
+        self.assertEqual(len(node.blockchain.transaction_pool), 1)
+
+    def test_fetch_announced_transaction(self):
+        node = self.create_node(relay_mode="announce")
+        transaction = vote("v1")
+        node.client = FakeClient([FakeResponse({"blocks": [], "transactions": [transaction]})])
+        inventory = {"transactions": [transaction_hash(transaction)]}
+        node.receive_inventory(dict(inventory, address="peer1"))
+        node.get_election().ingestion.join()
+        self.assertEqual(node.client.posts, [("peer1", "/get_data", {"compact": True, "blocks": [], "transactions": inventory["transactions"]})])
+        self.assertEqual(node.blockchain.transaction_pool, [transaction])
+        # Already fetched, other announcements are ignored
+        node.receive_inventory(dict(inventory, address="peer2"))
+        self.assertEqual(len(node.client.posts), 1)
+
+    def test_fetch_again_after_failure(self):
+        node = self.create_node(relay_mode="announce")
+        transaction = vote("v1")
+        node.client = FakeClient([None, FakeResponse({"blocks": [], "transactions": []}),
+                                  FakeResponse({"blocks": [], "transactions": [transaction]})])
+        inventory = {"transactions": [transaction_hash(transaction)]}
+        # The first peer is down, the second one does not have the transaction anymore
+        for address in ["peer1", "peer2", "peer3"]:
+            node.receive_inventory(dict(inventory, address=address))
+        node.get_election().ingestion.join()
+        self.assertEqual([post[0] for post in node.client.posts], ["peer1", "peer2", "peer3"])
+        self.assertEqual(node.blockchain.transaction_pool, [transaction])
+
+    def mined_block(self, transactions):
+        block = Block("prev", 1, transactions, "miner")
+        block.mine()
+        return dict(block.get_json())
+
+    def record_blocks(self, node):
+        validated = []
+        node.blockchain.validate_and_add_block = lambda block: validated.append(block) or True
+        return validated
+
+    def test_compact_block(self):
+        node = self.create_node(relay_mode="compact")
+        validated = self.record_blocks(node)
+        block = self.mined_block([vote("v1"), vote("v2")])
+        for transaction in block["data"]:
+            node.validate_and_add_transaction(transaction)
+        node.receive_compact_block(dict(get_compact_block(block), address="peer1"))
+        node.get_election().ingestion.join()
+        self.assertEqual(validated, [block])
+
+    def test_compact_block_fetch_failure(self):
+        node = self.create_node(relay_mode="compact")
+        node.client = FakeClient([None, FakeResponse({"transactions": [vote("v1")]})])
+        validated = self.record_blocks(node)
+        block = self.mined_block([vote("v1")])
+        compact = get_compact_block(block)
+        # The transaction is not in the pool and the first peer does not answer
+        node.receive_compact_block(dict(compact, address="peer1"))
+        node.receive_compact_block(dict(compact, address="peer2"))
+        node.get_election().ingestion.join()
+        self.assertEqual([post[0] for post in node.client.posts], ["peer1", "peer2"])
+        self.assertEqual(validated, [block])
+
+    def test_compact_block_malformed_responses(self):
+        node = self.create_node(relay_mode="compact")
+        node.client = FakeClient([FakeResponse(ValueError("not JSON")), FakeResponse([vote("v1")]),
+                                  FakeResponse({"transactions": None}), FakeResponse({"transactions": [vote("v1")]})])
+        validated = self.record_blocks(node)
+        block = self.mined_block([vote("v1")])
+        compact = get_compact_block(block)
+        # Every bad answer lets the block be requested again
+        for peer in ["peer1", "peer2", "peer3", "peer4"]:
+            node.receive_compact_block(dict(compact, address=peer))
+        node.get_election().ingestion.join()
+        self.assertEqual([post[0] for post in node.client.posts], ["peer1", "peer2", "peer3", "peer4"])
+        self.assertEqual(validated, [block])
+
+    def test_fetch_announced_block(self):
+        node = self.create_node(relay_mode="announce")
+        validated = self.record_blocks(node)
+        block = self.mined_block([vote("v1"), vote("v2")])
+        node.validate_and_add_transaction(vote("v1"))
+        # The peer sends the compact block and the transaction missing from the pool
+        node.client = FakeClient([FakeResponse({"blocks": [get_compact_block(block)], "transactions": []}),
+                                  FakeResponse({"transactions": [vote("v2")]})])
+        node.receive_inventory({"blocks": [block["hash"]], "address": "peer1"})
+        node.get_election().ingestion.join()
+        self.assertEqual(node.client.posts, [("peer1", "/get_data", {"compact": True, "blocks": [block["hash"]], "transactions": []}),
+                                             ("peer1", "/get_block_transactions", {"hash": block["hash"], "indexes": [1]})])
+        self.assertEqual(validated, [block])
+
+    def test_get_data(self):
+        node = self.create_node()
+        node.validate_and_add_transaction(vote("v1"))
+        head = node.blockchain.get_chain()[-1]
+        wanted = {"blocks": [head["hash"]], "transactions": [transaction_hash(vote("v1")), "unknown"]}
+        self.assertEqual(node.get_data(wanted), {"blocks": [head], "transactions": [vote("v1")]})
+        self.assertEqual(node.get_data(dict(wanted, compact=True))["blocks"], [get_compact_block(head)])
+        # The pool index follows the pool
+        node.blockchain.update_pool([vote("v1")], [vote("v2")])
+        self.assertIsNone(node.blockchain.get_transaction_from_pool(transaction_hash(vote("v1"))))
+        self.assertEqual(node.blockchain.get_transaction_from_pool(transaction_hash(vote("v2"))), vote("v2"))
+
+    def test_compact_block_short_id_collision(self):
+        node = self.create_node(relay_mode="compact")
+        validated = self.record_blocks(node)
+        block = self.mined_block([vote("v1")])
+        node.validate_and_add_transaction(vote("v2"))
+        node.client = FakeClient([FakeResponse({"blocks": [block], "transactions": []})])
+        # Every transaction gets the same short id, so the one in the pool replaces the one in the block
+        with mock.patch("app.models_solution.peertopeer.short_transaction_id", lambda t: "same"):
+            node.receive_compact_block(dict(get_compact_block(block), short_ids=["same"], address="peer1"))
+        node.get_election().ingestion.join()
+        self.assertEqual(node.client.posts, [("peer1", "/get_data", {"blocks": [block["hash"]], "transactions": []})])
+        self.assertEqual(validated, [block])
+
+    def test_double_vote_in_pool(self):
+        node = self.create_node(block_policy="continuous")
+        node.blockchain.validate_transaction = lambda t: True
+        node.blockchain.add_transaction_to_pool(vote("v1"))
+        node.create_and_add_block()
+        self.assertEqual(len(node.blockchain.get_chain()), 2)
+        # A second vote of v1, and two votes of v2: the block is rejected and the double votes are removed
+        node.blockchain.add_transaction_to_pool(vote("v1", "5678"))
+        node.blockchain.add_transaction_to_pool(vote("v2"))
+        node.blockchain.add_transaction_to_pool(vote("v2", "5678"))
+        node.create_and_add_block()
+        self.assertEqual(len(node.blockchain.get_chain()), 2)
+        self.assertEqual(node.blockchain.transaction_pool, [vote("v2")])
+        node.create_and_add_block()
+        self.assertEqual(node.blockchain.get_chain()[-1]["data"], [vote("v2")])
+
+    def test_rejected_block_backs_off(self):
+        node = self.create_node(block_policy="continuous", block_max_wait=30)
+        node.blockchain.add_transaction_to_pool(vote("v1"))
+        # The block is rejected and the pool does not change: the next try waits for block_max_wait
+        node.blockchain.validate_and_add_block = lambda block: False
+        node.blockchain.remove_invalid_transactions = lambda transactions: None
+        node.create_and_add_block()
+        self.assertGreater(node.get_election().block_due, time.time() + 20)
+
+    def test_spoofed_election_announcement(self):
+        node = self.create_node()
+        node.peers.add({"miner_id": "2", "address": "peer1"})
+        node.join_peer_election = lambda election: None
+        candidates = [{"name": "Candidate A", "address": "aaaa"}]
+        # The peer does not host the announced election
+        node.client = FakeClient(routes={"/elections": FakeResponse([])})
+        self.assertTrue(node.receive_election({"id": "council", "candidates": candidates, "address": "peer1"}))
+        self.assertEqual(node.client.gets, [("peer1", "/elections")])
+        self.assertIsNone(node.get_election("council"))
+        # The candidates are the ones of the peer, not the ones of the announcement
+        hosted = [{"name": "Candidate B", "address": "bbbb"}]
+        node.client = FakeClient(routes={"/elections": FakeResponse([{"id": "council", "candidates": hosted}])})
+        self.assertTrue(node.receive_election({"id": "council", "candidates": candidates, "address": "peer1"}))
+        self.assertEqual(node.get_election("council").valid_addresses, hosted)
+
+    def test_no_genesis_for_peer_election(self):
+        node = self.create_node()
+        election = node.add_election("council", [{"name": "Candidate A", "address": "aaaa"}])
+        node.get_current_blockchain(election=election)
+        self.assertTrue(election.blockchain.empty())
+
+    def chain_from(self, chain, *votes):
+        # Extend "chain" with a block for each list of votes
+        chain = list(chain)
+        for transactions in votes:
+            block = Block(chain[-1]["hash"], chain[-1]["height"] + 1, transactions, "miner")
+            block.mine()
+            chain.append(json.loads(json.dumps(block.get_json())))
+        return chain
+
+    def test_adopt_longer_chain(self):
+        node = self.create_node()
+        genesis = node.blockchain.get_chain()
+        node.blockchain.validate_and_add_block(self.chain_from(genesis, [vote("v3")])[1])
+        node.validate_and_add_transaction(vote("v2"))
+        longer = self.chain_from(genesis, [vote("v1")], [vote("v2")])
+        self.assertFalse(node.blockchain.adopt_chain(longer[0:2]))
+        self.assertTrue(node.blockchain.adopt_chain(longer))
+        self.assertEqual(node.blockchain.get_chain(), longer)
+        # The vote of the replaced block goes back to the pool, the ones in the new blocks leave it
+        self.assertEqual(node.blockchain.transaction_pool, [vote("v3")])
+        self.assertTrue(node.blockchain.check_double_spending("v1"))
+
+    def test_adopt_chain_same_height(self):
+        node = self.create_node()
+        genesis = node.blockchain.get_chain()
+        local = self.chain_from(genesis, [vote("v1")])
+        other = self.chain_from(genesis, [vote("v2")])
+        node.blockchain.validate_and_add_block(local[1])
+        # Forks of the same height converge on the head that wins the conflict, on every node
+        earlier, later = sorted([local, other], key=lambda chain: (chain[-1]["timestamp"], chain[-1]["miner"]))
+        self.assertEqual(node.blockchain.adopt_chain(other), other is earlier)
+        self.assertFalse(node.blockchain.adopt_chain(later))
+        self.assertEqual(node.blockchain.get_chain(), earlier)
+
+    def test_adopt_invalid_chain(self):
+        node = self.create_node()
+        genesis = node.blockchain.get_chain()
+        # Double vote in the new blocks
+        self.assertFalse(node.blockchain.adopt_chain(self.chain_from(genesis, [vote("v1")], [vote("v1", "12345")])))
+        # Another genesis block
+        other = self.chain_from([dict(genesis[0], hash="000" + "0" * 61)], [vote("v1")])
+        self.assertFalse(node.blockchain.adopt_chain(other))
+        self.assertEqual(node.blockchain.get_chain(), genesis)
+
+    def test_catch_up_missed_blocks(self):
+        node = self.create_node()
+        node.peers.add({"miner_id": "2", "address": "peer1"})
+        longer = self.chain_from(node.blockchain.get_chain(), [vote("v1")], [vote("v2")], [vote("v3")])
+        node.client = FakeClient(routes={"/tip": FakeResponse({"hash": longer[-1]["hash"], "height": 3}),
+                                         "/blockchain": FakeResponse(longer)})
+        # The block before was missed, so the block does not follow the head and the node catches up
+        node.validate_and_add_block(longer[-1])
+        self.assertEqual(node.blockchain.get_chain(), longer)
+        self.assertEqual(node.client.gets, [("peer1", "/tip"), ("peer1", "/blockchain")])
+        # Peers that are not ahead are only asked for their tip
+        self.assertFalse(node.catch_up())
+        self.assertEqual(node.client.gets[-1], ("peer1", "/tip"))
+
+    def test_no_genesis_after_losing_peers(self):
+        node = self.create_node(start=False, master="master:5000")
+        node.joined = True
+        node.get_current_blockchain()
+        self.assertTrue(node.blockchain.empty())
+        # The master starts the chain
+        master = self.create_node()
+        self.assertEqual(len(master.blockchain.get_chain()), 1)
+
+    def test_bootstrap(self):
+        node = self.create_node(start=False, master="master:5000")
+        chain = [{"miner": "m", "hash": "000a", "prevHash": "", "height": 0, "nonce": 0, "timestamp": "0", "data": []},
+                 {"miner": "m", "hash": "000b", "prevHash": "000a", "height": 1, "nonce": 0, "timestamp": "1", "data": []}]
+        node.client = FakeClient(routes={"/list": FakeResponse([{"miner_id": "1", "address": "master:5000"}]),
+                                         "/tip": FakeResponse({"hash": "000b", "height": 1}),
+                                         "/blockchain": FakeResponse(chain),
+                                         "/elections": FakeResponse([], 404)})
+        self.assertFalse(node.ready.is_set())
+        node.start(background=False)
+        self.assertTrue(node.ready.is_set())
+        self.assertEqual(node.get_tip(), {"hash": "000b", "height": 1})
+        self.assertEqual(node.blockchain.get_chain(), chain)
+        # The node advertised itself to the master
+        self.assertEqual([post[0:2] for post in node.client.posts], [("master:5000", "/advertise")])
+        self.assertEqual(sorted(peer["address"] for peer in node.participant_list), ["localhost:5999", "master:5000"])
+
+if __name__ == "__main__":
+    unittest.main()
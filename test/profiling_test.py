@@ -0,0 +1,40 @@
+import unittest
+import sys
+import time
+import pstats
+import threading
+sys.path.append("../")
+
+from app.profiling import SamplingProfiler, RequestProfiler
+
+def busy(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+class ProfilingTest(unittest.TestCase):
+    def test_sampling(self):
+        stop = threading.Event()
+        threading.Thread(target=busy, args=(stop,), name="busy").start()
+        profiler = SamplingProfiler()
+        self.assertTrue(profiler.start(0.001))
+        self.assertFalse(profiler.start())
+        time.sleep(0.1)
+        self.assertTrue(profiler.stop())
+        stop.set()
+        lines = profiler.get_folded().splitlines()
+        self.assertTrue(any(line.startswith("busy;") and "busy (profiling_test.py" in line for line in lines))
+        self.assertFalse(any(line.startswith("profiler;") for line in lines))
+
+    def test_request(self):
+        profiler = RequestProfiler()
+        self.assertIsNone(profiler.begin("/blockchain"))
+        profiler.arm("/blockchain")
+        profile = profiler.begin("/blockchain")
+        sum(range(1000))
+        profiler.end(profile)
+        # Only the next request is profiled
+        self.assertIsNone(profiler.begin("/blockchain"))
+        self.assertGreater(pstats.Stats(profiler.result).total_calls, 0)
+
+if __name__ == "__main__":
+    unittest.main()
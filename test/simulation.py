@@ -0,0 +1,267 @@
+"""
+In-process simulation of a network of nodes, used to measure throughput and propagation.
+
+Every node is a complete PeerToPeer + Blockchain, but requests between them go through a simulated
+transport with configurable latency and loss instead of HTTP, so everything runs offline in a single process.
+Signed votes are injected in random nodes at the given rate and, at the end, the simulation reports
+committed votes per second, commit latency, block propagation time, fork rate and bytes transferred.
+
+Usage: python simulation.py --nodes 10 --duration 20 --rate 20 (see --help for all the options)
+"""
+import sys
+import os
+import gzip
+import json
+import time
+import random
+import logging
+import argparse
+import tempfile
+sys.path.append("../")
+
+from datetime import timedelta
+from threading import Lock, Thread
+from Crypto.PublicKey import RSA
+
+from app.models_solution.peertopeer import PeerToPeer, TTL_HEADER
+from app.models_solution.peerclient import PeerClient
+from app.models_solution.transaction import Transaction, transaction_hash
+from app.wire import ACCEPT_HEADER
+
+class SimulatedResponse():
+    """
+    Minimal stand-in for requests.Response
+    """
+    def __init__(self, status_code, content, elapsed, etag=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = {ACCEPT_HEADER: "gzip"}
+        if etag is not None:
+            self.headers["ETag"] = '"{}"'.format(etag)
+        self.elapsed = timedelta(seconds=elapsed)
+
+    def json(self):
+        return json.loads(self.content)
+
+class SimulatedNetwork():
+    """
+    Transport between the simulated nodes: delivers requests to the node methods the views would call,
+    after the latency, dropping a fraction "loss" of them, and counts requests and bytes
+    """
+    def __init__(self, latency=0.02, jitter=0.01, loss=0.0, compress=False):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.compress = compress
+        self.nodes = {}
+        self.lock = Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def count(self, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+
+    def deliver(self, method, address, path, body, headers):
+        """
+        Deliver request to the node, return (status code, response body, ETag) or None if it was lost
+        """
+        time.sleep(max(0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        node = self.nodes.get(address)
+        if node is None or random.random() < self.loss:
+            return None
+        if headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        data = json.loads(body) if body else None
+        ttl = int(headers[TTL_HEADER]) if TTL_HEADER in headers else None
+        if method == "GET" and path in ("/list", "/blockchain"):
+            chain = node.blockchain.get_chain()
+            etag = node.peers.get_etag() if path == "/list" else node.blockchain.get_etag(chain)
+            if headers.get("If-None-Match") == '"{}"'.format(etag):
+                self.count(0)
+                return 304, b"", etag
+            status, result = 200, node.participant_list if path == "/list" else chain
+        else:
+            etag = None
+            status, result = self.route(node, method, path, data, ttl)
+        content = json.dumps(result).encode()
+        self.count(len(body or b"") + len(gzip.compress(content) if self.compress else content))
+        return status, content, etag
+
+    def route(self, node, method, path, data, ttl):
+        """
+        Call the node like the views do for the path
+        """
+        ok = {"status": "ok"}
+        busy = (503, {"status": "busy"})
+        if method == "GET":
+            routes = {"/ping": ok, "/tip": node.get_tip()}
+            if path in routes:
+                return 200, routes[path]
+        elif path == "/advertise":
+            node.add_participant_to_list(data)
+            return 200, ok
+        elif path == "/update_pool":
+            return (200, ok) if node.receive_transactions(data, ttl) else busy
+        elif path == "/add_new_block":
+            return (200, ok) if node.receive_block(data, ttl) else busy
+        elif path == "/inventory":
+            node.receive_inventory(data, ttl)
+            return 200, ok
+        elif path == "/compact_block":
+            node.receive_compact_block(data, ttl)
+            return 200, ok
+        elif path == "/get_data":
+            return 200, node.get_data(data)
+        elif path == "/get_block_transactions":
+            return 200, node.get_block_transactions(data)
+        return 404, {"status": "not found"}
+
+class SimulatedClient(PeerClient):
+    """
+    PeerClient that sends requests through the simulated network
+    """
+    def __init__(self, network, listener=None):
+        PeerClient.__init__(self, listener=listener)
+        self.network = network
+
+    def request(self, method, address, path, **kwargs):
+        start = time.perf_counter()
+        result = self.network.deliver(method, address, path, kwargs.get("data"), kwargs.get("headers") or {})
+        self.latency[address] = time.perf_counter() - start
+        if self.listener is not None:
+            self.listener(address, self.latency[address], result is not None)
+        if result is None:
+            return None
+        if self.network.compress:
+            self.gzip_peers.add(address)
+        return SimulatedResponse(result[0], result[1], self.latency[address], result[2])
+
+class Recorder():
+    """
+    Record when each node accepted each block
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.accepted = {}
+        self.transactions = {}
+
+    def listener(self, address):
+        def record(event, block):
+            if event == "block":
+                now = time.time()
+                with self.lock:
+                    self.accepted.setdefault(block["hash"], {}).setdefault(address, now)
+                    self.transactions.setdefault(block["hash"], [transaction_hash(t) for t in block["data"]])
+        return record
+
+def percentile(values, p):
+    if len(values) == 0:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def create_votes(count, keys=8):
+    """
+    Create "count" signed votes from distinct voters. Voters share a few keys since generating
+    a key per voter is slow and the validation only checks the signature against the key sent
+    """
+    voter_keys = [RSA.generate(1024) for _ in range(keys)]
+    candidates = ["12345", "5678", "9999"]
+    return [Transaction("voter-{}".format(i), random.choice(candidates)).get_signed_json(voter_keys[i % keys])
+            for i in range(count)]
+
+def simulate(args):
+    network = SimulatedNetwork(args.latency, args.jitter, args.loss, args.gzip)
+    recorder = Recorder()
+    data_dir = tempfile.mkdtemp()
+    nodes = []
+    print("Starting {} nodes".format(args.nodes))
+    for i in range(args.nodes):
+        node_dir = os.path.join(data_dir, str(i))
+        os.mkdir(node_dir)
+        node = PeerToPeer("node{}".format(i), gossip_fanout=args.fanout, gossip_ttl=args.ttl, relay_mode=args.relay,
+                          batch_window=args.batch_window, master="node0", data_dir=node_dir, peer_probe_interval=3600)
+        node.client = SimulatedClient(network, listener=node.peers.record)
+        node.blockchain.add_listener(recorder.listener(node.address))
+        network.nodes[node.address] = node
+        node.start(background=False)
+        nodes.append(node)
+
+    votes = create_votes(int(args.rate * args.duration))
+    injected = {}
+    network.requests = 0
+    network.bytes = 0
+    print("Injecting {} votes in {}s".format(len(votes), args.duration))
+    start = time.time()
+    for i, vote in enumerate(votes):
+        delay = start + i / args.rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        injected[transaction_hash(vote)] = time.time()
+        random.choice(nodes).submit_transaction(vote)
+
+    # Wait until the votes are committed and every node has the same tip
+    deadline = time.time() + args.settle
+    while time.time() < deadline:
+        tips = set(node.get_tip()["hash"] for node in nodes)
+        if len(tips) == 1 and all(len(node.blockchain.transaction_pool) == 0 for node in nodes):
+            break
+        time.sleep(0.5)
+
+    report(args, nodes, network, recorder, injected, start)
+    for node in nodes:
+        node.stop()
+
+def report(args, nodes, network, recorder, injected, start):
+    chain = nodes[0].blockchain.get_chain()
+    final = set(block["hash"] for block in chain[1:])
+    committed = {}
+    for block in chain[1:]:
+        accepted = recorder.accepted.get(block["hash"], {}).get(nodes[0].address)
+        for t_hash in recorder.transactions.get(block["hash"], []):
+            if t_hash in injected and accepted is not None:
+                committed[t_hash] = accepted
+    propagation = []
+    for block_hash in final:
+        times = recorder.accepted.get(block_hash, {})
+        if len(times) > 0:
+            first = min(times.values())
+            propagation.extend(t - first for t in times.values() if t != first)
+    mined = len(recorder.accepted)
+    elapsed = (max(committed.values()) - start) if len(committed) > 0 else float("nan")
+    latency = [committed[t] - injected[t] for t in committed]
+
+    print("")
+    print("Nodes: {}  latency: {}s  loss: {:.1%}  relay: {}  fanout: {}".format(
+        args.nodes, args.latency, args.loss, args.relay, args.fanout or "all"))
+    print("Votes committed:       {} of {}".format(len(committed), len(injected)))
+    print("Throughput:            {:.1f} votes/s".format(len(committed) / elapsed))
+    print("Commit latency:        p50 {:.3f}s  p99 {:.3f}s".format(percentile(latency, 50), percentile(latency, 99)))
+    print("Block propagation:     p50 {:.3f}s  p99 {:.3f}s".format(percentile(propagation, 50), percentile(propagation, 99)))
+    print("Fork rate:             {:.1%} ({} stale of {} blocks)".format(
+        (mined - len(final)) / mined if mined > 0 else 0, mined - len(final), mined))
+    print("Requests:              {}".format(network.requests))
+    print("Bytes transferred:     {} ({:.0f} per committed vote)".format(network.bytes, network.bytes / max(1, len(committed))))
+    print("Nodes in consensus:    {} of {}".format(sum(1 for node in nodes if node.get_tip() == nodes[0].get_tip()), len(nodes)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a network of nodes in a single process")
+    parser.add_argument("--nodes", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=20, help="seconds injecting votes")
+    parser.add_argument("--rate", type=float, default=20, help="votes injected per second")
+    parser.add_argument("--settle", type=float, default=30, help="maximum seconds waiting for consensus at the end")
+    parser.add_argument("--latency", type=float, default=0.02, help="request round trip time in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01, help="maximum random variation of the latency")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of requests lost")
+    parser.add_argument("--relay", default="push", choices=["push", "announce", "compact"])
+    parser.add_argument("--fanout", type=int, default=None, help="gossip fanout, full mesh when not set")
+    parser.add_argument("--ttl", type=int, default=6, help="gossip TTL")
+    parser.add_argument("--batch-window", type=float, default=0, help="transaction batching window in seconds")
+    parser.add_argument("--gzip", action="store_true", help="count bytes with gzip compression")
+    parser.add_argument("--verbose", action="store_true", help="show node logs")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.getLogger("blockchain_logger").setLevel(logging.CRITICAL)
+    simulate(args)
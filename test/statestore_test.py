@@ -0,0 +1,81 @@
+import unittest
+import sys
+import os
+import tempfile
+sys.path.append("../")
+
+from app.models_solution.blockchain import Blockchain
+from app.models_solution.peermanager import PeerManager
+from app.models_solution.statestore import StateStore, StateWriter, ReadOnlyNode
+
+class Node():
+    """
+    Writer side of the state, with the attributes of PeerToPeer that are stored
+    """
+    def __init__(self):
+        self.blockchain = Blockchain()
+        self.peers = PeerManager()
+        self.valid_addresses = [{"name": "Candidate 1", "address": "12345"}]
+
+    @property
+    def participant_list(self):
+        return self.peers.get_list()
+
+def block(height, block_hash, votes=()):
+    return {"height": height, "hash": block_hash, "data": [{"addr_from": v, "addr_to": "12345"} for v in votes]}
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        path = os.path.join(tempfile.mkdtemp(), "state.db")
+        self.node = Node()
+        self.writer = StateWriter(StateStore(path), self.node)
+        self.reader = ReadOnlyNode(StateStore(path))
+        self.events = []
+        self.reader.blockchain.add_listener(lambda event, data: self.events.append((event, data)))
+
+    def sync(self):
+        self.writer.write()
+        self.reader.refresh()
+
+    def test_new_blocks(self):
+        self.node.blockchain.storage = [block(0, "a"), block(1, "b", ["v1"])]
+        self.node.peers.add({"miner_id": "m", "address": "localhost:5001"})
+        self.sync()
+        self.assertEqual(self.reader.blockchain.get_chain(), self.node.blockchain.get_chain())
+        self.assertEqual(self.reader.participant_list, self.node.participant_list)
+        self.node.blockchain.storage = self.node.blockchain.storage + [block(2, "c", ["v2"])]
+        self.sync()
+        self.assertEqual(self.reader.get_tip(), {"hash": "c", "height": 2})
+        self.assertEqual(self.events[-1], ("block", block(2, "c", ["v2"])))
+
+    def test_replaced_head(self):
+        self.node.blockchain.storage = [block(0, "a"), block(1, "b")]
+        self.sync()
+        self.node.blockchain.storage = [block(0, "a"), block(1, "x")]
+        self.sync()
+        self.assertEqual(self.reader.blockchain.get_chain(), self.node.blockchain.get_chain())
+        self.assertEqual(self.reader.blockchain.get_etag(), "x")
+
+    def test_pool(self):
+        transaction = {"addr_from": "v1", "addr_to": "12345", "signature": "s"}
+        self.node.blockchain.transaction_pool = [transaction]
+        self.sync()
+        self.assertEqual(self.reader.blockchain.transaction_pool, [transaction])
+        self.assertEqual(self.events, [("transaction", transaction)])
+
+    def test_pruned_chain(self):
+        self.node.blockchain = Blockchain(prune_depth=2)
+        with self.assertRaises(ValueError):
+            StateWriter(self.writer.store, self.node)
+
+    def test_pool_after_writer_restart(self):
+        self.node.blockchain.transaction_pool = [{"addr_from": "v1", "addr_to": "12345", "signature": "s1"}]
+        self.sync()
+        # A new writer writes its first pool, the reader must not take it for the one it has
+        self.writer = StateWriter(self.writer.store, self.node)
+        self.node.blockchain.transaction_pool = [{"addr_from": "v2", "addr_to": "12345", "signature": "s2"}]
+        self.sync()
+        self.assertEqual(self.reader.blockchain.transaction_pool, self.node.blockchain.transaction_pool)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from app import tracing
+from app.models_solution.ingestion import IngestionQueue
+
+class TracingTest(unittest.TestCase):
+    def setUp(self):
+        tracing.RECENT.clear()
+
+    def test_spans(self):
+        with tracing.trace("request", sampled=True) as trace:
+            with tracing.span("outer"):
+                with tracing.span("inner"):
+                    pass
+        self.assertEqual([(s["name"], s["depth"]) for s in trace.spans], [("inner", 1), ("outer", 0)])
+        self.assertEqual(tracing.recent()[0]["id"], trace.id)
+        self.assertIsNone(tracing.current())
+
+    def test_not_sampled(self):
+        with tracing.trace("request", sampled=False) as trace:
+            with tracing.span("stage"):
+                pass
+        self.assertIsNone(trace)
+        self.assertEqual(tracing.recent(), [])
+
+    def test_queue_keeps_parent(self):
+        queue = IngestionQueue(lambda block: None, lambda t: None, workers=1)
+        with tracing.trace("POST /add_new_block", sampled=True) as trace:
+            queue.add_block({"hash": "a"})
+        queue.join()
+        children = [t for t in tracing.recent() if t["parent_id"] == trace.id]
+        self.assertEqual(len(children), 1)
+        self.assertEqual(children[0]["spans"][0]["name"], "queue_wait")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,23 @@
 #!/bin/bash
 python transaction_test.py
 python block_test.py
-python blockchain_test.py
\ No newline at end of file
+python blockchain_test.py
+python ingestion_test.py
+python peermanager_test.py
+python batcher_test.py
+python metrics_test.py
+python tracing_test.py
+python logs_test.py
+python events_test.py
+python statestore_test.py
+python voteindex_test.py
+python profiling_test.py
+python blockschedule_test.py
+python blockhash_test.py
+python chaincache_test.py
+python election_test.py
+python chaincommit_test.py
+python peerclient_test.py
+python peertopeer_test.py
+python wire_test.py
+python views_test.py
\ No newline at end of file
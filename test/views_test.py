@@ -0,0 +1,91 @@
+import gzip
+import json
+import unittest
+import sys
+sys.path.append("../")
+
+from unittest import mock
+
+# Importing the app starts a node with the default settings, alone in the network
+from app import app
+from app import settings
+from app.views import network
+
+class ViewsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        network.ready.wait(30)
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_ready(self):
+        self.assertEqual(self.client.get("/ready").json, {"ready": True})
+        network.ready.clear()
+        try:
+            r = self.client.get("/ready")
+            self.assertEqual((r.status_code, r.json), (503, {"ready": False}))
+        finally:
+            network.ready.set()
+
+    def test_tip(self):
+        tip = self.client.get("/tip").json
+        self.assertEqual(tip, network.get_tip())
+        self.assertEqual(tip["hash"], network.blockchain.get_chain()[-1]["hash"])
+
+    def test_conditional_get(self):
+        for path in ["/blockchain", "/list"]:
+            r = self.client.get(path)
+            self.assertEqual(r.status_code, 200)
+            etag = r.headers["ETag"]
+            r = self.client.get(path, headers={"If-None-Match": etag})
+            self.assertEqual((r.status_code, r.data, r.headers["ETag"]), (304, b"", etag))
+            self.assertEqual(self.client.get(path, headers={"If-None-Match": '"other"'}).status_code, 200)
+
+    def test_gzip_blockchain(self):
+        etag = network.blockchain.get_etag()
+        r = self.client.get("/blockchain", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual((r.status_code, r.headers["Content-Encoding"]), (200, "gzip"))
+        self.assertEqual(r.headers["ETag"], '"{}-gzip"'.format(etag))
+        self.assertEqual(json.loads(gzip.decompress(r.data)), json.loads(network.blockchain.get_chain_json()))
+        # The body is compressed once for the chain
+        self.assertIs(network.blockchain.get_chain_gzip(), network.blockchain.get_chain_gzip())
+        for tag in [etag, etag + "-gzip"]:
+            r = self.client.get("/blockchain", headers={"Accept-Encoding": "gzip", "If-None-Match": '"{}"'.format(tag)})
+            self.assertEqual(r.status_code, 304)
+        r = self.client.get("/blockchain", headers={"If-None-Match": '"{}-gzip"'.format(etag)})
+        self.assertEqual((r.status_code, r.headers["ETag"]), (200, '"{}"'.format(etag)))
+        self.assertNotIn("Content-Encoding", r.headers)
+
+    def test_create_election(self):
+        election = {"id": "views-test", "candidates": [{"name": "Candidate A", "address": "views-a"}]}
+        # The admin endpoints are disabled without token
+        self.assertEqual(self.client.post("/elections", json=election).status_code, 404)
+        with mock.patch.object(settings, "ADMIN_TOKEN", "secret"):
+            self.assertEqual(self.client.post("/elections", json=election).status_code, 401)
+            headers = {"Authorization": "Bearer secret"}
+            self.assertEqual(self.client.post("/elections", json=election, headers=headers).status_code, 201)
+            self.assertEqual(self.client.post("/elections", json=election, headers=headers).status_code, 409)
+            # Candidates of another election
+            other = {"id": "views-other", "candidates": [{"name": "Candidate A", "address": "views-a"}]}
+            r = self.client.post("/elections", json=other, headers=headers)
+            self.assertEqual((r.status_code, r.json), (409, {"status": "candidate of another election"}))
+        self.assertIn("views-test", [info["id"] for info in self.client.get("/elections").json])
+
+    def test_announce_election_unknown_peer(self):
+        election = {"id": "views-announced", "candidates": [{"name": "Candidate A", "address": "views-b"}],
+                    "address": "unknown:5000"}
+        self.assertEqual(self.client.post("/announce_election", json=election).status_code, 403)
+        self.assertIsNone(network.get_election("views-announced"))
+
+    def test_profile_interval(self):
+        headers = {"Authorization": "Bearer secret"}
+        with mock.patch.object(settings, "ADMIN_TOKEN", "secret"):
+            for interval in ["0", "-1", "nan", "inf"]:
+                r = self.client.post("/admin/profile/start?interval=" + interval, headers=headers)
+                self.assertEqual(r.status_code, 400)
+            self.assertEqual(self.client.post("/admin/profile/start?interval=0.01", headers=headers).status_code, 200)
+            self.assertEqual(self.client.post("/admin/profile/stop", headers=headers).status_code, 200)
+
+if __name__ == "__main__":
+    unittest.main()
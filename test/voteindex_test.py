@@ -0,0 +1,59 @@
+import unittest
+import sys
+sys.path.append("../")
+
+from app.models_solution.voteindex import VoteIndex
+from app.models_solution.blockchain import Blockchain
+
+def block(height, block_hash, votes=()):
+    return {"height": height, "hash": block_hash, "prevHash": "", "miner": "m", "nonce": 0, "timestamp": "0",
+            "data": [{"addr_from": voter, "addr_to": candidate} for voter, candidate in votes]}
+
+class VoteIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.chain = [block(0, "a"), block(1, "b", [("v1", "c1"), ("v2", "c2")])]
+        self.index = VoteIndex()
+        self.index.update(self.chain)
+
+    def test_append(self):
+        self.index.update(self.chain + [block(2, "c", [("v3", "c1")])])
+        self.assertEqual(self.index.get_votes("c1"), (2, [{"addr_from": "v1", "height": 1}, {"addr_from": "v3", "height": 2}]))
+        self.assertEqual(self.index.get_votes("c1", offset=1, limit=1), (2, [{"addr_from": "v3", "height": 2}]))
+        self.assertEqual(self.index.get_vote("v3")["hash"], "c")
+
+    def test_replaced_head(self):
+        self.index.update(self.chain[:-1] + [block(1, "x", [("v2", "c1")])])
+        self.assertEqual(self.index.get_votes("c2"), (0, []))
+        self.assertEqual(self.index.get_votes("c1"), (1, [{"addr_from": "v2", "height": 1}]))
+        self.assertIsNone(self.index.get_vote("v1"))
+        self.assertEqual(self.index.get_vote("v2")["hash"], "x")
+
+    def test_double_spending(self):
+        blockchain = Blockchain()
+        blockchain.setup_new_chain(self.chain)
+        chain = blockchain.get_chain()
+        self.assertTrue(blockchain.check_double_spending("v1"))
+        self.assertFalse(blockchain.check_double_spending("v3"))
+        # Prefixes of the chain use the index too, other chains are scanned
+        self.assertFalse(blockchain.check_double_spending("v1", chain[:-1]))
+        self.assertTrue(blockchain.check_double_spending("v1", [block(0, "a"), block(1, "y", [("v1", "c2")])]))
+
+    def test_pruning(self):
+        blockchain = Blockchain(prune_depth=2)
+        blockchain.setup_new_chain(self.chain + [block(2, "c", [("v3", "c1")]), block(3, "d", [("v4", "c2")])])
+        chain = blockchain.get_chain()
+        self.assertEqual([b.get("pruned", False) for b in chain], [True, True, False, False])
+        self.assertEqual(chain[1]["data"], [])
+        self.assertIsNone(blockchain.get_block("b"))
+        self.assertEqual(blockchain.votes.get_votes("c1")[0], 2)
+        self.assertEqual(blockchain.votes.get_vote("v1")["transaction"], {"addr_from": "v1", "addr_to": "c1"})
+        self.assertTrue(blockchain.check_double_spending("v1"))
+        # Chains that are not indexed, e.g. with a new head, still see the pruned votes
+        self.assertTrue(blockchain.check_double_spending("v1", chain[:-1] + [block(3, "e")]))
+        # A new chain from a full node is indexed again
+        blockchain.setup_new_chain(self.chain[:-1] + [block(1, "x", [("v5", "c1")])])
+        self.assertEqual(blockchain.votes.get_votes("c1"), (1, [{"addr_from": "v5", "height": 1}]))
+        self.assertIsNone(blockchain.votes.get_vote("v1"))
+
+if __name__ == "__main__":
+    unittest.main()
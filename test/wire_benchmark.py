@@ -0,0 +1,67 @@
+"""
+Benchmark of the wire encodings used between peers: size of a full chain and of a single block,
+and the time to serialize and deserialize them with plain JSON and gzip compressed JSON.
+
+Usage: python wire_benchmark.py [blocks] [transactions per block] [distinct voter keys]
+"""
+import sys
+import time
+import gzip
+import json
+sys.path.append("../")
+
+from Crypto.PublicKey import RSA
+
+from app.models_solution.block import Block
+from app.models_solution.transaction import Transaction
+from app.wire import encode_json
+
+def build_chain(blocks, transactions, keys):
+    """
+    Build a chain of signed votes, without mining, just to have realistic data
+    """
+    voter_keys = [RSA.generate(1024) for _ in range(keys)]
+    chain = []
+    prevHash = "Genesis Block"
+    voter = 0
+    for height in range(blocks):
+        data = []
+        for _ in range(transactions):
+            t = Transaction(str(voter), "12345")
+            data.append(t.get_signed_json(voter_keys[voter % keys]))
+            voter += 1
+        block = Block(prevHash, height, data, "1234")
+        block.block["hash"] = "000" + str(height)
+        block.block["timestamp"] = str(time.time())
+        prevHash = block.block["hash"]
+        chain.append(block.get_json())
+    return chain
+
+def measure(function, repeat=20):
+    """
+    Return the average time in milliseconds of the function call
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+def benchmark(name, data):
+    plain, _ = encode_json(data)
+    print("{}:".format(name))
+    print("  {:<10} {:>10} bytes  encode {:8.3f} ms  decode {:8.3f} ms".format(
+        "json", len(plain), measure(lambda: encode_json(data)), measure(lambda: json.loads(plain))))
+    for level in (1, 6, 9):
+        compressed = gzip.compress(plain, level)
+        encode = measure(lambda: gzip.compress(json.dumps(data, separators=(",", ":")).encode(), level))
+        decode = measure(lambda: json.loads(gzip.decompress(compressed)))
+        print("  {:<10} {:>10} bytes  encode {:8.3f} ms  decode {:8.3f} ms  ratio {:.1f}x".format(
+            "gzip-{}".format(level), len(compressed), encode, decode, len(plain) / len(compressed)))
+
+if __name__ == "__main__":
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    transactions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    keys = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    chain = build_chain(blocks, transactions, keys)
+    benchmark("Full chain ({} blocks)".format(blocks), chain)
+    benchmark("Single block ({} transactions)".format(transactions), chain[-1])
@@ -0,0 +1,35 @@
+import gzip
+import unittest
+import sys
+sys.path.append("../")
+
+from io import BytesIO
+
+from app.wire import GzipRequestMiddleware, gunzip
+
+def echo(environ, start_response):
+    start_response("200 OK", [])
+    return [environ["wsgi.input"].read(int(environ["CONTENT_LENGTH"]))]
+
+class GzipRequestMiddlewareTest(unittest.TestCase):
+    def call(self, body, max_size=1000):
+        statuses = []
+        environ = {"HTTP_CONTENT_ENCODING": "gzip", "CONTENT_LENGTH": str(len(body)), "wsgi.input": BytesIO(body)}
+        result = GzipRequestMiddleware(echo, max_size)(environ, lambda status, headers: statuses.append(status))
+        return statuses[0], b"".join(result)
+
+    def test_decompress(self):
+        self.assertEqual(self.call(gzip.compress(b'{"a": 1}')), ("200 OK", b'{"a": 1}'))
+
+    def test_too_large(self):
+        # Highly compressible, small once compressed
+        status, _ = self.call(gzip.compress(b"0" * 10000))
+        self.assertTrue(status.startswith("413"))
+        self.assertEqual(gunzip(gzip.compress(b"0" * 1000), 1000), b"0" * 1000)
+
+    def test_invalid(self):
+        self.assertTrue(self.call(b"not gzip")[0].startswith("400"))
+        self.assertTrue(self.call(gzip.compress(b"0" * 100)[0:-10])[0].startswith("400"))
+
+if __name__ == "__main__":
+    unittest.main()